@@ -1,100 +1,258 @@
-# main.py
+# app.py: веб-приложение CRM (Flask) — фабрика create_app() и маршруты
+#   flask --app app run          — dev-сервер (Flask сам найдёт create_app)
+#   python db.py                 — однократно: схема и default admin (при старте приложения не выполняется)
+# Импорт модуля ничего не делает с БД: движок создаётся при первом запросе к ней (db.get_engine),
+# модули отчётов, оплаты, уведомлений и импорта подгружаются в маршрутах, которым они нужны.
 
 from flask import (
     Flask, render_template, request, redirect, url_for,
-    session, make_response, flash
+    session, flash, Response, stream_with_context, g
 )
 import hashlib
-from datetime import datetime
-import io, csv
-
-from db import init_db, seed_admin, DbSessionManager, User, Order as OrderModel
-from order import (
-    ConcreteOrder, VolumeDiscount, VIPDiscount,
-    InsuranceDecorator, PriorityShippingDecorator
-)
-from payment import StripeAdapter, PayPalAdapter, StripeAPI, PayPalAPI
-from notification import OrderSubject, ClientObserver, ManagerObserver
-from reports import (
-    ReportBuilder,
-    FinancialReportFactory, AnalyticalReportFactory, LogisticsReportFactory
-)
-
-from users import ManagerFactory, ClientFactory, AdminFactory
-from sqlalchemy import func
+import os
+import threading
+from datetime import datetime, date
+
+from db import init_db, seed_admin, Base, DbSessionManager, User, Order as OrderModel
+from outbox import outbox_relay
+from session import SessionManager
+import identity
+import versions
+from metrics import metrics
+
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
 from flask import jsonify
 from db import log_audit
 from db import Audit
+from users import ROLE_ADMIN, ROLE_CLIENT, BULK_UPDATE_ROLES, normalize_role, role_values
+from pagination import keyset_page
+from sales import (
+    BUCKETS, sales_series, record_order_created, record_orders_bulk, invalidate_sales_cache
+)
 
 
-app = Flask(__name__)
-app.secret_key = 'change_this_secret'
-
-# Инициализация БД и создание default admin
-init_db()
-seed_admin()
+# Маршруты собираются декоратором route() и регистрируются в create_app() под теми же
+# именами endpoint, что и раньше с @app.route (url_for('orders') и т.д. не меняются)
+_routes = []
+
+def route(rule, **options):
+    def register(view):
+        _routes.append((rule, view, options))
+        return view
+    return register
+
+
+DEFAULT_CONFIG = {
+    'SECRET_KEY': 'change_this_secret',
+    # схема и default admin при старте — по старинке, только если явно попросили (CRM_INIT_DB=1)
+    'INIT_DB': os.environ.get('CRM_INIT_DB') == '1',
+    # фоновый релей outbox: в CLI и тестах можно выключить
+    'OUTBOX_RELAY': True,
+    'METRICS': True,
+    # входит в ETag: с новым выпуском меняются шаблоны, и старые ETag не должны совпасть
+    'ETAG_SALT': os.environ.get('CRM_RELEASE', ''),
+}
+
+
+def create_app(config=None):
+    """Фабрика приложения: config (dict) дополняет DEFAULT_CONFIG."""
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    app.config.update(config or {})
+
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    app.before_request(check_session)
+    app.cli.command('init-db', help='Схема по миграциям и default admin')(init_db_command)
+
+    if app.config['INIT_DB']:
+        init_db()
+        seed_admin()
+    if app.config['METRICS']:
+        # время маршрутов, SQL на запрос и гистограммы — GET /metrics (формат Prometheus);
+        # слушатель на классе Engine не заставляет создавать движок заранее
+        metrics.install(app)
+        metrics.instrument_engine(Engine)
+        metrics.instrument_models(Base)
+        metrics.register('crm_identity_cache_hits_total', 'Попадания в кэш пользователей',
+                         lambda: identity.identity_cache.hits, 'counter')
+        metrics.register('crm_identity_cache_misses_total', 'Промахи кэша пользователей',
+                         lambda: identity.identity_cache.misses, 'counter')
+        metrics.register('crm_sessions_active', 'Сессий в хранилище', lambda: len(sessions))
+    if app.config['OUTBOX_RELAY']:
+        # события смены статуса доставляются из outbox (см. outbox.py) наблюдателям диспетчера
+        outbox_relay.start(get_notifier())
+    return app
+
+
+def init_db_command():
+    init_db()
+    seed_admin()
+    print("База данных и таблицы созданы")
+
+
+_notifier_lock = threading.Lock()
+
+def get_notifier():
+    """Диспетчер уведомлений; наблюдатели регистрируются один раз, при первом обращении."""
+    from notification import ClientObserver, ManagerObserver, dispatcher
+    with _notifier_lock:
+        if not getattr(dispatcher, 'crm_observers', False):
+            dispatcher.register(ClientObserver())
+            dispatcher.register(ManagerObserver())
+            dispatcher.crm_observers = True
+    return dispatcher
+
+
+def __getattr__(name):
+    # from app import app (asgi.py, gunicorn app:app) — экземпляр по умолчанию создаётся при первом обращении
+    global app
+    if name == 'app':
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# учёт активных сессий: по умолчанию в БД (CRM_SESSION_BACKEND=sql) — общий для всех воркеров
+sessions = SessionManager()
+
+
+def current_user():
+    """Текущий пользователь (identity.Identity) или None — из кэша, один раз за запрос."""
+    if 'current_user' not in g:
+        user = identity.by_id(session.get('user_id'))
+        g.current_user = user if user is not None and user.is_active is not False else None
+    return g.current_user
+
+
+def session_valid(data):
+    """Подписанная cookie (data) ссылается на живую сессию этого пользователя в sessions."""
+    record = sessions.get(data.get('sid'))
+    if record is None:
+        # хранилище одного процесса (CRM_SESSION_BACKEND=memory) не знает сессий других воркеров
+        # и забывает все при рестарте — промах в нём не повод сбрасывать подписанную cookie
+        return not sessions.backend.shared
+    return record.user_key == str(data.get('user_id'))
+
+
+def check_session():
+    # before_request: logout, закрытие всех сессий пользователя, истёкший TTL или вытеснение
+    # из хранилища действуют сразу, а не когда истечёт сама cookie
+    if 'user_id' in session and not session_valid(session):
+        session.clear()
+        g.pop('current_user', None)
+
+
+def is_admin():
+    # роль берётся из кэша пользователей, а не из cookie: смена роли действует сразу
+    user = current_user()
+    return user is not None and normalize_role(user.role) == ROLE_ADMIN
 
 # утилита хеширования
 
-@app.route('/api/sales_data')
+@route('/api/sales_data')
+@versions.conditional('orders')
 def sales_data():
     # Только авторизованный
     if 'user_id' not in session:
         return jsonify([]), 401
 
-    # Группируем заказы по дате (день) и суммируем total
+    # Параметры: from/to (YYYY-MM-DD) и bucket (day/week/month)
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        return jsonify({'error': 'bucket должен быть day, week или month'}), 400
+    try:
+        date_from = date.fromisoformat(request.args['from']) if request.args.get('from') else None
+        date_to = date.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({'error': 'Даты ожидаются в формате YYYY-MM-DD'}), 400
+
+    # Суммы по периодам берём из rollup daily_sales (с кэшем), а не из полного скана orders
     with DbSessionManager() as db:
-        rows = (
-            db.query(
-                func.date(OrderModel.created_at).label('date'),
-                func.sum(OrderModel.total).label('sum')
-            )
-            .group_by(func.date(OrderModel.created_at))
-            .order_by(func.date(OrderModel.created_at))
-            .all()
-        )
-
-    # Преобразуем в списки
-    data = {
-        'labels': [row.date.strftime('%Y-%m-%d') for row in rows],
-        'totals': [float(row.sum) for row in rows]
-    }
+        data = sales_series(db, date_from, date_to, bucket)
     return jsonify(data)
 
 
-@app.route('/update_status/<int:order_id>', methods=['POST'])
+@route('/update_status/<int:order_id>', methods=['POST'])
 def update_status(order_id):
     # Только авторизованный пользователь
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
+    # тот же путь, что и у массовой смены: rollup, outbox и аудит одной транзакцией; машина состояний —
+    # только для массовой смены, вручную один заказ можно перевести в любой статус (например, вернуть из «Завершен»)
+    from transitions import change_status
     new_status = request.form.get('status')
-    if new_status not in ('Создан', 'В обработке', 'Отправлен', 'Завершен'):
+    try:
+        result = change_status([order_id], new_status, performed_by=session['user_id'], enforce=False)
+    except ValueError:
         flash('Недопустимый статус', 'danger')
         return redirect(url_for('orders'))
+    if result.rejected:
+        flash(f'Заказ {order_id}: {result.rejected[0].reason}', 'danger')
+    else:
+        flash(f'Статус заказа {order_id} обновлён на «{new_status}»', 'success')
+    return redirect(url_for('orders'))
 
-    # Обновляем в БД
-    with DbSessionManager() as db:
-        order = db.query(OrderModel).get(order_id)
-        if not order:
-            flash('Заказ не найден', 'danger')
-            return redirect(url_for('orders'))
-        order.status = new_status
-        db.commit()
-        log_audit('Order', order_id, 'status_change', detail=new_status, performed_by=session['user_id'])
-    # Observer: уведомляем о новой верси статуса
-    subj = OrderSubject()
-    subj.attach(ClientObserver())
-    subj.attach(ManagerObserver())
-    subj.update_status(new_status)
-
-    flash(f'Статус заказа {order_id} обновлён на «{new_status}»', 'success')
+
+def _can_bulk_update():
+    user = current_user()
+    return user is not None and normalize_role(user.role) in BULK_UPDATE_ROLES
+
+
+def _bulk_status_change(order_ids, new_status, from_status):
+    from transitions import change_status, parse_ids
+    return change_status(parse_ids(order_ids), new_status, from_status or None,
+                         performed_by=session['user_id'])
+
+
+@route('/orders/bulk_status', methods=['POST'])
+def bulk_status():
+    # форма: order_ids (несколько полей или "12, 15 18"), status, from_status (необязательно)
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    if not _can_bulk_update():
+        return "Доступ запрещён", 403
+    try:
+        result = _bulk_status_change(request.form.getlist('order_ids'), request.form.get('status'),
+                                     request.form.get('from_status'))
+    except ValueError as exc:
+        flash(str(exc), 'danger')
+        return redirect(url_for('orders'))
+    if result.moved:
+        flash(f'В статус «{result.status}» переведено заказов: {len(result.moved)}', 'success')
+    if result.rejected:
+        flash('Не переведены: ' + '; '.join(f'{r.id} — {r.reason}' for r in result.rejected[:20])
+              + (f' и ещё {len(result.rejected) - 20}' if len(result.rejected) > 20 else ''), 'warning')
     return redirect(url_for('orders'))
 
 
-@app.route('/admin/create_user', methods=['GET','POST'])
+@route('/api/orders/bulk_status', methods=['POST'])
+def api_bulk_status():
+    # JSON: {"order_ids": [...], "status": "Отправлен", "from_status": "В обработке"}
+    if 'user_id' not in session:
+        return jsonify({'error': 'Требуется вход'}), 401
+    if not _can_bulk_update():
+        return jsonify({'error': 'Доступ запрещён'}), 403
+    payload = request.get_json(silent=True) or {}
+    order_ids = payload.get('order_ids')
+    if not isinstance(order_ids, list):
+        return jsonify({'error': 'order_ids — список id заказов'}), 400
+    try:
+        result = _bulk_status_change(order_ids, payload.get('status'), payload.get('from_status'))
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    return jsonify({
+        'status': result.status,
+        'moved': result.moved,
+        'rejected': [r._asdict() for r in result.rejected],
+    })
+
+
+@route('/admin/create_user', methods=['GET','POST'])
 def admin_create_user():
-    if 'user_id' not in session or session.get('user_role')!='admin':
+    if not is_admin():
         return redirect(url_for('login'))
 
     error = None
@@ -104,10 +262,11 @@ def admin_create_user():
         pw    = request.form['password']
         role  = request.form['role']
 
-        with DbSessionManager() as db:
-            if db.query(User).filter_by(email=email).first():
-                error = 'Email уже занят'
-            else:
+        if identity.by_email(email):
+            error = 'Email уже занят'
+        else:
+            from users import ManagerFactory, ClientFactory, AdminFactory
+            with DbSessionManager() as db:
                 # 1) создаём «бизнес‑объект» через Factory Method
                 if role=='manager':
                     biz = ManagerFactory().create_user(name, email)
@@ -121,12 +280,11 @@ def admin_create_user():
                     name=biz.name,
                     email=biz.email,
                     hashed_password=hash_password(pw),
-                    role=biz.role()
+                    role=biz.code
                 )
                 db.add(orm_user)
                 db.commit()
-                from db import log_audit
-                log_audit('User', orm_user.id, 'create', detail=f"role={orm_user.role()}",
+                log_audit('User', orm_user.id, 'create', detail=f"role={orm_user.role}",
                           performed_by=session['user_id'])
 
                 return redirect(url_for('admin_panel'))
@@ -138,48 +296,49 @@ def hash_password(pw):
     return hashlib.sha256(pw.encode()).hexdigest()
 
 # --- Маршруты ---
-@app.route('/')
+@route('/')
 def home():
     if 'user_id' in session:
         return redirect(url_for('dashboard'))
     return redirect(url_for('login'))
 
-@app.route('/register', methods=['GET','POST'])
+@route('/register', methods=['GET','POST'])
 def register():
     if request.method == 'POST':
         name = request.form['name']
         email = request.form['email']
         pw = request.form['password']
+        if identity.by_email(email):
+            return render_template('register.html', error='Email занят')
         with DbSessionManager() as db:
-            if db.query(User).filter_by(email=email).first():
-                return render_template('register.html', error='Email занят')
-            user = User(name=name, email=email, hashed_password=hash_password(pw), role='client')
+            user = User(name=name, email=email, hashed_password=hash_password(pw), role=ROLE_CLIENT)
             db.add(user)
             db.commit()
             return redirect(url_for('login'))
     return render_template('register.html')
 
-@app.route('/login', methods=['GET','POST'])
+@route('/login', methods=['GET','POST'])
 def login():
     if request.method == 'POST':
         email = request.form['email']
         pw = request.form['password']
-        with DbSessionManager() as db:
-            user = db.query(User).filter_by(email=email).first()
-            if user and user.hashed_password == hash_password(pw):
-                session['user_id'] = user.id
-                session['user_role'] = user.role
-                return redirect(url_for('dashboard'))
+        user = identity.by_email(email)
+        if user and user.is_active is not False and user.hashed_password == hash_password(pw):
+            session['user_id'] = user.id
+            session['user_role'] = user.role
+            session['sid'] = sessions.login(user)
+            return redirect(url_for('dashboard'))
         return render_template('login.html', error='Неверные данные')
     return render_template('login.html')
 
-@app.route('/dashboard')
+@route('/dashboard')
 def dashboard():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     return render_template('dashboard.html')
 
-@app.route('/orders')
+@route('/orders')
+@versions.conditional('orders')
 def orders():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -187,36 +346,34 @@ def orders():
         orders = db.query(OrderModel).filter_by(user_id=session['user_id']).all()
     return render_template('orders.html', orders=orders)
 
-@app.route('/create_order', methods=['GET','POST'])
+@route('/create_order', methods=['GET','POST'])
 def create_order():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     if request.method == 'POST':
+        from order import DISCOUNT_STRATEGIES
+        from pipelines import ADDONS, compile_pipeline
+        from reports import invalidate_report_cache
         amt = int(request.form['amount'])
         strat = request.form['strategy']
-        order_obj = ConcreteOrder(items=[{'price': amt}], is_vip=False)
-        if strat == 'volume':
-            order_obj.set_discount_strategy(VolumeDiscount())
-        elif strat == 'vip':
-            order_obj.set_discount_strategy(VIPDiscount())
-        if request.form.get('insurance') == 'on':
-            order_obj = InsuranceDecorator(order_obj)
-        if request.form.get('priority') == 'on':
-            order_obj = PriorityShippingDecorator(order_obj)
-        total = order_obj.get_price()
+        # Strategy + Decorator, скомпилированные в один кэшируемый конвейер (pipelines.py)
+        addons = [name for name in ADDONS if request.form.get(name) == 'on']
+        pipeline = compile_pipeline(strat if strat in DISCOUNT_STRATEGIES else None, addons)
+        total = pipeline([{'price': amt}], is_vip=False).total
         with DbSessionManager() as db:
             rec = OrderModel(user_id=session['user_id'], total=total, created_at=datetime.now())
             db.add(rec)
+            db.flush()
+            day = record_order_created(db, rec)
             db.commit()
+            invalidate_sales_cache(day)
+            invalidate_report_cache(day)
             log_audit('Order', rec.id, 'create', detail=f"total={rec.total}", performed_by=session['user_id'])
         return redirect(url_for('orders'))
     return render_template('create_order.html')
 
-from reports import ReportBuilder, FinancialReportFactory, AnalyticalReportFactory, LogisticsReportFactory
-
-# … ваши прежние импорты и маршруты …
-
-@app.route('/reports', methods=['GET','POST'])
+@route('/reports', methods=['GET','POST'])
+@versions.conditional()     # GET — только форма: меняется лишь с выпуском; POST не кэшируется
 def reports():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -229,6 +386,9 @@ def reports():
     result = None
 
     if request.method == 'POST':
+        from reports import (
+            ReportBuilder, FinancialReportFactory, AnalyticalReportFactory, LogisticsReportFactory
+        )
         rtype = request.form['type']
         start = request.form['start_date']
         end   = request.form['end_date']
@@ -242,50 +402,50 @@ def reports():
         else:
             factory = LogisticsReportFactory()
 
-        # строим отчёт через Builder
-        builder = ReportBuilder(factory)
-        builder.set_date_range(start, end)
-        if filt:
-            builder.add_filter(filt)
+        # строим отчёт через Builder: период и фильтр (имя=значение) становятся условиями SQL
+        try:
+            builder = ReportBuilder(factory)
+            builder.set_date_range(start, end)
+            if filt:
+                builder.add_filter(filt)
 
-        summary  = builder.build_summary().content
-        detailed = builder.build_detailed().content
-        result = {'summary': summary, 'detailed': detailed}
+            summary  = builder.build_summary().content
+            detailed = builder.build_detailed().content
+            result = {'summary': summary, 'detailed': detailed}
+        except ValueError as exc:
+            flash(str(exc), 'danger')
 
     return render_template('reports.html',
                            report_types=report_types,
                            result=result)
 
-@app.route('/export_reports')
+@route('/export_reports')
+@versions.conditional('orders', 'users')
 def export_reports():
-    # забираем все заказы и связанных пользователей
-    with DbSessionManager() as db:
-        orders = db.query(OrderModel).all()
-        users = {u.id: u for u in db.query(User).all()}
-
-    # формируем CSV в памяти
-    output = io.StringIO()
-    writer = csv.writer(output, delimiter=';')
-    writer.writerow(['Order ID','User','Role','Total','Status','Created At'])
-    for o in orders:
-        u = users.get(o.user_id)
-        writer.writerow([
-            o.id,
-            u.name if u else '',
-            u.role if u else '',
-            o.total,
-            o.status,
-            o.created_at.strftime('%Y-%m-%d %H:%M')
-        ])
-
-    # отдаем файл
-    response = make_response(output.getvalue())
-    response.headers['Content-Disposition'] = 'attachment; filename=reports.csv'
-    response.mimetype = 'text/csv'
+    # фильтры: from/to (YYYY-MM-DD), status, role; gzip=1 — сжатая выгрузка
+    try:
+        filters = {
+            'date_from': date.fromisoformat(request.args['from']) if request.args.get('from') else None,
+            'date_to': date.fromisoformat(request.args['to']) if request.args.get('to') else None,
+            'status': request.args.get('status') or None,
+            'role': request.args.get('role') or None,
+        }
+    except ValueError:
+        return "Даты ожидаются в формате YYYY-MM-DD", 400
+
+    # отдаём CSV потоком: заказы читаются батчами с JOIN на users
+    from export import iter_orders_csv, gzip_stream
+    chunks = iter_orders_csv(**filters)
+    if request.args.get('gzip') in ('1', 'true', 'on'):
+        response = Response(stream_with_context(gzip_stream(chunks)), mimetype='application/gzip')
+        response.headers['Content-Disposition'] = 'attachment; filename=reports.csv.gz'
+    else:
+        response = Response(stream_with_context(chunks), mimetype='text/csv')
+        response.headers['Content-Disposition'] = 'attachment; filename=reports.csv'
     return response
 
 # Adapter: единый маршрут оплаты
-@app.route('/pay/<int:order_id>/<provider>')
+@route('/pay/<int:order_id>/<provider>')
 def pay_order(order_id, provider):
     with DbSessionManager() as db:
         order = db.query(OrderModel).get(order_id)
@@ -293,67 +453,188 @@ def pay_order(order_id, provider):
         flash("Заказ не найден", "danger")
         return redirect(url_for('orders'))
 
-    # Собираем паттерн Adapter
-    if provider == 'stripe':
-        proc = StripeAdapter(StripeAPI())
+    # Adapter: долгоживущий процессор провайдера; ключ идемпотентности — повторный клик не спишет дважды
+    from payment import PROVIDERS, Charge, get_processor
+    proc = get_processor(provider if provider in PROVIDERS else 'paypal')
+    result = proc.charge(Charge(f"order-{order_id}", order.total))
+    if not result.ok:
+        flash(f"Оплата заказа {order_id} не прошла: {result.error}", "danger")
+        return redirect(url_for('orders'))
+    if result.duplicate:
+        flash(f"Заказ {order_id} уже оплачен", "info")
     else:
-        proc = PayPalAdapter(PayPalAPI())
-    proc.pay(order.total)
-    flash(f"Заказ {order_id} оплачен через {provider}", "success")
+        flash(f"Заказ {order_id} оплачен через {provider}", "success")
     return redirect(url_for('orders'))
 
-# Prototype: клонировать заказ в БД
-@app.route('/clone/<int:order_id>')
+# Prototype: клонировать заказ в БД; ?count=N — N копий одной транзакцией
+MAX_CLONES = 1000
+
+@route('/clone/<int:order_id>')
 def clone_order(order_id):
+    try:
+        count = max(1, min(int(request.args.get('count', 1)), MAX_CLONES))
+    except ValueError:
+        count = 1
     with DbSessionManager() as db:
         orig = db.query(OrderModel).get(order_id)
         if not orig:
             flash("Заказ не найден", "danger")
             return redirect(url_for('orders'))
-        clone = OrderModel(
-            user_id=orig.user_id,
-            total=orig.total,
-            status='Cloned',
-            created_at=datetime.now()
-        )
-        db.add(clone)
+        from order import OrderRecord
+        rows = [c.as_row() for c in OrderRecord.from_model(orig).clone_many(count)]
+        # один executemany-INSERT ... RETURNING и одно обновление rollup на все копии
+        clone_ids = db.scalars(insert(OrderModel).returning(OrderModel.id), rows).all()
+        days = record_orders_bulk(db, rows)
         db.commit()
-    flash(f"Заказ {order_id} клонирован как {clone.id}", "info")
+    from reports import invalidate_report_cache
+    for day in days:
+        invalidate_sales_cache(day)
+        invalidate_report_cache(day)
+    if count == 1:
+        flash(f"Заказ {order_id} клонирован как {clone_ids[0]}", "info")
+    else:
+        flash(f"Заказ {order_id} клонирован {count} раз (id {min(clone_ids)}–{max(clone_ids)})", "info")
     return redirect(url_for('orders'))
 
 # Observer: разослать уведомления по статусу
-from notification import OrderSubject, ClientObserver, ManagerObserver
-@app.route('/notify/<int:order_id>')
+@route('/notify/<int:order_id>')
 def notify_order(order_id):
     # Здесь мы просто демонстрируем паттерн — уведомляем клиентов и менеджеров
-    subj = OrderSubject()
-    subj.attach(ClientObserver())
-    subj.attach(ManagerObserver())
-    subj.update_status(f"Notification for order {order_id}")
+    from notification import OrderSubject
+    OrderSubject(order_id, dispatcher=get_notifier()).update_status(f"Notification for order {order_id}")
     flash(f"Уведомления по заказу {order_id} отправлены", "warning")
     return redirect(url_for('orders'))
 
-@app.route('/admin')
+# --- Админка: списки с keyset-пагинацией и фильтрами ---
+ADMIN_PAGE_SIZE = 50
+
+def _page_limit(args):
+    try:
+        return max(1, min(int(args.get('limit', ADMIN_PAGE_SIZE)), 200))
+    except ValueError:
+        return ADMIN_PAGE_SIZE
+
+def _admin_users_page(db, args):
+    q = db.query(User)
+    if args.get('role'):
+        q = q.filter(User.role.in_(role_values(args['role'])))
+    return keyset_page(q, [User.id], args.get('cursor'), _page_limit(args))
+
+def _admin_orders_page(db, args):
+    q = db.query(OrderModel)
+    if args.get('status'):
+        q = q.filter(OrderModel.status == args['status'])
+    if args.get('user_id'):
+        q = q.filter(OrderModel.user_id == int(args['user_id']))
+    return keyset_page(q, [OrderModel.id], args.get('cursor'), _page_limit(args))
+
+def _admin_audit_page(db, args):
+    # новые записи сверху: ключ (timestamp, id) по убыванию
+    q = db.query(Audit)
+    if args.get('entity'):
+        q = q.filter(Audit.entity == args['entity'])
+    if args.get('action'):
+        q = q.filter(Audit.action == args['action'])
+    return keyset_page(q, [Audit.timestamp, Audit.id], args.get('cursor'),
+                       _page_limit(args), descending=True)
+
+def _dt(value):
+    return value.isoformat() if value else None
+
+ADMIN_SECTIONS = {
+    'users': (_admin_users_page, lambda u: {
+        'id': u.id, 'name': u.name, 'email': u.email, 'role': u.role,
+        'is_active': u.is_active, 'created_at': _dt(u.created_at)
+    }),
+    'orders': (_admin_orders_page, lambda o: {
+        'id': o.id, 'user_id': o.user_id, 'total': o.total,
+        'status': o.status, 'created_at': _dt(o.created_at)
+    }),
+    'audit': (_admin_audit_page, lambda a: {
+        'id': a.id, 'entity': a.entity, 'entity_id': a.entity_id, 'action': a.action,
+        'detail': a.detail, 'performed_by': a.performed_by, 'timestamp': _dt(a.timestamp)
+    }),
+}
+
+@route('/admin/api/<section>')
+# разделы админки называются как таблицы: ETag зависит только от версии своей таблицы
+@versions.conditional(lambda section: (section,) if section in ADMIN_SECTIONS else ())
+def admin_api(section):
+    # JSON-эндпоинты для ленивой подгрузки разделов админки: ?cursor=&limit=&<фильтры>
+    if 'user_id' not in session:
+        return jsonify({'error': 'Требуется вход'}), 401
+    if not is_admin():
+        return jsonify({'error': 'Доступ запрещён'}), 403
+    if section not in ADMIN_SECTIONS:
+        return jsonify({'error': 'Неизвестный раздел'}), 404
+
+    page, serialize = ADMIN_SECTIONS[section]
+    try:
+        with DbSessionManager() as db:
+            rows, next_cursor = page(db, request.args)
+            items = [serialize(row) for row in rows]
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
+@route('/admin/identity_cache')
+def admin_identity_cache():
+    # счётчики кэша пользователей: hits/misses/hit_ratio/size
+    if not is_admin():
+        return jsonify({'error': 'Доступ запрещён'}), 403
+    return jsonify(identity.stats())
+
+@route('/admin/import_orders', methods=['POST'])
+def admin_import_orders():
+    # массовый импорт: файл CSV/JSONL в поле file, ?format=csv|jsonl&batch_size=N
+    if 'user_id' not in session:
+        return jsonify({'error': 'Требуется вход'}), 401
+    if not is_admin():
+        return jsonify({'error': 'Доступ запрещён'}), 403
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'error': 'Нет файла'}), 400
+
+    fmt = request.args.get('format') or ('jsonl' if upload.filename.endswith(('.jsonl', '.ndjson')) else 'csv')
+    try:
+        batch_size = max(1, min(int(request.args.get('batch_size', 1000)), 10000))
+    except ValueError:
+        return jsonify({'error': 'batch_size — целое число'}), 400
+    from importer import import_orders, open_text
+    report = import_orders(open_text(upload.stream), fmt, batch_size, performed_by=session['user_id'])
+    return jsonify(report)
+
+@route('/admin')
+@versions.conditional('users', 'orders', 'audit')
 def admin_panel():
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    if session.get('user_role') != 'admin':
+    if not is_admin():
         return "Доступ запрещён", 403
 
-    with DbSessionManager() as db:
-        users  = db.query(User).all()
-        orders = db.query(OrderModel).all()
-        audit  = db.query(Audit).order_by(Audit.timestamp.desc()).all()
+    # только первые страницы; остальное шаблон догружает через /admin/api/<section>
+    args = {k: v for k, v in request.args.items() if k != 'cursor'}
+    try:
+        with DbSessionManager() as db:
+            users, users_next = _admin_users_page(db, args)
+            orders, orders_next = _admin_orders_page(db, args)
+            audit, audit_next = _admin_audit_page(db, args)
+    except ValueError:
+        return "Некорректный фильтр", 400
 
     return render_template('admin.html',
                            users=users,
                            orders=orders,
-                           audit=audit)
+                           audit=audit,
+                           users_next=users_next,
+                           orders_next=orders_next,
+                           audit_next=audit_next)
 
-@app.route('/logout')
+@route('/logout')
 def logout():
+    sessions.end(session.get('sid'))
     session.clear()
     return redirect(url_for('login'))
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
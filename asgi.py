@@ -0,0 +1,253 @@
+# asgi.py: ASGI-режим — I/O-маршруты на asyncio, остальные — тот же Flask через WsgiToAsgi
+#   uvicorn asgi:app --port 8000
+# Нативно асинхронные маршруты: /api/sales_data, /export_reports, /pay/<id>/<provider>, /notify/<id>.
+# Пока такой запрос ждёт SQLite или провайдера оплаты, цикл событий обслуживает другие,
+# а не держит поток воркера. Сессия (подписанная cookie Flask) и flash-сообщения общие
+# с синхронными маршрутами, как и условные GET (ETag/304 по версиям данных, versions.py)
+# и метрики /metrics. Сравнение режимов: python -m benchmarks.load
+import json
+import re
+from datetime import date
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+from werkzeug.http import parse_date, parse_etags
+
+import identity
+import versions
+from app import app as flask_app, get_notifier, session_valid
+from db import Order as OrderModel
+from db_async import AsyncDbSessionManager, async_engine
+from export import aiter_orders_csv, agzip_stream
+from metrics import metrics
+from notification import OrderSubject
+from payment import PROVIDERS, Charge, get_processor
+from sales import BUCKETS, sales_series_async
+
+SESSION_COOKIE = flask_app.config['SESSION_COOKIE_NAME']
+_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+ORDERS_URL = flask_app.url_map.bind('').build('orders')
+
+
+class Request:
+    """Минимум запроса, нужный асинхронным маршрутам: путь, строка запроса, валидаторы и сессия Flask."""
+    __slots__ = ('path', 'query', 'args', 'if_none_match', 'if_modified_since', 'session', 'session_modified')
+
+    def __init__(self, scope):
+        self.path = scope['path']
+        # все пары, как request.args.items(multi=True) у Flask, — ETag совпадает в обоих режимах
+        self.query = parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True)
+        self.args = {k: v for k, v in self.query if v}
+        headers = {name.lower(): value.decode('latin-1') for name, value in scope['headers']}
+        self.if_none_match = parse_etags(headers.get(b'if-none-match'))
+        self.if_modified_since = parse_date(headers.get(b'if-modified-since'))
+        self.session = _load_session(scope['headers'])
+        self.session_modified = False
+        if 'user_id' in self.session and not session_valid(self.session):
+            # как check_session() в app.py: сессия закрыта на сервере — cookie сбрасывается
+            self.session = {}
+            self.session_modified = True
+
+    def flash(self, message, category='message'):
+        """Как flask.flash(): сообщение покажет следующий синхронный маршрут."""
+        self.session.setdefault('_flashes', []).append((category, message))
+        self.session_modified = True
+
+
+def _load_session(headers):
+    cookie = SimpleCookie()
+    for name, value in headers:
+        if name == b'cookie':
+            cookie.load(value.decode('latin-1'))
+    morsel = cookie.get(SESSION_COOKIE)
+    if morsel is None or _serializer is None:
+        return {}
+    try:
+        return _serializer.loads(morsel.value,
+                                 max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+
+def _headers(content_type, request=None, extra=()):
+    headers = [(b'content-type', content_type.encode())]
+    if request is not None and request.session_modified:
+        cookie = f"{SESSION_COOKIE}={_serializer.dumps(dict(request.session))}; HttpOnly; Path=/"
+        headers.append((b'set-cookie', cookie.encode()))
+    headers.extend((name.encode(), value.encode()) for name, value in extra)
+    return headers
+
+
+async def _respond(send, status, body, content_type='text/plain; charset=utf-8', extra=()):
+    await send({'type': 'http.response.start', 'status': status, 'headers': _headers(content_type, extra=extra)})
+    await send({'type': 'http.response.body', 'body': body.encode('utf-8') if isinstance(body, str) else body})
+
+
+async def _json(send, data, status=200, extra=()):
+    await _respond(send, status, json.dumps(data), 'application/json', extra)
+
+
+async def _redirect(send, request, location):
+    await send({'type': 'http.response.start', 'status': 302,
+                'headers': _headers('text/html; charset=utf-8', request, [('location', location)])})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _stream(send, chunks, content_type, filename, extra=()):
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': _headers(content_type, extra=[
+                    ('content-disposition', f'attachment; filename={filename}'), *extra])})
+    async for chunk in chunks:
+        await send({'type': 'http.response.body',
+                    'body': chunk.encode('utf-8') if isinstance(chunk, str) else chunk,
+                    'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def _parse_date(value):
+    return date.fromisoformat(value) if value else None
+
+
+async def _conditional(request, send, tables):
+    """Как versions.conditional: на совпавший валидатор клиента отвечает 304 и -> None, иначе ->
+    заголовки ETag/Last-Modified для ответа 200 (пустые без пользователя или до миграции 5)."""
+    if request.session.get('_flashes'):
+        return ()
+    user = identity.by_id(request.session.get('user_id'))
+    if user is None or user.is_active is False:
+        return ()
+    current = await versions.current_versions_async(tables)
+    if current is None:
+        return ()
+    tag = versions.etag(current, user, request.path, request.query, flask_app.config.get('ETAG_SALT', ''))
+    modified = versions.last_modified(current)
+    headers = [(name.lower(), value) for name, value in versions.validator_headers(tag, modified)]
+    if versions.not_modified(tag, modified, request.if_none_match, request.if_modified_since):
+        await send({'type': 'http.response.start', 'status': 304,
+                    'headers': [(name.encode(), value.encode()) for name, value in headers]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return None
+    return headers
+
+
+# --- асинхронные маршруты (поведение как у одноимённых в app.py) ---
+
+async def sales_data(request, send):
+    validators = await _conditional(request, send, ('orders',))
+    if validators is None:
+        return
+    if 'user_id' not in request.session:
+        return await _json(send, [], 401)
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        return await _json(send, {'error': 'bucket должен быть day, week или month'}, 400)
+    try:
+        date_from = _parse_date(request.args.get('from'))
+        date_to = _parse_date(request.args.get('to'))
+    except ValueError:
+        return await _json(send, {'error': 'Даты ожидаются в формате YYYY-MM-DD'}, 400)
+    async with AsyncDbSessionManager() as db:
+        data = await sales_series_async(db, date_from, date_to, bucket)
+    await _json(send, data, extra=validators)
+
+
+async def export_reports(request, send):
+    validators = await _conditional(request, send, ('orders', 'users'))
+    if validators is None:
+        return
+    try:
+        filters = {
+            'date_from': _parse_date(request.args.get('from')),
+            'date_to': _parse_date(request.args.get('to')),
+            'status': request.args.get('status') or None,
+            'role': request.args.get('role') or None,
+        }
+    except ValueError:
+        return await _respond(send, 400, "Даты ожидаются в формате YYYY-MM-DD")
+    chunks = aiter_orders_csv(**filters)
+    if request.args.get('gzip') in ('1', 'true', 'on'):
+        await _stream(send, agzip_stream(chunks), 'application/gzip', 'reports.csv.gz', validators)
+    else:
+        await _stream(send, chunks, 'text/csv; charset=utf-8', 'reports.csv', validators)
+
+
+async def pay_order(request, send, order_id, provider):
+    order_id = int(order_id)
+    async with AsyncDbSessionManager() as db:
+        order = await db.get(OrderModel, order_id)
+    if not order:
+        request.flash("Заказ не найден", "danger")
+        return await _redirect(send, request, ORDERS_URL)
+    proc = get_processor(provider if provider in PROVIDERS else 'paypal')
+    result = await proc.charge_async(Charge(f"order-{order_id}", order.total))
+    if not result.ok:
+        request.flash(f"Оплата заказа {order_id} не прошла: {result.error}", "danger")
+        return await _redirect(send, request, ORDERS_URL)
+    if result.duplicate:
+        request.flash(f"Заказ {order_id} уже оплачен", "info")
+    else:
+        request.flash(f"Заказ {order_id} оплачен через {provider}", "success")
+    await _redirect(send, request, ORDERS_URL)
+
+
+async def notify_order(request, send, order_id):
+    # publish() только ставит уведомление в очередь диспетчера — ожидания нет
+    OrderSubject(int(order_id), dispatcher=get_notifier()).update_status(f"Notification for order {order_id}")
+    request.flash(f"Уведомления по заказу {order_id} отправлены", "warning")
+    await _redirect(send, request, ORDERS_URL)
+
+
+ROUTES = [
+    (re.compile(r'/api/sales_data'), sales_data),
+    (re.compile(r'/export_reports'), export_reports),
+    (re.compile(r'/pay/(?P<order_id>\d+)/(?P<provider>[^/]+)'), pay_order),
+    (re.compile(r'/notify/(?P<order_id>\d+)'), notify_order),
+]
+
+
+class CrmAsgi:
+    """GET на маршруты из ROUTES обслуживаются корутинами, всё остальное — Flask-приложением."""
+    def __init__(self, wsgi_app, routes=ROUTES):
+        self.wsgi = WsgiToAsgi(wsgi_app)
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            for pattern, handler in self.routes:
+                match = pattern.fullmatch(scope['path'])
+                if match:
+                    return await self._handle(handler, scope, send, match.groupdict())
+        await self.wsgi(scope, receive, send)
+
+    async def _handle(self, handler, scope, send, kwargs):
+        if not flask_app.config['METRICS']:
+            return await handler(Request(scope), send, **kwargs)
+        # endpoint — имя корутины, оно же имя маршрута Flask: оба режима в одних рядах /metrics
+        with metrics.track(handler.__name__, scope['path']) as stats:
+            async def tracked_send(message):
+                if message['type'] == 'http.response.start':
+                    stats.status = message['status']
+                await send(message)
+            await handler(Request(scope), tracked_send, **kwargs)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = CrmAsgi(flask_app)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:app', port=8000)
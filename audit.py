@@ -0,0 +1,135 @@
+# audit.py: пакетная запись журнала аудита из фонового потока
+import atexit
+import datetime
+import logging
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import insert
+
+from db import Audit
+
+logger = logging.getLogger(__name__)
+
+
+class AuditSink:
+    """Копит записи аудита в памяти и пишет их пачками одним INSERT.
+
+    mode='async' — сброс фоновым потоком по размеру пачки или по таймеру;
+    mode='sync'  — каждая запись пишется сразу (для тестов и CLI).
+    """
+    def __init__(self, bind=None, mode='async', batch_size=200, flush_interval=0.5):
+        self.bind = bind
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._write_lock = threading.Lock()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        # счётчики
+        self.flushed = 0
+        self.flushes = 0
+        self.failed = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def submit(self, entity, entity_id, action, detail=None, performed_by=None):
+        entry = {
+            'entity': entity,
+            'entity_id': entity_id,
+            'action': action,
+            'detail': detail,
+            'performed_by': performed_by,
+            'timestamp': datetime.datetime.now(),
+        }
+        if self.mode == 'sync':
+            self._write([entry])
+            return
+        self._queue.put(entry)
+        self._ensure_worker()
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        """Синхронно сбрасывает всё, что накоплено в очереди."""
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize(),
+            'flushed_entries': self.flushed,
+            'flushes': self.flushes,
+            'failed_entries': self.failed,
+            'last_flush_ms': round(self.last_flush_ms, 3),
+            'max_flush_ms': round(self.max_flush_ms, 3),
+            'avg_flush_ms': round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+        }
+
+    # --- внутреннее ---
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='audit-sink', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _drain(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, entries):
+        if self.bind is None:
+            from db import engine
+            self.bind = engine
+        started = time.perf_counter()
+        with self._write_lock:
+            try:
+                with self.bind.begin() as conn:
+                    conn.execute(insert(Audit), entries)
+            except Exception:
+                self.failed += len(entries)
+                logger.exception("Не удалось записать %d записей аудита", len(entries))
+                return
+        elapsed = (time.perf_counter() - started) * 1000
+        self.flushed += len(entries)
+        self.flushes += 1
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        self.total_flush_ms += elapsed
+
+
+# Глобальный sink: CRM_AUDIT_MODE=sync|async (в профиле test по умолчанию sync)
+audit_sink = AuditSink(
+    mode=os.environ.get('CRM_AUDIT_MODE', 'sync' if os.environ.get('CRM_ENV') == 'test' else 'async')
+)
+atexit.register(audit_sink.close)
@@ -0,0 +1,2 @@
+# benchmarks: воспроизводимые замеры производительности CRM.
+# Каждый модуль запускается из корня проекта: python -m benchmarks.<имя> --help
@@ -0,0 +1,78 @@
+# benchmarks/batch_pricing.py: пакетный расчёт цен (pricing.py) против цикла по объектам.
+# Сначала — проверка эквивалентности на случайно сгенерированных заказах
+# (граничные суммы около порога скидки, пустые заказы, повторные услуги), затем замер.
+#   python -m benchmarks.batch_pricing --orders 100000 --cases 300
+import argparse
+import random
+import time
+
+import numpy as np
+
+from order import (
+    ConcreteOrder, VolumeDiscount, VIPDiscount,
+    InsuranceDecorator, PriorityShippingDecorator
+)
+from pricing import OrderBatch, price_batch
+
+EDGE_PRICES = [0, 1, 999, 1000, 1001, 1000.5, 0.1]
+
+
+def random_order(rng):
+    n_items = rng.choice([0, 1, 1, 2, 3, 5, 10])
+    if rng.random() < 0.2:
+        items = [{'price': rng.choice(EDGE_PRICES)}]
+    else:
+        items = [{'price': rng.choice([rng.randint(1, 800), round(rng.uniform(0, 800), 2)])}
+                 for _ in range(n_items)]
+    order = ConcreteOrder(items=items, is_vip=rng.random() < 0.5)
+    strategy = rng.choice([None, VolumeDiscount, VIPDiscount])
+    if strategy:
+        order.set_discount_strategy(strategy())
+    for _ in range(rng.choice([0, 0, 1, 2, 3])):
+        order = rng.choice([InsuranceDecorator, PriorityShippingDecorator])(order)
+    return order
+
+
+def object_prices(orders):
+    return [o.get_price() for o in orders]
+
+
+def check_equivalence(cases, seed=0):
+    """Сотни случайных пачек: пакетный результат должен совпасть с объектным."""
+    for case in range(cases):
+        rng = random.Random(seed + case)
+        orders = [random_order(rng) for _ in range(rng.randint(1, 50))]
+        expected = np.array(object_prices(orders), dtype=np.float64)
+        actual = price_batch(OrderBatch.from_orders(orders))
+        if not np.allclose(actual, expected, rtol=1e-12, atol=1e-9):
+            bad = int(np.argmax(~np.isclose(actual, expected, rtol=1e-12, atol=1e-9)))
+            raise AssertionError(f"случай {case}, заказ {bad}: {actual[bad]} != {expected[bad]}")
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Пакетный расчёт цен против объектного')
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--cases', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    check_equivalence(args.cases, args.seed)
+    print(f"Эквивалентность: {args.cases} случайных пачек совпали")
+
+    rng = random.Random(args.seed)
+    orders = [random_order(rng) for _ in range(args.orders)]
+    _, t_objects = timed(object_prices, orders)
+    batch, t_columns = timed(OrderBatch.from_orders, orders)
+    _, t_numpy = timed(price_batch, batch)
+
+    print(f"Объектный цикл:          {t_objects:8.3f} с ({args.orders / t_objects:12.0f} заказов/с)")
+    print(f"Сборка колонок:          {t_columns:8.3f} с")
+    print(f"price_batch (NumPy):     {t_numpy:8.3f} с ({args.orders / t_numpy:12.0f} заказов/с)")
+    print(f"Ускорение расчёта: x{t_objects / t_numpy:.1f}, "
+          f"с учётом сборки колонок: x{t_objects / (t_columns + t_numpy):.1f}")
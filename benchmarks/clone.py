@@ -0,0 +1,123 @@
+# benchmarks/clone.py: клонирование заказов (Prototype).
+# 1) В памяти: ConcreteOrder.clone() (copy-on-write позиций) против copy.deepcopy заказа
+#    со списком словарей-позиций, как клонировали раньше.
+# 2) Путь /clone?count=N: по строке на копию (add + flush + rollup + commit, как было)
+#    против OrderRecord.clone_many + один executemany-INSERT и один rollup на пачку.
+# Сначала — проверка, что оба пути дают одинаковые строки и сходящийся daily_sales, затем замер.
+#   python -m benchmarks.clone --sizes 1 10 100 500 --counts 1 10 100 1000
+import argparse
+import copy
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.datagen import generate
+from order import ConcreteOrder, VolumeDiscount
+
+
+def per_call_us(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def bench_memory(sizes, repeat):
+    print(f"{'позиций':>8} {'deepcopy, мкс':>15} {'clone, мкс':>12} {'ускорение':>10}")
+    for n in sizes:
+        items = [{'price': 100.0 + i, 'quantity': 1, 'sku': i} for i in range(n)]
+        order = ConcreteOrder(items=items, is_vip=True)
+        order.set_discount_strategy(VolumeDiscount())
+        # прежнее состояние заказа: список словарей + флаг + стратегия, копия — deepcopy целиком
+        legacy = {'items': items, 'is_vip': True, 'discount_strategy': order.discount_strategy}
+        clone = order.clone()
+        assert clone.items == copy.deepcopy(legacy)['items'] and clone.get_price() == order.get_price()
+        clone.items[0]['price'] = -1.0          # запись в клон не видна оригиналу
+        assert order.items[0]['price'] == 100.0
+        deep = per_call_us(lambda: copy.deepcopy(legacy), max(1, repeat // n))
+        fast = per_call_us(order.clone, repeat)
+        print(f"{n:>8} {deep:>15.2f} {fast:>12.2f} {deep / fast:>9.0f}x")
+
+
+def clone_per_row(db, orig, count):
+    """Как /clone до пачек: каждая копия — отдельный INSERT, rollup и commit."""
+    from db import Order
+    from sales import record_order_created
+    ids = []
+    for _ in range(count):
+        clone = Order(user_id=orig.user_id, total=orig.total, status='Cloned', created_at=datetime.now())
+        db.add(clone)
+        db.flush()
+        record_order_created(db, clone)
+        db.commit()
+        ids.append(clone.id)
+    return ids
+
+
+def clone_bulk(db, orig, count):
+    """Как app.clone_order: прототип строки, executemany-INSERT ... RETURNING, один rollup."""
+    from sqlalchemy import insert
+    from db import Order
+    from order import OrderRecord
+    from sales import record_orders_bulk
+    rows = [c.as_row() for c in OrderRecord.from_model(orig).clone_many(count)]
+    ids = db.scalars(insert(Order).returning(Order.id), rows).all()
+    record_orders_bulk(db, rows)
+    db.commit()
+    return ids
+
+
+def _fields(db, ids):
+    from db import Order
+    rows = db.query(Order.user_id, Order.total, Order.status).filter(Order.id.in_(ids)).all()
+    return sorted(map(tuple, rows))
+
+
+def check_equivalence(db, orig, count):
+    from sales import check_daily_sales
+    a, b = clone_per_row(db, orig, count), clone_bulk(db, orig, count)
+    assert len(a) == len(b) == count
+    assert _fields(db, a) == _fields(db, b) == [(orig.user_id, orig.total, 'Cloned')] * count
+    assert not check_daily_sales(db), 'daily_sales разошёлся с orders'
+    print(f"эквивалентность: {count} копий по строке и пачкой совпадают, daily_sales сходится")
+
+
+def bench_route(db, orig, counts):
+    print(f"{'копий':>6} {'по строке, мс':>14} {'пачкой, мс':>11} {'ускорение':>10}")
+    for count in counts:
+        started = time.perf_counter()
+        clone_per_row(db, orig, count)
+        row = time.perf_counter() - started
+        started = time.perf_counter()
+        clone_bulk(db, orig, count)
+        bulk = time.perf_counter() - started
+        print(f"{count:>6} {row * 1000:>14.2f} {bulk * 1000:>11.2f} {row / bulk:>9.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Клонирование заказов: deepcopy/по строке против Prototype/пачкой')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 500])
+    parser.add_argument('--counts', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=10000)
+    args = parser.parse_args()
+
+    bench_memory(args.sizes, args.repeat)
+    print()
+
+    workdir = tempfile.mkdtemp(prefix='crm-clone-')
+    try:
+        path = os.path.join(workdir, 'crm.db')
+        # до первого импорта db.py
+        os.environ.update(CRM_DATABASE_URL=f"sqlite:///{path}", CRM_AUDIT_MODE='sync',
+                          CRM_NOTIFY_MODE='sync', CRM_OUTBOX_MODE='sync')
+        generate(path, users=100, orders=args.orders, audit=0)
+        from db import DbSessionManager, Order
+        with DbSessionManager() as db:
+            orig = db.query(Order).order_by(Order.id).first()
+            check_equivalence(db, orig, 50)
+            bench_route(db, orig, args.counts)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,122 @@
+# benchmarks/datagen.py: генератор синтетической БД для замеров — пользователи, заказы за период, аудит.
+# Схема создаётся миграциями (как у приложения), строки вставляются пачками executemany
+# в одной транзакции, rollup daily_sales пересобирается. При одном seed результат одинаковый.
+#   python -m benchmarks.datagen --out /tmp/bench.db --users 1000 --orders 200000 --audit 50000
+import argparse
+import hashlib
+import random
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+from sqlalchemy.orm import sessionmaker
+
+# окончание периода фиксировано, чтобы данные не зависели от дня запуска
+END = date(2025, 12, 31)
+ROLES = (('client', 0.85), ('manager', 0.12), ('admin', 0.03))
+STATUSES = (('Создан', 0.15), ('В обработке', 0.15), ('Отправлен', 0.2), ('Завершен', 0.5))
+BATCH = 10000
+
+
+def _weighted(rng, choices, k):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights, k=k)
+
+
+def _ts(value):
+    # тот же текстовый формат, что пишет SQLAlchemy: сравнение строк в WHERE остаётся корректным
+    return value.isoformat(' ', 'microseconds')
+
+
+def _batches(rows, size=BATCH):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def generate(path, users=1000, orders=100000, audit=10000, days=365, seed=0):
+    """Создаёт (или дополняет) SQLite-файл path; -> dict с числом строк и временем.
+
+    Пользователь admin/admin создаётся всегда — под ним сценарии заходят в приложение.
+    """
+    from db import make_engine
+    from migrations import upgrade
+    from sales import rebuild_daily_sales
+
+    started = time.perf_counter()
+    engine = make_engine('production', url=f"sqlite:///{path}")
+    upgrade(engine)
+
+    rng = random.Random(seed)
+    start = datetime.combine(END - timedelta(days=days - 1), datetime.min.time())
+    minutes = days * 24 * 60
+    password = hashlib.sha256(b"password").hexdigest()
+
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA cache_size=-262144')
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO users (name, email, hashed_password, role, is_active, created_at) "
+                     "VALUES ('Администратор', 'admin', ?, 'admin', 1, ?)",
+                     (hashlib.sha256(b"admin").hexdigest(), _ts(start)))
+        first_user = conn.execute("SELECT coalesce(max(id), 0) FROM users").fetchone()[0] + 1
+        for batch in _batches(
+                (f"Пользователь {i}", f"user{seed}-{i}@example.com", password, role, 1,
+                 _ts(start + timedelta(minutes=rng.randrange(minutes))))
+                for i, role in enumerate(_weighted(rng, ROLES, users))):
+            conn.executemany("INSERT INTO users (name, email, hashed_password, role, is_active, created_at) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", batch)
+        user_ids = [row[0] for row in conn.execute("SELECT id FROM users")]
+
+        first_order = conn.execute("SELECT coalesce(max(id), 0) FROM orders").fetchone()[0] + 1
+        # id растут вместе с created_at, как в живой БД: индексы по дате заполняются с конца,
+        # без случайных вставок в середину B-дерева; суммы — с длинным хвостом, как у реальных чеков
+        stamps = sorted(rng.randrange(minutes) for _ in range(orders))
+        for batch in _batches(
+                (owner, int(rng.lognormvariate(6.5, 0.8)) + 1, status, _ts(start + timedelta(minutes=stamp)))
+                for owner, status, stamp in zip(rng.choices(user_ids, k=orders),
+                                                _weighted(rng, STATUSES, orders), stamps)):
+            conn.executemany("INSERT INTO orders (user_id, total, status, created_at) VALUES (?, ?, ?, ?)", batch)
+        last_order = first_order + orders - 1
+
+        stamps = sorted(rng.randrange(minutes) for _ in range(audit))
+        for batch in _batches(
+                ('Order', rng.randint(first_order, last_order) if orders else None,
+                 rng.choice(('create', 'status_change')), None, rng.choice(user_ids),
+                 _ts(start + timedelta(minutes=stamp)))
+                for stamp in stamps):
+            conn.executemany("INSERT INTO audit (entity, entity_id, action, detail, performed_by, timestamp) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", batch)
+    conn.close()
+
+    with sessionmaker(bind=engine)() as db:
+        rebuild_daily_sales(db)
+        db.commit()
+    with engine.begin() as conn:
+        conn.exec_driver_sql('ANALYZE')
+    engine.dispose()
+    return {
+        'users': users, 'orders': orders, 'audit': audit, 'days': days, 'seed': seed,
+        'first_user': first_user, 'first_order': first_order, 'last_order': last_order,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Синтетическая БД CRM для замеров')
+    parser.add_argument('--out', required=True, help='путь к файлу SQLite')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--audit', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report = generate(args.out, args.users, args.orders, args.audit, args.days, args.seed)
+    rate = (report['users'] + report['orders'] + report['audit']) / report['seconds']
+    print(f"{args.out}: {report['users']} пользователей, {report['orders']} заказов, "
+          f"{report['audit']} записей аудита за {report['seconds']:.1f} с ({rate:,.0f} строк/с)")
@@ -0,0 +1,49 @@
+# benchmarks/item_memory.py: память на позицию заказа — список словарей против OrderItems.
+#   python -m benchmarks.item_memory --sizes 1 10 100 1000 --orders 200
+import argparse
+import time
+import tracemalloc
+
+from order import OrderItems
+
+
+def dict_items(n):
+    return [{'price': 100.0 + i, 'quantity': 1, 'sku': i} for i in range(n)]
+
+
+def measure(factory, n, orders):
+    """Байт на позицию: orders корзин по n позиций, созданных под tracemalloc."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    carts = [factory(n) for _ in range(orders)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del carts
+    return used / (n * orders)
+
+
+def per_call_us(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Байт на позицию заказа до и после')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--orders', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'позиций':>8} {'list[dict], Б':>14} {'OrderItems, Б':>14} "
+          f"{'сумма dict, мкс':>16} {'без кэша, мкс':>14} {'из кэша, мкс':>13}")
+    for n in args.sizes:
+        as_dicts = measure(dict_items, n, args.orders)
+        as_columns = measure(lambda k: OrderItems(dict_items(k)), n, args.orders)
+        rows = dict_items(n)
+        columns = OrderItems(rows)
+        print(f"{n:>8} {as_dicts:>14.1f} {as_columns:>14.1f} "
+              f"{per_call_us(lambda: sum(i['price'] * i['quantity'] for i in rows), args.repeat):>16.2f} "
+              f"{per_call_us(lambda: sum(columns.line_totals()), args.repeat):>14.2f} "
+              f"{per_call_us(columns.subtotal, args.repeat):>13.2f}")
@@ -0,0 +1,151 @@
+# benchmarks/load.py: нагрузочный тест I/O-маршрутов — синхронный Flask (WSGI, поток на запрос)
+# против ASGI-режима (asgi.py под uvicorn). Оба сервера поднимаются на синтетической БД
+# (benchmarks.datagen) с N заказами; оплата идёт через фейкового провайдера с задержкой.
+#   python -m benchmarks.load --mode both --concurrency 64 --requests 2000 --payment-latency 0.05
+import argparse
+import http.client
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+from benchmarks.datagen import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+START = date(2025, 1, 1)
+
+SERVERS = {
+    'sync': lambda port: [sys.executable, '-c',
+                          "import sys; from werkzeug.serving import run_simple; from app import app; "
+                          f"run_simple('127.0.0.1', {port}, app, threaded=True)"],
+    'async': lambda port: [sys.executable, '-m', 'uvicorn', 'asgi:app',
+                           '--port', str(port), '--log-level', 'warning', '--no-access-log'],
+}
+
+
+def prepare_database(workdir, orders):
+    """Синтетическая БД (benchmarks.datagen) с orders заказами за 2025 год; -> id последнего заказа."""
+    return generate(os.path.join(workdir, 'crm.db'), users=100, orders=orders, audit=0)['last_order']
+
+
+def start_server(mode, port, env):
+    proc = subprocess.Popen(SERVERS[mode](port), cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/login')
+            conn.getresponse().read()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"сервер {mode} не поднялся на порту {port}")
+
+
+def login(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('POST', '/login', urlencode({'email': 'admin', 'password': 'admin'}),
+                 {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    return response.getheader('Set-Cookie').split(';', 1)[0]
+
+
+def make_paths(kinds, max_order_id, count, seed=1):
+    """Смесь запросов: оплата (разные заказы — без попаданий в идемпотентность), график, выгрузка, уведомления."""
+    rng = random.Random(seed)
+    paths = []
+    for _ in range(count):
+        kind = rng.choice(kinds)
+        day = START + timedelta(days=rng.randrange(360))
+        if kind == 'pay':
+            paths.append(f"/pay/{rng.randint(1, max_order_id)}/fake")
+        elif kind == 'sales':
+            paths.append('/api/sales_data?' + urlencode(
+                {'from': day.isoformat(), 'to': (day + timedelta(days=rng.randint(1, 90))).isoformat()}))
+        elif kind == 'export':
+            paths.append('/export_reports?' + urlencode(
+                {'from': day.isoformat(), 'to': (day + timedelta(days=2)).isoformat()}))
+        else:
+            paths.append(f"/notify/{rng.randint(1, max_order_id)}")
+    return paths
+
+
+def run_load(port, cookie, paths, concurrency):
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def one(path):
+        started = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            conn.request('GET', path, headers={'Cookie': cookie})
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            ok = response.status in (200, 302)
+        except OSError as exc:
+            ok, response = False, exc
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors.append((path, getattr(response, 'status', response)))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, paths))
+    total = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'rps': len(paths) / total,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        'errors': errors,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Нагрузочный тест: WSGI против ASGI')
+    parser.add_argument('--mode', choices=('sync', 'async', 'both'), default='both')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=20000, help='сколько заказов сгенерировать')
+    parser.add_argument('--payment-latency', type=float, default=0.05, help='задержка фейкового провайдера, с')
+    parser.add_argument('--paths', default='pay,sales,export,notify',
+                        help='смесь запросов через запятую: pay, sales, export, notify')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='crm-load-')
+    env = dict(os.environ,
+               CRM_DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'crm.db')}",
+               CRM_FAKE_PAYMENT_LATENCY=str(args.payment_latency),
+               CRM_ENV=os.environ.get('CRM_ENV', 'production'))
+    try:
+        max_order_id = prepare_database(workdir, args.orders)
+        paths = make_paths(args.paths.split(','), max_order_id, args.requests)
+        modes = ('sync', 'async') if args.mode == 'both' else (args.mode,)
+        for offset, mode in enumerate(modes):
+            port = args.port + offset
+            server = start_server(mode, port, env)
+            try:
+                result = run_load(port, login(port), paths, args.concurrency)
+            finally:
+                server.terminate()
+                server.wait(timeout=10)
+            print(f"{mode:>5}: {result['rps']:8.1f} запросов/с   p50 {result['p50_ms']:8.1f} мс   "
+                  f"p99 {result['p99_ms']:8.1f} мс   ошибок {len(result['errors'])}")
+            for path, status in result['errors'][:5]:
+                print(f"       {status}: {path}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
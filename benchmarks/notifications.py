@@ -0,0 +1,75 @@
+# benchmarks/notifications.py: уведомления на FakeTransport — синхронно в запросе против NotificationDispatcher.
+# Проверяет, что всё доставлено, отказы повторены, пачки собраны по получателю
+# и лимит параллельности наблюдателя не превышен; затем сравнивает задержку «запроса».
+#   python -m benchmarks.notifications --changes 200 --recipients 10 --latency 0.02
+import argparse
+import time
+
+from notification import (
+    OrderSubject, ClientObserver, ManagerObserver, NotificationDispatcher, FakeTransport
+)
+
+
+def inline(changes, recipients, latency):
+    """Как было: свой субъект и наблюдатели на каждый запрос, доставка внутри запроса."""
+    transport = FakeTransport(latency)
+    started = time.perf_counter()
+    for i in range(changes):
+        subject = OrderSubject(i, recipient=i % recipients)
+        subject.attach(ClientObserver(transport))
+        subject.attach(ManagerObserver(transport))
+        subject.update_status('Отправлен')
+    return (time.perf_counter() - started) / changes, transport
+
+
+def dispatched(changes, recipients, latency, fail_times):
+    transport = FakeTransport(latency, fail_times)
+    dispatcher = NotificationDispatcher(workers=8, backoff=0.01)
+    client = dispatcher.register(ClientObserver(transport))
+    dispatcher.register(ManagerObserver(transport))
+    started = time.perf_counter()
+    for i in range(changes):
+        OrderSubject(i, recipient=i % recipients, dispatcher=dispatcher).update_status('Отправлен')
+    per_request = (time.perf_counter() - started) / changes
+    if not dispatcher.flush(timeout=60):
+        raise AssertionError(f"доставка не завершилась: {dispatcher.stats()}")
+    total = time.perf_counter() - started
+    dispatcher.close()
+    return per_request, total, transport, dispatcher.stats(), client.max_concurrency
+
+
+def check(transport, stats, changes, recipients, fail_times, client_limit):
+    delivered = sum(len(messages) for _, _, messages in transport.sent)
+    if delivered != 2 * changes or stats['failed']:
+        raise AssertionError(f"доставлено {delivered} из {2 * changes}: {stats}")
+    if stats['retried'] != fail_times:
+        raise AssertionError(f"повторов {stats['retried']}, ожидалось {fail_times}")
+    per_client = {}
+    for channel, recipient, messages in transport.sent:
+        if channel == 'client':
+            per_client[recipient] = per_client.get(recipient, 0) + len(messages)
+    if per_client != {r: len(range(r, changes, recipients)) for r in range(min(recipients, changes))}:
+        raise AssertionError(f"клиентские уведомления распределены неверно: {per_client}")
+    # клиенты + менеджеры: предел — сумма лимитов двух наблюдателей
+    if transport.max_active > client_limit + ManagerObserver.max_concurrency:
+        raise AssertionError(f"параллельных отправок {transport.max_active} — лимит превышен")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Синхронные уведомления против фонового диспетчера')
+    parser.add_argument('--changes', type=int, default=200)
+    parser.add_argument('--recipients', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.02, help='задержка транспорта, с')
+    parser.add_argument('--fail-times', type=int, default=3, help='сколько первых отправок отказать')
+    args = parser.parse_args()
+
+    per_request, total, transport, stats, client_limit = dispatched(
+        args.changes, args.recipients, args.latency, args.fail_times)
+    check(transport, stats, args.changes, args.recipients, args.fail_times, client_limit)
+    print(f"Проверка: доставлено {stats['delivered']} уведомлений пачками: {stats['batches']}, "
+          f"повторов {stats['retried']}, max параллельно {transport.max_active}")
+
+    inline_per_request, _ = inline(min(args.changes, 50), args.recipients, args.latency)
+    print(f"в запросе (как было):   {inline_per_request * 1000:10.3f} мс на смену статуса")
+    print(f"через диспетчер:        {per_request * 1000:10.3f} мс на смену статуса "
+          f"(всё доставлено за {total:.2f} с)")
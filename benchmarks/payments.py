@@ -0,0 +1,65 @@
+# benchmarks/payments.py: расчёт за месяц на фейковом провайдере — по одному платежу против pay_batch().
+# Проверяет, что при временных отказах, повторах и дублях ключей каждый заказ списан ровно один раз,
+# параллельность не выше лимита, а частота — не выше rate limit провайдера.
+#   python -m benchmarks.payments --orders 2000 --latency 0.02 --failure-rate 0.1 --rate 500
+import argparse
+import time
+
+from payment import Charge, FakePaymentAPI, FakeAdapter
+
+
+def sequential(charges, latency):
+    """Как было: новый адаптер на каждый платёж, вызовы по одному, без ключей и повторов."""
+    api = FakePaymentAPI(latency)
+    started = time.perf_counter()
+    for charge in charges:
+        FakeAdapter(api).pay(charge.amount)
+    return time.perf_counter() - started
+
+
+def batched(charges, latency, failure_rate, rate, concurrency):
+    api = FakePaymentAPI(latency, failure_rate, seed=1)
+    processor = FakeAdapter(api, rate_limit=rate, max_concurrency=concurrency)
+    started = time.perf_counter()
+    results = processor.pay_batch(charges)
+    return time.perf_counter() - started, results, api
+
+
+def check(charges, results, api, concurrency, rate, elapsed):
+    # списаны ровно один раз и на свою сумму те заказы, у которых прошла хотя бы одна попытка
+    paid = {r.key for r in results if r.ok}
+    expected = {c.key: c.amount for c in charges if c.key in paid}
+    failed = {r.key for r in results if not r.ok} - paid
+    if api.charged != expected:
+        raise AssertionError(f"списано {len(api.charged)} заказов, ожидалось {len(expected)}")
+    if api.max_active > concurrency:
+        raise AssertionError(f"параллельных запросов {api.max_active} > {concurrency}")
+    # всплеск до rate в начале + rate в секунду после
+    if api.calls > rate + rate * elapsed + 1:
+        raise AssertionError(f"{api.calls} запросов за {elapsed:.2f} с — rate limit {rate}/с превышен")
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Пакетная оплата заказов на фейковом провайдере')
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--failure-rate', type=float, default=0.1)
+    parser.add_argument('--rate', type=float, default=500, help='rate limit провайдера, платежей/с')
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    charges = [Charge(f"order-{i}", 100 + i % 900) for i in range(args.orders)]
+    # повторно отправленные платежи (например, перезапуск расчёта) — не должны списаться второй раз
+    charges += charges[:args.orders // 10]
+
+    elapsed, results, api = batched(charges, args.latency, args.failure_rate, args.rate, args.concurrency)
+    failed = check(charges, results, api, args.concurrency, args.rate, elapsed)
+    duplicates = sum(r.duplicate for r in results)
+    print(f"Проверка: {len(api.charged)} заказов списано по одному разу, дублей ключей отсечено {duplicates}, "
+          f"запросов к провайдеру {api.calls}, не прошли {len(failed)}, max параллельно {api.max_active}")
+
+    sample = charges[:min(len(charges), 200)]
+    t_seq = sequential(sample, args.latency)
+    print(f"по одному:    {len(sample) / t_seq:10.1f} платежей/с")
+    print(f"pay_batch:    {len(charges) / elapsed:10.1f} платежей/с (x{len(charges) / elapsed / (len(sample) / t_seq):.1f})")
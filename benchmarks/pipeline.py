@@ -0,0 +1,56 @@
+# benchmarks/pipeline.py: скомпилированный конвейер цены против цепочки декораторов,
+# собираемой заново на каждый заказ (как раньше в app.create_order).
+#   python -m benchmarks.pipeline --orders 200000
+import argparse
+import time
+
+from order import build_order
+from pipelines import compile_pipeline
+
+COMBINATIONS = [
+    (None, ()),
+    ('volume', ('insurance',)),
+    ('vip', ('insurance', 'priority')),
+    ('volume', ('insurance', 'priority')),
+]
+
+
+def per_second(fn, n):
+    started = time.perf_counter()
+    fn(n)
+    return n / (time.perf_counter() - started)
+
+
+def decorator_chain(n):
+    for i in range(n):
+        strategy, addons = COMBINATIONS[i % len(COMBINATIONS)]
+        build_order([{'price': 100 + i % 2000}], is_vip=i % 2 == 0, strategy=strategy,
+                    insurance='insurance' in addons, priority='priority' in addons).get_price()
+
+
+def compiled_pipeline(n):
+    for i in range(n):
+        strategy, addons = COMBINATIONS[i % len(COMBINATIONS)]
+        compile_pipeline(strategy, addons)([{'price': 100 + i % 2000}], is_vip=i % 2 == 0).total
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Конвейер цены против цепочки декораторов')
+    parser.add_argument('--orders', type=int, default=200000)
+    args = parser.parse_args()
+
+    # сверка результатов на всех комбинациях — в том числе с количеством больше 1
+    # и несколькими позициями: сумма позиций обязана совпадать с OrderItems.subtotal()
+    for i in range(2000):
+        strategy, addons = COMBINATIONS[i % len(COMBINATIONS)]
+        items = [{'price': 100 + i, 'quantity': 1 + i % 4}]
+        if i % 3:
+            items.append({'price': 7.5 * (i % 5), 'quantity': i % 3})
+        expected = build_order(items, is_vip=i % 2 == 0, strategy=strategy,
+                               insurance='insurance' in addons, priority='priority' in addons).get_price()
+        assert compile_pipeline(strategy, addons)(items, is_vip=i % 2 == 0).total == expected
+
+    chain = per_second(decorator_chain, args.orders)
+    compiled = per_second(compiled_pipeline, args.orders)
+    print(f"цепочка декораторов:   {chain:12.0f} заказов/с")
+    print(f"скомпилированный:      {compiled:12.0f} заказов/с  (x{compiled / chain:.1f})")
@@ -0,0 +1,92 @@
+# benchmarks/polling.py: дашборд, который опрашивает JSON-эндпоинты, — с условными GET и без них.
+# Каждые --write-every опросов создаётся заказ (меняются orders и audit), остальное время данные стоят.
+# Итог по режимам: доля 304, байты ответов (тело + заголовки), медианы времени ответа 200 и 304.
+#   python -m benchmarks.polling --orders 100000 --polls 3000 --write-every 50
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from benchmarks.datagen import END, generate
+
+PATHS = (
+    f"/api/sales_data?from={END.replace(month=1, day=1)}&to={END}&bucket=day",
+    '/api/sales_data?bucket=month',
+    '/admin/api/orders?limit=50',
+    '/admin/api/audit?limit=50',
+)
+
+
+def _size(response, body):
+    return len(body) + sum(len(k) + len(v) + 4 for k, v in response.headers.items())
+
+
+def poll(client, polls, write_every, conditional, rng):
+    """-> {'statuses', 'bytes', 'timings': {статус: [секунды]}}; запись заказа в замер не входит."""
+    etags, timings, total = {}, {}, 0
+    for i in range(polls):
+        if write_every and i and i % write_every == 0:
+            client.post('/create_order', data={'amount': rng.randint(100, 5000), 'strategy': 'none'})
+        path = PATHS[i % len(PATHS)]
+        headers = {'If-None-Match': etags[path]} if conditional and path in etags else {}
+        started = time.perf_counter()
+        with client.get(path, headers=headers) as response:
+            body = response.get_data()
+        elapsed = time.perf_counter() - started
+        if response.status_code == 200 and 'ETag' in response.headers:
+            etags[path] = response.headers['ETag']
+        timings.setdefault(response.status_code, []).append(elapsed)
+        total += _size(response, body)
+    return {'statuses': {k: len(v) for k, v in timings.items()}, 'bytes': total, 'timings': timings}
+
+
+def _median_ms(values):
+    return statistics.median(values) * 1000 if values else float('nan')
+
+
+def report(label, result, polls):
+    timings = result['timings']
+    everything = [t for values in timings.values() for t in values]
+    share = result['statuses'].get(304, 0) / polls
+    print(f"{label:<16} 304: {share:6.1%}   байт: {result['bytes'] / 1024:9.1f} КиБ ({result['bytes'] / polls:7.0f} на опрос)"
+          f"   медиана: всё {_median_ms(everything):6.3f} мс, 200 {_median_ms(timings.get(200)):6.3f} мс,"
+          f" 304 {_median_ms(timings.get(304)):6.3f} мс")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Опрос дашборда: условные GET против полных ответов')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--polls', type=int, default=2000)
+    parser.add_argument('--write-every', type=int, default=50, help='опросов между записями; 0 — без записей')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='crm-polling-')
+    try:
+        path = os.path.join(workdir, 'crm.db')
+        # до первого импорта db.py; фоновые очереди синхронны, чтобы не шуметь в замерах
+        os.environ.update(CRM_DATABASE_URL=f"sqlite:///{path}", CRM_AUDIT_MODE='sync',
+                          CRM_NOTIFY_MODE='sync', CRM_OUTBOX_MODE='sync')
+        generate(path, args.users, args.orders, audit=args.orders // 5, seed=args.seed)
+        from app import create_app
+        app = create_app({'OUTBOX_RELAY': False})
+        app.logger.disabled = True
+        client = app.test_client()
+        client.post('/login', data={'email': 'admin', 'password': 'admin'})
+        poll(client, len(PATHS) * 5, 0, False, random.Random(args.seed))      # прогрев кэшей
+
+        results = {}
+        for label, conditional in (('полные ответы', False), ('If-None-Match', True)):
+            results[label] = poll(client, args.polls, args.write_every, conditional, random.Random(args.seed))
+            report(label, results[label], args.polls)
+        plain, cond = results['полные ответы'], results['If-None-Match']
+        saved = 1 - cond['bytes'] / plain['bytes']
+        before = _median_ms([t for v in plain['timings'].values() for t in v])
+        after = _median_ms([t for v in cond['timings'].values() for t in v])
+        print(f"сэкономлено байт: {saved:.1%}; медиана опроса {before:.3f} -> {after:.3f} мс")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
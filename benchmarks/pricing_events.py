@@ -0,0 +1,44 @@
+# benchmarks/pricing_events.py: пропускная способность get_price() с хуком событий и без.
+#   python -m benchmarks.pricing_events --orders 200000
+import argparse
+import io
+import logging
+import time
+
+import events
+from order import ConcreteOrder, VolumeDiscount, InsuranceDecorator, PriorityShippingDecorator
+
+
+def make_orders(n):
+    orders = []
+    for i in range(n):
+        order = ConcreteOrder(items=[{'price': 100 + i % 900}, {'price': 500}], is_vip=i % 2 == 0)
+        order.set_discount_strategy(VolumeDiscount())
+        orders.append(PriorityShippingDecorator(InsuranceDecorator(order)))
+    return orders
+
+
+def throughput(orders):
+    started = time.perf_counter()
+    for order in orders:
+        order.get_price()
+    return len(orders) / (time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='get_price() с событиями и без')
+    parser.add_argument('--orders', type=int, default=200000)
+    args = parser.parse_args()
+    orders = make_orders(args.orders)
+
+    print(f"события выключены:          {throughput(orders):12.0f} заказов/с")
+
+    # logging в буфер в памяти — без затрат на терминал, остаётся цена самого хука
+    handler = logging.StreamHandler(io.StringIO())
+    events.logger.addHandler(handler)
+    events.logger.setLevel(logging.INFO)
+    events.logger.propagate = False
+    events.subscribe(events.log_event)
+    print(f"события -> logging (память): {throughput(orders):12.0f} заказов/с")
+    events.unsubscribe(events.log_event)
+    events.logger.removeHandler(handler)
@@ -0,0 +1,93 @@
+# benchmarks/sessions.py: хранилища сессий под нагрузкой из нескольких потоков.
+# Проверяет согласованность (индекс по пользователю совпадает с сессиями, LRU держит предел,
+# TTL вытесняет просроченные) и сравнивает пропускную способность: одна блокировка против полос.
+#   python -m benchmarks.sessions --threads 8 --ops 20000
+import argparse
+import random
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+from session import SessionManager, MemoryBackend, SqlBackend
+
+
+def make_user(i):
+    return SimpleNamespace(id=i, name=f"user{i}", email=f"user{i}@example.com", role='client')
+
+
+def workload(manager, users, ops, seed):
+    """Смесь: 10% входов, 5% выходов, остальное — проверки сессии по id."""
+    rng = random.Random(seed)
+    sids = []
+    for _ in range(ops):
+        roll = rng.random()
+        if roll < 0.10 or not sids:
+            sids.append(manager.login(rng.choice(users)))
+        elif roll < 0.15:
+            manager.end(sids.pop(rng.randrange(len(sids))))
+        else:
+            manager.get(rng.choice(sids))
+
+
+def hammer(manager, threads, ops, users):
+    workers = [threading.Thread(target=workload, args=(manager, users, ops, seed)) for seed in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return threads * ops / (time.perf_counter() - started)
+
+
+def check_memory(backend, users, maxsize):
+    indexed = {sid for user in users for sid in backend.sids_for_user(str(user.id))}
+    stored = {sid for _, data in backend._sessions for sid in data}
+    if indexed != stored:
+        raise AssertionError(f"индекс по пользователю расходится с сессиями: "
+                             f"{len(indexed - stored)} лишних, {len(stored - indexed)} потерянных")
+    if len(backend) > maxsize:
+        raise AssertionError(f"{len(backend)} сессий при пределе {maxsize}")
+
+
+def check_ttl(manager):
+    user = make_user(-1)
+    sid = manager.login(user, ttl=0.05)
+    if manager.get(sid) is None:
+        raise AssertionError("свежая сессия не найдена")
+    time.sleep(0.1)
+    if manager.get(sid) is not None or manager.sessions_for(user):
+        raise AssertionError("просроченная сессия всё ещё видна")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Хранилища сессий под многопоточной нагрузкой')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=20000, help='операций на поток')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--maxsize', type=int, default=5000)
+    parser.add_argument('--sql-ops', type=int, default=1000, help='операций на поток для SqlBackend')
+    args = parser.parse_args()
+
+    users = [make_user(i) for i in range(args.users)]
+    manager = SessionManager()
+
+    for stripes in (1, 16):
+        backend = MemoryBackend(maxsize=args.maxsize, stripes=stripes)
+        manager.use_backend(backend)
+        rate = hammer(manager, args.threads, args.ops, users)
+        check_memory(backend, users, args.maxsize)
+        check_ttl(manager)
+        print(f"memory, полос {stripes:>2}: {rate:10.0f} операций/с, сессий {len(backend)}, "
+              f"вытеснено LRU {backend.evicted}")
+
+    from db import make_engine
+    from migrations import upgrade
+    with tempfile.TemporaryDirectory() as workdir:
+        engine = make_engine('production', f"sqlite:///{workdir}/sessions.db")
+        upgrade(engine)
+        manager.use_backend(SqlBackend(engine, maxsize=args.maxsize, trim_every=100))
+        rate = hammer(manager, args.threads, args.sql_ops, users)
+        check_ttl(manager)
+        print(f"sql (SQLite, WAL):  {rate:10.0f} операций/с, сессий {len(manager)}")
+        engine.dispose()
@@ -0,0 +1,109 @@
+# benchmarks/startup.py: холодный старт — сколько стоит импорт модулей и запуск воркера до первого ответа.
+# Каждый замер — новый интерпретатор, БД — небольшая синтетическая (benchmarks.datagen);
+# разбивка по модулям — из отдельного прогона с -X importtime (он сам замедляет импорт).
+# --against REV прогоняет те же сценарии на коде из git-ревизии (git archive) для сравнения «до/после».
+#   python -m benchmarks.startup --runs 10
+#   python -m benchmarks.startup --runs 10 --against HEAD~1
+import argparse
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.datagen import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# воркер: приложение (фабрика, если она есть в этой ревизии) + первый запрос, которому нужна БД
+WORKER = """
+import app as module
+application = module.create_app() if hasattr(module, 'create_app') else module.app
+client = application.test_client()
+assert client.post('/login', data={'email': 'admin', 'password': 'admin'}).status_code == 302
+"""
+
+SCENARIOS = {
+    'python': 'pass',
+    'import db': 'import db',
+    'import app': 'import app',
+    'import main': 'import main',
+    'worker': WORKER,
+}
+
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def run_once(code, cwd, env, importtime=False):
+    command = [sys.executable, '-X', 'importtime', '-c', code] if importtime else [sys.executable, '-c', code]
+    started = time.perf_counter()
+    proc = subprocess.run(command, cwd=cwd, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"{code!r} в {cwd}: {proc.stderr.strip().splitlines()[-1]}")
+    return elapsed, proc.stderr
+
+
+def project_modules(importtime_log, cwd):
+    """(модуль, собственное время мс) для модулей проекта из вывода -X importtime."""
+    local = {name[:-3] for name in os.listdir(cwd) if name.endswith('.py')}
+    rows = []
+    for self_us, _, _, name in IMPORT_LINE.findall(importtime_log):
+        if name in local:
+            rows.append((name, int(self_us) / 1000))
+    return sorted(rows, key=lambda row: -row[1])
+
+
+def measure(cwd, runs, env):
+    results = {}
+    for name, code in SCENARIOS.items():
+        timings = [run_once(code, cwd, env)[0] for _ in range(runs)]
+        results[name] = statistics.median(timings) * 1000
+    return results, run_once(WORKER, cwd, env, importtime=True)[1]
+
+
+def checkout(rev, workdir):
+    target = os.path.join(workdir, 'rev')
+    os.makedirs(target)
+    archive = subprocess.run(['git', 'archive', rev], cwd=ROOT, capture_output=True, check=True).stdout
+    subprocess.run(['tar', '-x', '-C', target], input=archive, check=True)
+    return target
+
+
+def report(label, results, importtime_log, cwd, top):
+    base = results['python']
+    print(f"\n{label}")
+    for name, ms in results.items():
+        extra = '' if name == 'python' else f"   (+{ms - base:7.1f} мс к пустому интерпретатору)"
+        print(f"  {name:<12} {ms:8.1f} мс{extra}")
+    modules = project_modules(importtime_log, cwd)[:top]
+    if modules:
+        print("  модули проекта на старте воркера (собственное время импорта):")
+        for module, ms in modules:
+            print(f"    {module:<14} {ms:6.1f} мс")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Холодный старт: импорт и первый запрос воркера')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--against', help='git-ревизия для сравнения, например HEAD~1')
+    parser.add_argument('--top', type=int, default=8, help='сколько модулей проекта показать')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='crm-startup-')
+    try:
+        path = os.path.join(workdir, 'crm.db')
+        generate(path, users=100, orders=1000, audit=0)
+        env = dict(os.environ, CRM_DATABASE_URL=f"sqlite:///{path}")
+        targets = [('текущий код', ROOT)]
+        if args.against:
+            targets.insert(0, (args.against, checkout(args.against, workdir)))
+        for label, cwd in targets:
+            # первый прогон прогревает .pyc и файловый кэш, в замер не идёт
+            run_once('import app', cwd, env)
+            report(label, *measure(cwd, args.runs, env), cwd, args.top)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
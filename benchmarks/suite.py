@@ -0,0 +1,303 @@
+# benchmarks/suite.py: воспроизводимый набор сценариев на синтетической БД (benchmarks.datagen)
+# с результатами в JSON и сравнением с сохранённым базовым прогоном.
+# HTTP-сценарии идут через тестовый клиент Flask (без сети), Python-сценарии — напрямую.
+#   python -m benchmarks.suite run --orders 100000 --out baseline.json
+#   python -m benchmarks.suite run --orders 100000 --out new.json --baseline baseline.json
+#   python -m benchmarks.suite compare baseline.json new.json --threshold 0.15
+# compare (и run с --baseline) завершается с кодом 1, если есть регрессии.
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+from benchmarks.datagen import END, generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> фабрика (ctx, rng) -> операция без аргументов; порядок важен: пишущие сценарии — в конце
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(factory):
+        SCENARIOS[name] = factory
+        return factory
+    return register
+
+
+class Context:
+    """Тестовый клиент под admin и сведения о сгенерированных данных."""
+    def __init__(self, app, data):
+        self.app = app
+        self.data = data
+        self.client = app.test_client()
+        self.client.post('/login', data={'email': 'admin', 'password': 'admin'})
+        self.statuses = {}
+
+    def get(self, path, method='GET', **kwargs):
+        with self.client.open(path, method=method, **kwargs) as response:
+            response.get_data()      # потоковые ответы дочитываются целиком
+        self.statuses[response.status_code] = self.statuses.get(response.status_code, 0) + 1
+
+
+def _day(rng, span=0):
+    return END - timedelta(days=rng.randrange(300) + span)
+
+
+# --- HTTP ---
+
+@scenario('http.sales_data')
+def _sales_data(ctx, rng):
+    # 50 разных диапазонов: первые обращения — промахи кэша, дальше — попадания, как в живом трафике
+    ranges = [(_day(rng, 90), rng.choice((7, 30, 90)), rng.choice(('day', 'week', 'month'))) for _ in range(50)]
+    paths = [f"/api/sales_data?from={start}&to={start + timedelta(days=days)}&bucket={bucket}"
+             for start, days, bucket in ranges]
+    return lambda: ctx.get(rng.choice(paths))
+
+
+@scenario('http.orders')
+def _orders(ctx, rng):
+    return lambda: ctx.get('/orders')
+
+
+@scenario('http.admin')
+def _admin(ctx, rng):
+    return lambda: ctx.get('/admin')
+
+
+@scenario('http.admin_api_orders')
+def _admin_api_orders(ctx, rng):
+    statuses = ('', 'Создан', 'Завершен')
+    return lambda: ctx.get(f"/admin/api/orders?limit=50&status={rng.choice(statuses)}")
+
+
+@scenario('http.export_reports')
+def _export_reports(ctx, rng):
+    def op():
+        start = _day(rng, 7)
+        ctx.get(f"/export_reports?from={start}&to={start + timedelta(days=7)}")
+    return op
+
+
+@scenario('http.sales_data_304')
+def _sales_data_304(ctx, rng):
+    # опрос дашборда без изменений в данных: If-None-Match -> 304, rollup не читается
+    path = '/api/sales_data?bucket=month'
+    etag = ctx.client.get(path).headers.get('ETag')
+    return lambda: ctx.get(path, headers={'If-None-Match': etag} if etag else {})
+
+
+@scenario('http.create_order')
+def _create_order(ctx, rng):
+    strategies = ('none', 'vip', 'volume')
+    return lambda: ctx.get('/create_order', method='POST', data={
+        'amount': rng.randint(100, 5000), 'strategy': rng.choice(strategies),
+        'insurance': rng.choice(('on', '')), 'priority': rng.choice(('on', ''))})
+
+
+@scenario('http.bulk_status')
+def _bulk_status(ctx, rng):
+    # массовая смена статуса: 200 случайных заказов -> «В обработке»; часть уже не может туда
+    # перейти и возвращается в rejected — как в живом трафике склада
+    first, last = ctx.data.get('first_order', 1), ctx.data.get('last_order', 1000)
+    return lambda: ctx.get('/api/orders/bulk_status', method='POST', json={
+        'order_ids': [rng.randint(first, last) for _ in range(200)], 'status': 'В обработке'})
+
+
+# --- чистый Python ---
+
+@scenario('py.order_pricing')
+def _order_pricing(ctx, rng):
+    from order import DISCOUNT_STRATEGIES, build_order
+    specs = [([{'price': rng.randint(10, 500), 'quantity': rng.randint(1, 3)} for _ in range(rng.randint(1, 20))],
+              rng.random() < 0.2, rng.choice((None, *DISCOUNT_STRATEGIES)),
+              rng.random() < 0.3, rng.random() < 0.3)
+             for _ in range(1000)]
+
+    def op():
+        for items, is_vip, strategy, insurance, priority in specs:
+            build_order(items, is_vip, strategy, insurance, priority).get_price()
+    return op
+
+
+@scenario('py.report_builder')
+def _report_builder(ctx, rng):
+    from reports import ReportBuilder, FinancialReportFactory, LogisticsReportFactory, report_cache
+
+    def op():
+        report_cache.clear()        # каждый раз полный пересчёт агрегатов
+        start = _day(rng, 90)
+        builder = ReportBuilder(rng.choice((FinancialReportFactory, LogisticsReportFactory))())
+        builder.set_date_range(start, start + timedelta(days=90))
+        builder.build_summary()
+        builder.build_detailed()
+    return op
+
+
+def _sql_queries(metrics):
+    return sum(m.sql_queries for m in metrics.endpoints.values())
+
+
+def run_scenario(ctx, name, iterations, warmup, seed):
+    from metrics import metrics
+    op = SCENARIOS[name](ctx, random.Random(f"{seed}:{name}"))
+    for _ in range(warmup):
+        op()
+    ctx.statuses = {}
+    queries = _sql_queries(metrics)
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        op()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    errors = sum(count for status, count in ctx.statuses.items() if status >= 400)
+    result = {
+        'iterations': iterations,
+        'median_ms': statistics.median(timings) * 1000,
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        'mean_ms': statistics.fmean(timings) * 1000,
+        'min_ms': timings[0] * 1000,
+        'errors': errors,
+    }
+    if ctx.statuses:
+        result['statuses'] = {str(k): v for k, v in sorted(ctx.statuses.items())}
+        result['sql_per_op'] = (_sql_queries(metrics) - queries) / iterations
+    return result
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='crm-bench-')
+    try:
+        path = os.path.join(workdir, 'crm.db')
+        # до первого импорта db.py: он читает CRM_DATABASE_URL при импорте.
+        # Фоновые очереди синхронны, чтобы их потоки не добавляли шум в замеры.
+        os.environ.update(CRM_DATABASE_URL=f"sqlite:///{path}", CRM_AUDIT_MODE='sync',
+                          CRM_NOTIFY_MODE='sync', CRM_OUTBOX_MODE='sync')
+        if args.db:
+            shutil.copy(args.db, path)
+            data = {'source': args.db}
+        else:
+            data = generate(path, args.users, args.orders, args.audit, seed=args.seed)
+            print(f"данные: {args.users} пользователей, {args.orders} заказов, {args.audit} аудита "
+                  f"за {data['seconds']:.1f} с")
+        # без релея уведомлений: консольные наблюдатели не печатают в замеры,
+        # события остаются в outbox недоставленными (checkpoint не двигается)
+        from app import create_app
+        app = create_app({'OUTBOX_RELAY': False})
+        logging.getLogger('crm.metrics').setLevel(logging.ERROR)
+        app.logger.disabled = True
+        ctx = Context(app, data)
+
+        names = [name for name in SCENARIOS if not args.only or any(name.startswith(p) for p in args.only)]
+        results = {}
+        for name in names:
+            results[name] = result = run_scenario(ctx, name, args.iterations, args.warmup, args.seed)
+            extra = f"   SQL/оп {result['sql_per_op']:.1f}" if 'sql_per_op' in result else ''
+            errors = f"   ошибок {result['errors']} {result['statuses']}" if result['errors'] else ''
+            print(f"{name:<24} медиана {result['median_ms']:9.3f} мс   p95 {result['p95_ms']:9.3f} мс{extra}{errors}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'params': {k: v for k, v in vars(args).items() if k not in ('func', 'out', 'baseline')},
+            'data': {k: v for k, v in data.items() if k != 'seconds'},
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=0.10, min_delta_ms=0.05):
+    """-> [(сценарий, было мс, стало мс, изменение, вердикт)]; вердикт 'регрессия' — если медиана
+    выросла больше чем на threshold (и больше чем на min_delta_ms) или выросло число SQL на операцию."""
+    rows = []
+    for name, cur in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            rows.append((name, None, cur['median_ms'], None, 'новый'))
+            continue
+        change = cur['median_ms'] / base['median_ms'] - 1 if base['median_ms'] else 0.0
+        if cur['errors'] or base['errors']:
+            verdict = 'ошибки'
+        elif cur.get('sql_per_op', 0) > base.get('sql_per_op', 0) + 0.01:
+            verdict = 'регрессия'
+        elif change > threshold and cur['median_ms'] - base['median_ms'] > min_delta_ms:
+            verdict = 'регрессия'
+        elif change < -threshold:
+            verdict = 'ускорение'
+        else:
+            verdict = 'без изменений'
+        rows.append((name, base['median_ms'], cur['median_ms'], change, verdict))
+    return rows
+
+
+def print_comparison(rows, baseline, current):
+    print(f"\nсравнение: {baseline['meta'].get('revision')} -> {current['meta'].get('revision')}")
+    for name, before, after, change, verdict in rows:
+        before = f"{before:9.3f}" if before is not None else ' ' * 9
+        change = f"{change:+7.1%}" if change is not None else ' ' * 7
+        print(f"{name:<24} {before} -> {after:9.3f} мс  {change}  {verdict}")
+    return any(row[4] == 'регрессия' for row in rows)
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Набор замеров CRM с JSON-результатами')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='сгенерировать данные и прогнать сценарии')
+    run_parser.add_argument('--users', type=int, default=1000)
+    run_parser.add_argument('--orders', type=int, default=100000)
+    run_parser.add_argument('--audit', type=int, default=20000)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--db', help='готовая БД вместо генерации (копируется во временный каталог)')
+    run_parser.add_argument('--iterations', type=int, default=200)
+    run_parser.add_argument('--warmup', type=int, default=20)
+    run_parser.add_argument('--only', nargs='*', help='префиксы сценариев, например http. py.report')
+    run_parser.add_argument('--out', help='куда сохранить JSON')
+    run_parser.add_argument('--baseline', help='JSON прошлого прогона для сравнения')
+    run_parser.add_argument('--threshold', type=float, default=0.10)
+
+    compare_parser = commands.add_parser('compare', help='сравнить два JSON')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        current = run(args)
+        if args.out:
+            with open(args.out, 'w', encoding='utf-8') as f:
+                json.dump(current, f, ensure_ascii=False, indent=2)
+        baseline = _load(args.baseline) if args.baseline else None
+    else:
+        baseline, current = _load(args.baseline), _load(args.current)
+    if baseline is not None:
+        regressed = print_comparison(compare(baseline, current, args.threshold), baseline, current)
+        sys.exit(1 if regressed else 0)
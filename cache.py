@@ -0,0 +1,61 @@
+# cache.py: потокобезопасный in-process кэш LRU + TTL
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """LRU-кэш с ограничением размера и временем жизни записей.
+
+    generation увеличивается при каждой инвалидации: результат, посчитанный
+    до неё, можно не класть в кэш (set(..., generation=...)).
+    """
+    def __init__(self, maxsize=128, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return  # между вычислением и записью была инвалидация
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self.generation += 1
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """Удаляет все записи, ключ которых удовлетворяет predicate(key)."""
+        with self._lock:
+            self.generation += 1
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
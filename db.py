@@ -1,20 +1,108 @@
 """
 Модуль db.py: настройка SQLAlchemy и ORM-моделей для полноценной CRM
 """
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy import create_engine, event, func, select, Index, Column, Integer, Float, String, Boolean, Date, DateTime, ForeignKey
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 import datetime
-from sqlalchemy.exc import IntegrityError
+import os
+import threading
+from sqlalchemy.exc import IntegrityError, OperationalError
 import hashlib
-# 1) Настройка подключения к SQLite
-DATABASE_URL = "sqlite:///crm.db"
-engine = create_engine(DATABASE_URL, echo=True)
-SessionLocal = sessionmaker(bind=engine)
+# 1) Настройка подключения к SQLite: профиль движка выбирается переменной окружения CRM_ENV
+DATABASE_URL = os.environ.get('CRM_DATABASE_URL', "sqlite:///crm.db")
+
+ENGINE_PROFILES = {
+    # WAL: читатели не блокируются писателем; synchronous=NORMAL безопасен в режиме WAL
+    'production': {
+        'echo': False,
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_timeout': 30,
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,          # мс ожидания блокировки вместо «database is locked»
+            'mmap_size': 268435456,        # 256 МБ
+            'cache_size': -65536,          # 64 МБ (отрицательное значение — в КиБ)
+            'temp_store': 'MEMORY',
+        },
+    },
+    'development': {
+        'echo': True,
+        'pool_size': 5,
+        'max_overflow': 5,
+        'pool_timeout': 30,
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+        },
+    },
+    'test': {
+        'echo': False,
+        'pool_size': 2,
+        'max_overflow': 2,
+        'pool_timeout': 10,
+        'pragmas': {'busy_timeout': 5000},
+    },
+}
+
+
+def make_engine(profile=None, url=DATABASE_URL):
+    """Создаёт движок по профилю (имя из ENGINE_PROFILES или dict); PRAGMA ставятся на каждое соединение."""
+    if not isinstance(profile, dict):
+        profile = ENGINE_PROFILES[profile or os.environ.get('CRM_ENV', 'production')]
+    eng = create_engine(
+        url,
+        echo=profile['echo'],
+        pool_size=profile['pool_size'],
+        max_overflow=profile['max_overflow'],
+        pool_timeout=profile['pool_timeout'],
+        connect_args={'check_same_thread': False},
+    )
+    install_pragmas(eng, profile['pragmas'])
+    return eng
+
+
+def install_pragmas(eng, pragmas):
+    """PRAGMA профиля выполняются на каждом новом соединении пула (в т.ч. у async-движка)."""
+    @event.listens_for(eng, 'connect')
+    def _apply_pragmas(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+# Движок создаётся при первом обращении (get_engine() или db.engine), а не при импорте:
+# импорт моделей из CLI, тестов и бенчмарков не трогает БД и не читает профиль
+_engine = None
+_engine_lock = threading.Lock()
+SessionLocal = sessionmaker()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = make_engine()
+                SessionLocal.configure(bind=_engine)
+    return _engine
+
+
+def __getattr__(name):
+    # from db import engine — как раньше, но движок создаётся лениво
+    if name == 'engine':
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 Base = declarative_base()
 
 
 def seed_admin():
+    get_engine()
     db = SessionLocal()
     try:
         admin = User(
@@ -38,7 +126,7 @@ class User(Base):
     name = Column(String, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
-    role = Column(String, nullable=False)
+    role = Column(String, nullable=False, index=True)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
@@ -52,6 +140,16 @@ class Order(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     user = relationship("User", back_populates="orders")
 
+    # индексы под горячие запросы: заказы пользователя, фильтр по статусу, диапазон дат
+    __table_args__ = (
+        Index('ix_orders_user_created', 'user_id', 'created_at'),
+        Index('ix_orders_status_created', 'status', 'created_at'),
+        Index('ix_orders_created_at', 'created_at'),
+    )
+
+# индекс по выражению — для GROUP BY date(created_at) (пересборка и сверка rollup)
+Index('ix_orders_created_date', func.date(Order.created_at))
+
 User.orders = relationship("Order", order_by=Order.id, back_populates="user")
 
 class Audit(Base):
@@ -64,25 +162,93 @@ class Audit(Base):
     performed_by = Column(Integer, nullable=True) # user_id, кто сделал
     timestamp  = Column(DateTime, default=datetime.datetime.now)
 
-def log_audit(entity, entity_id, action, detail=None, performed_by=None):
-    db = SessionLocal()
+    __table_args__ = (
+        Index('ix_audit_timestamp', 'timestamp'),
+        Index('ix_audit_entity_ts', 'entity', 'entity_id', 'timestamp'),
+    )
+
+# Rollup продаж: одна строка на (день, статус), ведётся инкрементально (см. sales.py)
+class DailySales(Base):
+    __tablename__ = 'daily_sales'
+    day          = Column(Date, primary_key=True)
+    status       = Column(String, primary_key=True)
+    orders_count = Column(Integer, nullable=False, default=0)
+    total_sum    = Column(Float, nullable=False, default=0)
+
+# Transactional outbox: события смены статуса пишутся в той же транзакции, что и заказ,
+# и доставляются наблюдателям фоновым релеем (см. outbox.py)
+class OutboxEvent(Base):
+    __tablename__ = 'outbox'
+    id           = Column(Integer, primary_key=True)   # порядок доставки
+    order_id     = Column(Integer, nullable=False, index=True)
+    event        = Column(String, nullable=False)      # 'status_change'
+    status       = Column(String, nullable=False)
+    old_status   = Column(String, nullable=True)
+    recipient    = Column(Integer, nullable=True)      # user_id владельца заказа
+    performed_by = Column(Integer, nullable=True)
+    created_at   = Column(DateTime, default=datetime.datetime.now)
+
+    # AUTOINCREMENT: id не переиспользуются после prune, иначе новые события окажутся ниже checkpoint
+    __table_args__ = {'sqlite_autoincrement': True}
+
+# High-watermark релея: id последнего доставленного события
+class OutboxCheckpoint(Base):
+    __tablename__ = 'outbox_checkpoint'
+    name       = Column(String, primary_key=True)
+    last_id    = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.now)
+    # аренда пачки: релей, который сейчас доставляет события после last_id, и срок (unix-секунды)
+    lease_owner = Column(String, nullable=True)
+    lease_until = Column(Float, nullable=True)
+
+# Сессии пользователей для session.SqlBackend (CRM_SESSION_BACKEND=sql): общие для всех воркеров
+class WebSession(Base):
+    __tablename__ = 'web_sessions'
+    sid        = Column(String, primary_key=True)
+    user_key   = Column(String, nullable=False, index=True)   # id пользователя (или email)
+    name       = Column(String)
+    email      = Column(String)
+    role       = Column(String)
+    created_at = Column(Float, nullable=False)                 # time.time(): сравнимо между процессами
+    ttl        = Column(Float, nullable=False)                 # секунды; продлевается на ttl при обращении
+    expires_at = Column(Float, nullable=False, index=True)
+
+# Версии данных для условных GET (см. versions.py): триггеры SQLite увеличивают version
+# на каждую запись в таблицу из VERSIONED_TABLES, changed_at — время последней записи (unix)
+VERSIONED_TABLES = ('orders', 'users', 'audit')
+
+class DataVersion(Base):
+    __tablename__ = 'data_version'
+    name       = Column(String, primary_key=True)     # имя отслеживаемой таблицы
+    version    = Column(Integer, nullable=False, default=0)
+    changed_at = Column(Float, nullable=False)
+
+def data_versions_query(tables):
+    """SELECT (имя, версия) таблиц tables — для ключей in-process кэшей поверх этих таблиц."""
+    return select(DataVersion.name, DataVersion.version).where(DataVersion.name.in_(tables)).order_by(DataVersion.name)
+
+def data_versions(db, tables):
+    """((имя, версия), ...) в сессии db; () — БД ещё не обновлена миграцией 5.
+
+    Читать до самих данных: тогда запись в кэше под версией v содержит все записи вплоть до v,
+    и ответ с ETag этой версии (versions.py) не бывает старше него. Запись из другого воркера
+    или чтение между коммитом и сбросом кэша дают промах, а не старые данные под новым ETag.
+    """
     try:
-        entry = Audit(
-          entity=entity,
-          entity_id=entity_id,
-          action=action,
-          detail=detail,
-          performed_by=performed_by
-        )
-        db.add(entry)
-        db.commit()
-    finally:
-        db.close()
+        return tuple(map(tuple, db.execute(data_versions_query(tables))))
+    except OperationalError:
+        return ()
+
+def log_audit(entity, entity_id, action, detail=None, performed_by=None):
+    """Ставит запись в очередь AuditSink: запись в БД идёт пачками (см. audit.py)."""
+    from audit import audit_sink
+    audit_sink.submit(entity, entity_id, action, detail=detail, performed_by=performed_by)
 
 
-# 4) Функция инициализации базы (создаёт таблицы)
+# 4) Функция инициализации базы: новая БД создаётся целиком, существующая — обновляется миграциями
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    from migrations import upgrade
+    upgrade(get_engine())
 
 # 5) Утилиты для работы с сессиями БД
 class DbSessionManager:
@@ -90,14 +256,16 @@ class DbSessionManager:
         self.db = None
 
     def __enter__(self):
+        get_engine()
         self.db = SessionLocal()
         return self.db
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.db.close()
 
-# Пример инициализации при первом запуске
+# Однократная инициализация перед первым запуском (и после обновления кода):
+#   python db.py  — схема по миграциям + default admin; приложение само этого больше не делает
 if __name__ == '__main__':
     init_db()
-    Base.metadata.create_all(bind=engine)  # чтобы создалась таблица audit
+    seed_admin()
     print("База данных и таблицы созданы")
@@ -0,0 +1,47 @@
+# db_async.py: асинхронный слой БД рядом с DbSessionManager (SQLAlchemy asyncio + aiosqlite)
+# Модели, URL и профили движка — общие с db.py; используется ASGI-режимом (asgi.py).
+import os
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from db import DATABASE_URL, ENGINE_PROFILES, install_pragmas
+
+
+def async_url(url=DATABASE_URL):
+    """sqlite:///crm.db -> sqlite+aiosqlite:///crm.db"""
+    if url.startswith('sqlite://'):
+        return 'sqlite+aiosqlite://' + url[len('sqlite://'):]
+    return url
+
+
+def make_async_engine(profile=None, url=DATABASE_URL):
+    """Async-движок по тому же профилю, что и make_engine()."""
+    if not isinstance(profile, dict):
+        profile = ENGINE_PROFILES[profile or os.environ.get('CRM_ENV', 'production')]
+    eng = create_async_engine(
+        async_url(url),
+        echo=profile['echo'],
+        pool_size=profile['pool_size'],
+        max_overflow=profile['max_overflow'],
+        pool_timeout=profile['pool_timeout'],
+    )
+    # события пула висят на синхронном «двойнике» async-движка
+    install_pragmas(eng.sync_engine, profile['pragmas'])
+    return eng
+
+
+async_engine = make_async_engine()
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+
+class AsyncDbSessionManager:
+    """async with AsyncDbSessionManager() as db: ... — аналог DbSessionManager для корутин."""
+    def __init__(self):
+        self.db = None
+
+    async def __aenter__(self):
+        self.db = AsyncSessionLocal()
+        return self.db
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.db.close()
@@ -0,0 +1,50 @@
+# events.py: лёгкие хуки событий вместо print() на горячих путях.
+# Пока нет подписчиков, enabled == False и вызывающий код не тратит время даже
+# на форматирование сообщения:
+#     if events.enabled:
+#         events.emit('order.addon', f"Добавлена страховка: +{fee}", addon='insurance', fee=fee)
+import logging
+import os
+
+logger = logging.getLogger('crm.events')
+
+enabled = False
+_subscribers = []
+
+
+def subscribe(handler):
+    """handler(name, message, fields) вызывается синхронно на каждое событие."""
+    global enabled
+    _subscribers.append(handler)
+    enabled = True
+    return handler
+
+
+def unsubscribe(handler):
+    global enabled
+    _subscribers.remove(handler)
+    enabled = bool(_subscribers)
+
+
+def emit(name, message, **fields):
+    for handler in list(_subscribers):
+        handler(name, message, fields)
+
+
+# --- готовые подписчики ---
+
+def log_event(name, message, fields):
+    """Структурированная запись в logging: поля события — в record.event / record.fields."""
+    logger.info(message, extra={'event': name, 'fields': fields})
+
+
+def print_event(name, message, fields):
+    """Вывод в консоль, как раньше делали print() — для CLI и демо."""
+    print(message)
+
+
+# CRM_EVENTS=log — писать события в logging, CRM_EVENTS=print — в stdout
+if os.environ.get('CRM_EVENTS') == 'log':
+    subscribe(log_event)
+elif os.environ.get('CRM_EVENTS') == 'print':
+    subscribe(print_event)
@@ -0,0 +1,95 @@
+# export.py: потоковая выгрузка заказов в CSV (батчами, без загрузки всей таблицы в память)
+import csv
+import io
+import zlib
+from datetime import timedelta
+from sqlalchemy import select
+
+from db import DbSessionManager, User, Order as OrderModel
+from users import role_values
+
+CSV_HEADER = ['Order ID', 'User', 'Role', 'Total', 'Status', 'Created At']
+
+
+def orders_export_query(date_from=None, date_to=None, status=None, role=None):
+    """SELECT заказов с JOIN на users; date_to включительно."""
+    q = (
+        select(OrderModel.id, User.name, User.role, OrderModel.total,
+               OrderModel.status, OrderModel.created_at)
+        .outerjoin(User, User.id == OrderModel.user_id)
+    )
+    if date_from:
+        q = q.where(OrderModel.created_at >= date_from)
+    if date_to:
+        q = q.where(OrderModel.created_at < date_to + timedelta(days=1))
+    if status:
+        q = q.where(OrderModel.status == status)
+    if role:
+        q = q.where(User.role.in_(role_values(role)))
+    return q.order_by(OrderModel.id)
+
+
+def _csv_chunk(buf, writer, rows):
+    buf.seek(0)
+    buf.truncate()
+    for order_id, name, role, total, status, created_at in rows:
+        writer.writerow([
+            order_id,
+            name or '',
+            role or '',
+            total,
+            status,
+            created_at.strftime('%Y-%m-%d %H:%M') if created_at else ''
+        ])
+    return buf.getvalue()
+
+
+def _csv_header(buf, writer):
+    writer.writerow(CSV_HEADER)
+    return buf.getvalue()
+
+
+def iter_orders_csv(batch_size=1000, **filters):
+    """Генератор CSV-фрагментов: один фрагмент на батч из batch_size строк."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=';')
+    yield _csv_header(buf, writer)
+
+    # сессия живёт, пока клиент читает ответ
+    with DbSessionManager() as db:
+        query = orders_export_query(**filters).execution_options(yield_per=batch_size)
+        for rows in db.execute(query).partitions():
+            yield _csv_chunk(buf, writer, rows)
+
+
+async def aiter_orders_csv(batch_size=1000, **filters):
+    """Асинхронный вариант iter_orders_csv для ASGI-режима (AsyncSession, серверный курсор)."""
+    from db_async import AsyncDbSessionManager
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=';')
+    yield _csv_header(buf, writer)
+
+    async with AsyncDbSessionManager() as db:
+        result = await db.stream(orders_export_query(**filters).execution_options(yield_per=batch_size))
+        async for rows in result.partitions():
+            yield _csv_chunk(buf, writer, rows)
+
+
+def gzip_stream(chunks):
+    """Потоково сжимает текстовые фрагменты в gzip."""
+    compressor = zlib.compressobj(wbits=31)   # 31 = gzip-заголовок
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def agzip_stream(chunks):
+    """gzip_stream для асинхронного потока фрагментов."""
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
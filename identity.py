@@ -0,0 +1,91 @@
+# identity.py: кэш пользователей по id и по email — без запроса к БД на каждую проверку доступа
+# Записи живут CRM_IDENTITY_TTL секунд (по умолчанию 60) и сбрасываются при любой записи
+# в users через ORM-сессию: новая роль действует со следующего запроса, а не со следующего входа.
+import os
+from collections import namedtuple
+from itertools import chain
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from cache import TTLCache
+from db import DbSessionManager, User
+
+Identity = namedtuple('Identity', 'id name email role is_active hashed_password')
+
+identity_cache = TTLCache(maxsize=4096, ttl=float(os.environ.get('CRM_IDENTITY_TTL', 60)))
+
+_COLUMNS = (User.id, User.name, User.email, User.role, User.is_active, User.hashed_password)
+
+
+def _load(criterion):
+    generation = identity_cache.generation
+    with DbSessionManager() as db:
+        row = db.execute(select(*_COLUMNS).where(criterion)).first()
+    if row is None:
+        return None
+    identity = Identity(*row)
+    # запись, прочитанная до инвалидации, в кэш не попадёт (generation)
+    identity_cache.set(('id', identity.id), identity, generation=generation)
+    identity_cache.set(('email', identity.email), identity, generation=generation)
+    return identity
+
+
+def by_id(user_id):
+    """Identity по id пользователя или None."""
+    if user_id is None:
+        return None
+    return identity_cache.get(('id', user_id)) or _load(User.id == user_id)
+
+
+def by_email(email):
+    """Identity по email или None (отсутствие не кэшируется)."""
+    if not email:
+        return None
+    return identity_cache.get(('email', email)) or _load(User.email == email)
+
+
+def invalidate(keys):
+    if keys:
+        identity_cache.invalidate_where(lambda key: key in keys)
+
+
+def stats():
+    lookups = identity_cache.hits + identity_cache.misses
+    return {
+        'hits': identity_cache.hits,
+        'misses': identity_cache.misses,
+        'hit_ratio': identity_cache.hits / lookups if lookups else 0.0,
+        'size': len(identity_cache),
+    }
+
+
+# --- инвалидация: все ORM-сессии, пишущие в users ---
+
+@event.listens_for(Session, 'after_flush')
+def _collect_user_writes(session, _flush_context):
+    keys = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, User):
+            keys.add(('id', obj.id))
+            keys.add(('email', obj.email))
+            keys.update(('email', old) for old in inspect(obj).attrs.email.history.deleted or ())
+    if keys:
+        session.info.setdefault('identity_keys', set()).update(keys)
+        invalidate(keys)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _invalidate_on_end(session):
+    # повторно после COMMIT: читатель мог между flush и commit закэшировать старую строку
+    invalidate(session.info.pop('identity_keys', None))
+
+
+if __name__ == '__main__':
+    import sys
+    for email in sys.argv[1:] or ['admin']:
+        for _ in range(2):
+            user = by_email(email)
+            print(user and user._replace(hashed_password='***'))
+    print(stats())
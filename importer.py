@@ -0,0 +1,215 @@
+# importer.py: массовый импорт заказов из CSV / JSON Lines
+# Каждая строка оценивается через ConcreteOrder + стратегии скидок + декораторы,
+# пачка пишется одной транзакцией (executemany) с одной агрегированной записью аудита.
+#   python importer.py orders.csv [--format csv|jsonl] [--batch-size 1000] [--performed-by 1]
+import argparse
+import csv
+import io
+import json
+import math
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from db import DbSessionManager, Audit, User, Order as OrderModel
+from order import build_order
+from reports import invalidate_report_cache
+from sales import record_orders_bulk, invalidate_sales_cache
+
+STATUSES = ('Создан', 'В обработке', 'Отправлен', 'Завершен', 'Cloned')
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 'on', 'да')
+# INTEGER SQLite и array('l') позиций — знаковые 64 бита
+MAX_INT = 2 ** 63 - 1
+
+
+def _flag(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in TRUE_VALUES
+
+
+def _number(value, name):
+    """Конечное число: «nan» и «inf» float() принимает, а в orders.total и daily_sales им не место."""
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{name}: ожидалось конечное число, получено {value!r}")
+    return number
+
+
+def _integer(value, name, minimum=1):
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"{name}: ожидалось целое число, получено {value!r}")
+    number = int(value)
+    if not minimum <= number <= MAX_INT:
+        raise ValueError(f"{name}: {number} вне диапазона {minimum}..{MAX_INT}")
+    return number
+
+
+def _items(row):
+    """items: JSON-список цен или словарей {price, quantity}, строка «600|700»; либо одно поле amount."""
+    raw = row.get('items')
+    if raw in (None, ''):
+        raw = [row['amount']] if row.get('amount') not in (None, '') else []
+    elif isinstance(raw, str):
+        raw = raw.split('|')
+    items = []
+    for item in raw:
+        if isinstance(item, dict):
+            quantity = item.get('quantity')
+            items.append({'price': _number(item['price'], 'price'),
+                          'quantity': 1 if quantity in (None, '') else _integer(quantity, 'quantity')})
+        else:
+            items.append({'price': _number(item, 'price')})
+    if not items:
+        raise ValueError("нет позиций (items/amount)")
+    return items
+
+
+def parse_row(row):
+    """Строка файла -> dict для INSERT в orders (user_id/email резолвятся позже)."""
+    if isinstance(row, str):
+        row = json.loads(row)
+    if not isinstance(row, dict):
+        raise ValueError(f"ожидался объект JSON, получено: {type(row).__name__}")
+    status = row.get('status') or 'Создан'
+    if status not in STATUSES:
+        raise ValueError(f"недопустимый статус «{status}»")
+    order = build_order(
+        _items(row),
+        is_vip=_flag(row.get('is_vip')),
+        strategy=row.get('strategy') or None,
+        insurance=_flag(row.get('insurance')),
+        priority=_flag(row.get('priority')),
+    )
+    created_at = row.get('created_at')
+    return {
+        'user_id': _integer(row['user_id'], 'user_id') if row.get('user_id') not in (None, '') else None,
+        'email': row.get('email') or None,
+        'total': _number(order.get_price(), 'total'),
+        'status': status,
+        'created_at': datetime.fromisoformat(created_at) if created_at else datetime.now(),
+    }
+
+
+def iter_rows(stream, fmt='csv', delimiter=';'):
+    """(номер строки, сырая строка): dict для CSV, JSON-текст для JSONL (разбирается в parse_row)."""
+    if fmt == 'jsonl':
+        for line_no, line in enumerate(stream, start=1):
+            if line.strip():
+                yield line_no, line
+    else:
+        # строка 1 — заголовок
+        for line_no, row in enumerate(csv.DictReader(stream, delimiter=delimiter), start=2):
+            yield line_no, row
+
+
+def _resolve_users(db, batch):
+    """Проставляет user_id по email и проверяет, что пользователи существуют."""
+    emails = {r['email'] for _, r in batch if r['email'] and r['user_id'] is None}
+    by_email = {}
+    if emails:
+        by_email = {email: user_id for email, user_id in
+                    db.execute(select(User.email, User.id).where(User.email.in_(emails)))}
+    ids = {r['user_id'] for _, r in batch if r['user_id'] is not None} | set(by_email.values())
+    known = set(db.scalars(select(User.id).where(User.id.in_(ids)))) if ids else set()
+
+    valid, errors = [], []
+    for line_no, r in batch:
+        user_id = r['user_id'] if r['user_id'] is not None else by_email.get(r['email'])
+        if user_id not in known:
+            errors.append((line_no, f"пользователь не найден: {r['user_id'] or r['email']}"))
+            continue
+        valid.append({'user_id': user_id, 'total': r['total'],
+                      'status': r['status'], 'created_at': r['created_at']})
+    return valid, errors
+
+
+def _write_batch(batch, performed_by):
+    """Пачка одной транзакцией; ошибка БД откатывает только её — строки пачки уходят в ошибки."""
+    try:
+        with DbSessionManager() as db:
+            rows, errors = _resolve_users(db, batch)
+            if not rows:
+                return 0, errors
+            db.execute(insert(OrderModel), rows)
+            days = record_orders_bulk(db, rows)
+            db.execute(insert(Audit), [{
+                'entity': 'Order',
+                'entity_id': None,
+                'action': 'bulk_import',
+                'detail': f"rows={len(rows)} total={sum(r['total'] for r in rows)}",
+                'performed_by': performed_by,
+                'timestamp': datetime.now(),
+            }])
+            db.commit()
+    except SQLAlchemyError as exc:
+        cause = getattr(exc, 'orig', None) or exc
+        reason = f"пачка не записана: {type(cause).__name__}: {cause}"
+        return 0, [(line_no, reason) for line_no, _ in batch]
+    for day in days:
+        invalidate_sales_cache(day)
+        invalidate_report_cache(day)
+    return len(rows), errors
+
+
+def import_orders(stream, fmt='csv', batch_size=1000, performed_by=None, delimiter=';'):
+    """Импортирует заказы; ошибочные строки пропускаются и попадают в отчёт."""
+    started = time.perf_counter()
+    report = {'rows_total': 0, 'imported': 0, 'failed': 0, 'batches': 0, 'errors': []}
+    batch = []
+
+    def flush():
+        imported, errors = _write_batch(batch, performed_by)
+        report['imported'] += imported
+        report['errors'].extend(errors)
+        report['batches'] += 1
+        batch.clear()
+
+    for line_no, row in iter_rows(stream, fmt, delimiter):
+        report['rows_total'] += 1
+        try:
+            batch.append((line_no, parse_row(row)))
+        except KeyError as exc:
+            report['errors'].append((line_no, f"нет поля {exc}"))
+            continue
+        except (TypeError, ValueError, OverflowError) as exc:
+            report['errors'].append((line_no, str(exc)))
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    report['errors'].sort()
+    report['failed'] = len(report['errors'])
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    report['rows_per_sec'] = round(report['rows_total'] / report['seconds'], 1) if report['seconds'] else 0.0
+    return report
+
+
+def open_text(stream):
+    """Бинарный поток (загрузка файла) -> текстовый UTF-8 (с BOM или без)."""
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Массовый импорт заказов')
+    parser.add_argument('path', help="CSV или JSONL файл ('-' — stdin)")
+    parser.add_argument('--format', choices=('csv', 'jsonl'))
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--delimiter', default=';')
+    parser.add_argument('--performed-by', type=int)
+    args = parser.parse_args()
+
+    fmt = args.format or ('jsonl' if args.path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    source = open_text(sys.stdin.buffer) if args.path == '-' else open(args.path, encoding='utf-8-sig', newline='')
+    with source:
+        result = import_orders(source, fmt, args.batch_size, args.performed_by, args.delimiter)
+    for line_no, message in result['errors']:
+        print(f"строка {line_no}: {message}")
+    print(f"Импортировано {result['imported']} из {result['rows_total']} "
+          f"за {result['seconds']} с ({result['rows_per_sec']} строк/с), ошибок: {result['failed']}")
+    sys.exit(1 if result['failed'] else 0)
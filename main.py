@@ -1,21 +1,24 @@
-from users import ManagerFactory, ClientFactory, AdminFactory
+from users import ManagerFactory, ClientFactory, AdminFactory, ROLE_ADMIN, normalize_role
 from session import SessionManager
-from reports import ReportBuilder, FinancialReportFactory
 from order import ConcreteOrder, VolumeDiscount, VIPDiscount, InsuranceDecorator, PriorityShippingDecorator
-from payment import StripeAPI, PayPalAPI, StripeAdapter, PayPalAdapter
-from notification import OrderSubject, ClientObserver, ManagerObserver
 from db import init_db, DbSessionManager, User
 # ---- в начале main.py добавить ----
 from db import init_db, DbSessionManager, User, Order
 from getpass import getpass
+import events
 import hashlib
 from db import init_db, seed_admin, DbSessionManager, User, Order
+from sales import record_order_created
 
 # ---- в теле main.py ----
 
-# инициализируем БД и создаём default admin
-init_db()
-seed_admin()
+# Импорт main.py ничего не запускает: БД, вывод событий и демо — только при запуске как скрипта
+if __name__ == "__main__":
+    # CLI показывает события (услуги, платежи, статусы) в консоли, как раньше print()
+    events.subscribe(events.print_event)
+    # инициализируем БД и создаём default admin
+    init_db()
+    seed_admin()
 
 # ---- регистрация возвращает пользователя ----
 def register():
@@ -126,6 +129,8 @@ def create_order(user):
         # сохраняем в БД
         order_record = Order(user_id=user.id, total=total_price)
         db.add(order_record)
+        db.flush()
+        record_order_created(db, order_record)
         db.commit()
         print(f"✔ Заказ создан (id={order_record.id}), итоговая сумма: {total_price}")
 
@@ -167,40 +172,50 @@ if __name__ == "__main__":
             print("Неверный выбор.")
 
 
-# 1. Пользователи и сессии
-manager = ManagerFactory().create_user("Иван", "ivan@example.com")
-client = ClientFactory().create_user("Пётр", "petr@example.com")
-session = SessionManager()
-session.login(manager)
-session.login(client)
-
-# 2. Отчёты
-builder = ReportBuilder(FinancialReportFactory())
-summary = builder.set_date_range("2025-01-01", "2025-05-01").add_filter("Регион=Молдова").build_summary()
-print(summary.content)
-
-# 3. Заказ
-order = ConcreteOrder(items=[{'price': 600}, {'price': 700}], is_vip=True)
-order.set_discount_strategy(VolumeDiscount())
-print("Итог с учётом скидки:", order.get_price())
-
-# 4. Декораторы услуг
-decorated = InsuranceDecorator(order)
-fully_decorated = PriorityShippingDecorator(decorated)
-print("Итог с доп. услугами:", fully_decorated.get_price())
-
-# 5. Платежи
-stripe_proc = StripeAdapter(StripeAPI())
-paypal_proc = PayPalAdapter(PayPalAPI())
-stripe_proc.pay(500)
-paypal_proc.pay(500)
-
-# 6. Уведомления
-order_subj = OrderSubject()
-order_subj.attach(ClientObserver())
-order_subj.attach(ManagerObserver())
-order_subj.update_status("В обработке")
-order_subj.update_status("Завершен")
+def demo():
+    """Демонстрация паттернов: сессии, отчёты, заказ, услуги, платежи, уведомления."""
+    from reports import ReportBuilder, FinancialReportFactory
+    from payment import StripeAPI, PayPalAPI, StripeAdapter, PayPalAdapter
+    from notification import OrderSubject, ClientObserver, ManagerObserver
+
+    # 1. Пользователи и сессии
+    manager = ManagerFactory().create_user("Иван", "ivan@example.com")
+    client = ClientFactory().create_user("Пётр", "petr@example.com")
+    session = SessionManager()
+    session.login(manager)
+    session.login(client)
+
+    # 2. Отчёты
+    builder = ReportBuilder(FinancialReportFactory())
+    summary = builder.set_date_range("2025-01-01", "2025-05-01").add_filter("status=Завершен").build_summary()
+    print(summary.content)
+
+    # 3. Заказ
+    order = ConcreteOrder(items=[{'price': 600}, {'price': 700}], is_vip=True)
+    order.set_discount_strategy(VolumeDiscount())
+    print("Итог с учётом скидки:", order.get_price())
+
+    # 4. Декораторы услуг
+    decorated = InsuranceDecorator(order)
+    fully_decorated = PriorityShippingDecorator(decorated)
+    print("Итог с доп. услугами:", fully_decorated.get_price())
+
+    # 5. Платежи
+    stripe_proc = StripeAdapter(StripeAPI())
+    paypal_proc = PayPalAdapter(PayPalAPI())
+    stripe_proc.pay(500)
+    paypal_proc.pay(500)
+
+    # 6. Уведомления
+    order_subj = OrderSubject()
+    order_subj.attach(ClientObserver())
+    order_subj.attach(ManagerObserver())
+    order_subj.update_status("В обработке")
+    order_subj.update_status("Завершен")
+
+
+if __name__ == "__main__":
+    demo()
 
 if __name__ == "__main__":
     while True:
@@ -216,7 +231,7 @@ if __name__ == "__main__":
             print("Неверный выбор"); continue
 
         if user:
-            if user.role=='admin':
+            if normalize_role(user.role) == ROLE_ADMIN:
                 admin_menu(user)
             else:
                 user_menu(user)
\ No newline at end of file
@@ -0,0 +1,240 @@
+# metrics.py: метрики запросов Flask — время маршрута, число и время SQL, строки, гистограммы
+# install(app) вешает хуки before/after/teardown_request и маршрут /metrics (текстовый формат Prometheus).
+# SQL считается событиями движка SQLAlchemy; запрос, превысивший бюджет CRM_SQL_QUERY_BUDGET
+# (по умолчанию 20 запросов к БД), пишется в лог предупреждением — так видны N+1 (ленивые Order.user в шаблонах).
+# Асинхронные маршруты asgi.py учитываются через metrics.track() в те же метрики.
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import Response, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger('crm.metrics')
+
+# верхние границы корзин гистограммы, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+class RequestStats:
+    """Счётчики одного запроса; живут в request.environ (в asgi.py — в ContextVar), пока запрос обрабатывается."""
+    __slots__ = ('started', 'queries', 'sql_seconds', 'rows', 'status')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.status = 500
+
+
+# запрос корутины asgi.py: задача asyncio держит свой контекст, SQLAlchemy переносит его в greenlet драйвера
+_async_stats = ContextVar('crm_async_request_stats', default=None)
+
+
+def _current():
+    # для Flask — через контекст запроса, а не ContextVar: потоковый ответ (stream_with_context)
+    # выполняет SQL уже после возврата из view, в заново поднятом контексте того же запроса
+    if has_request_context():
+        return request.environ.get('crm.metrics')
+    return _async_stats.get()
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class EndpointMetrics:
+    __slots__ = ('latency', 'queries', 'statuses', 'sql_queries', 'sql_seconds', 'rows', 'over_budget')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.statuses = {}
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.over_budget = 0
+
+
+class Metrics:
+    """Реестр метрик по endpoint Flask + произвольные gauge (кэши, очереди)."""
+    def __init__(self, query_budget=None):
+        self.query_budget = query_budget if query_budget is not None else \
+            int(os.environ.get('CRM_SQL_QUERY_BUDGET', 20))
+        self.endpoints = {}
+        self.gauges = {}        # имя -> (тип, описание, fn() -> число)
+        self._instrumented = set()
+        self._lock = threading.Lock()
+
+    # --- источники данных ---
+
+    def instrument_engine(self, engine):
+        """События SQL движка (для async-движка — его sync_engine) попадают в текущий запрос.
+
+        Можно передать и класс Engine — тогда считаются все движки, в т.ч. созданные позже.
+        """
+        if engine in self._instrumented:
+            return          # create_app() вызван повторно — слушатели уже стоят
+        self._instrumented.add(engine)
+        @event.listens_for(engine, 'before_cursor_execute')
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            if _current() is not None:
+                conn.info.setdefault('crm_query_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            stats = _current()
+            if stats is None or not conn.info.get('crm_query_start'):
+                return
+            stats.sql_seconds += time.perf_counter() - conn.info['crm_query_start'].pop()
+            stats.queries += 1
+            if (context.isupdate or context.isdelete) and cursor.rowcount > 0:
+                stats.rows += cursor.rowcount      # строки, изменённые UPDATE/DELETE
+
+    def instrument_models(self, base):
+        """Строки, загруженные в ORM-объекты (у SELECT в SQLite rowcount не известен)."""
+        if base in self._instrumented:
+            return
+        self._instrumented.add(base)
+        @event.listens_for(base, 'load', propagate=True)
+        def _load(target, context):
+            stats = _current()
+            if stats is not None:
+                stats.rows += 1
+
+    def register(self, name, description, fn, kind='gauge'):
+        """Значение fn() выводится в /metrics как есть (размер очереди, попадания кэша и т.п.)."""
+        self.gauges[name] = (kind, description, fn)
+
+    # --- жизненный цикл запроса ---
+
+    def finish(self, stats, endpoint, path=''):
+        elapsed = time.perf_counter() - stats.started
+        over = stats.queries > self.query_budget
+        with self._lock:
+            m = self.endpoints.get(endpoint)
+            if m is None:
+                m = self.endpoints[endpoint] = EndpointMetrics()
+            m.latency.observe(elapsed)
+            m.queries.observe(stats.queries)
+            m.statuses[stats.status] = m.statuses.get(stats.status, 0) + 1
+            m.sql_queries += stats.queries
+            m.sql_seconds += stats.sql_seconds
+            m.rows += stats.rows
+            m.over_budget += over
+        if over:
+            logger.warning("%s %s: %d SQL-запросов при бюджете %d (%.1f мс в БД) — возможен N+1",
+                           endpoint, path, stats.queries, self.query_budget, stats.sql_seconds * 1000)
+
+    @contextmanager
+    def track(self, endpoint, path=''):
+        """Учёт запроса вне Flask (корутины asgi.py): SQL внутри блока идёт в этот запрос.
+
+        Код ответа вызывающий пишет в stats.status; исключение оставляет 500.
+        """
+        stats = RequestStats()
+        token = _async_stats.set(stats)
+        try:
+            yield stats
+        finally:
+            _async_stats.reset(token)
+            self.finish(stats, endpoint, path)
+
+    def install(self, app):
+        """Хуки Flask и маршрут GET /metrics."""
+        @app.before_request
+        def _metrics_start():
+            request.environ['crm.metrics'] = RequestStats()
+
+        @app.after_request
+        def _metrics_schedule(response):
+            environ = request.environ
+            stats = environ.get('crm.metrics')
+            if stats is not None:
+                stats.status = response.status_code
+                endpoint, path = request.endpoint or 'unmatched', request.path
+                if response.is_streamed:
+                    # потоковый ответ (CSV-выгрузка) читает БД и после view — итог, когда сервер его закроет;
+                    # teardown_request у Flask 3 срабатывает раньше, чем начнётся тело
+                    environ['crm.metrics_deferred'] = True
+                    response.call_on_close(
+                        lambda: self.finish(environ.pop('crm.metrics', stats), endpoint, path))
+                else:
+                    self.finish(environ.pop('crm.metrics'), endpoint, path)
+            return response
+
+        @app.teardown_request
+        def _metrics_unhandled(exc):
+            # исключение, ушедшее из Flask (PROPAGATE_EXCEPTIONS, отладка), минует after_request:
+            # запрос всё равно попадает в метрики — со статусом 500
+            environ = request.environ
+            if 'crm.metrics' in environ and not environ.get('crm.metrics_deferred'):
+                self.finish(environ.pop('crm.metrics'), request.endpoint or 'unmatched', request.path)
+
+        app.add_url_rule('/metrics', 'metrics', lambda: Response(self.render(), mimetype='text/plain; version=0.0.4'))
+
+    # --- экспорт ---
+
+    def render(self):
+        """Текстовый формат Prometheus 0.0.4."""
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            lines = []
+
+            def family(name, kind, description, samples):
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.extend(samples)
+
+            family('crm_http_request_duration_seconds', 'histogram', 'Время обработки запроса',
+                   (s for ep, m in endpoints for s in m.latency.samples(
+                       'crm_http_request_duration_seconds', f'endpoint="{ep}"')))
+            family('crm_http_requests_total', 'counter', 'Запросы по коду ответа',
+                   (f'crm_http_requests_total{{endpoint="{ep}",status="{status}"}} {count}'
+                    for ep, m in endpoints for status, count in sorted(m.statuses.items())))
+            family('crm_sql_queries_per_request', 'histogram', 'SQL-запросов на один HTTP-запрос',
+                   (s for ep, m in endpoints for s in m.queries.samples(
+                       'crm_sql_queries_per_request', f'endpoint="{ep}"')))
+            family('crm_sql_queries_total', 'counter', 'SQL-запросов всего',
+                   (f'crm_sql_queries_total{{endpoint="{ep}"}} {m.sql_queries}' for ep, m in endpoints))
+            family('crm_sql_duration_seconds_total', 'counter', 'Время в SQL',
+                   (f'crm_sql_duration_seconds_total{{endpoint="{ep}"}} {m.sql_seconds:.6f}' for ep, m in endpoints))
+            family('crm_sql_rows_total', 'counter', 'Строк: загружено в ORM-объекты и изменено UPDATE/DELETE',
+                   (f'crm_sql_rows_total{{endpoint="{ep}"}} {m.rows}' for ep, m in endpoints))
+            family('crm_sql_query_budget_exceeded_total', 'counter',
+                   f'Запросы сверх бюджета {self.query_budget} SQL-запросов',
+                   (f'crm_sql_query_budget_exceeded_total{{endpoint="{ep}"}} {m.over_budget}' for ep, m in endpoints))
+        for name, (kind, description, fn) in self.gauges.items():
+            family(name, kind, description, [f'{name} {fn()}'])
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -0,0 +1,213 @@
+# migrations.py: версионированные миграции схемы SQLite (PRAGMA user_version)
+# и проверка планов запросов (EXPLAIN QUERY PLAN) для основных маршрутов.
+#   python migrations.py           — обновить crm.db до последней версии
+#   python migrations.py explain   — упасть, если запрос маршрута делает полный скан
+import re
+import sys
+from datetime import date
+from sqlalchemy import event, inspect, select
+
+from db import (get_engine, Base, DailySales, User, Order as OrderModel, Audit, OutboxEvent, OutboxCheckpoint, WebSession,
+                DataVersion, data_versions_query)
+
+
+def _create_daily_sales(conn):
+    """1: rollup daily_sales; если таблицы не было — заполняем по существующим заказам."""
+    if inspect(conn).has_table('daily_sales'):
+        return
+    DailySales.__table__.create(conn)
+    from sales import rebuild_daily_sales
+    from sqlalchemy.orm import Session
+    with Session(bind=conn) as db:
+        rebuild_daily_sales(db)
+        db.flush()
+
+
+# DDL шага 2 в том виде, в каком он вышел: индексы моделей могут меняться дальше,
+# но выпущенная миграция должна создавать тот же набор, что и раньше
+HOT_QUERY_INDEXES = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email)",
+    "CREATE INDEX IF NOT EXISTS ix_users_id ON users (id)",
+    "CREATE INDEX IF NOT EXISTS ix_users_role ON users (role)",
+    "CREATE INDEX IF NOT EXISTS ix_orders_id ON orders (id)",
+    "CREATE INDEX IF NOT EXISTS ix_orders_user_created ON orders (user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_orders_status_created ON orders (status, created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_orders_created_at ON orders (created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_orders_created_date ON orders (date(created_at))",
+    "CREATE INDEX IF NOT EXISTS ix_audit_id ON audit (id)",
+    "CREATE INDEX IF NOT EXISTS ix_audit_timestamp ON audit (timestamp)",
+    "CREATE INDEX IF NOT EXISTS ix_audit_entity_ts ON audit (entity, entity_id, timestamp)",
+)
+
+
+def _create_hot_query_indexes(conn):
+    """2: составные индексы и индекс по выражению под горячие запросы."""
+    for ddl in HOT_QUERY_INDEXES:
+        conn.exec_driver_sql(ddl)
+
+
+def _create_outbox(conn):
+    """3: outbox событий смены статуса и checkpoint релея."""
+    OutboxEvent.__table__.create(conn, checkfirst=True)
+    OutboxCheckpoint.__table__.create(conn, checkfirst=True)
+
+
+def _create_web_sessions(conn):
+    """4: общее хранилище сессий (session.SqlBackend)."""
+    WebSession.__table__.create(conn, checkfirst=True)
+
+
+def _create_data_version(conn):
+    """5: счётчики версий orders/users/audit и триггеры к ним (условные GET, versions.py)."""
+    from versions import install
+    install(conn)
+
+
+def _add_outbox_lease(conn):
+    """6: аренда пачки в outbox_checkpoint — несколько воркеров не доставляют одно событие дважды."""
+    columns = {column['name'] for column in inspect(conn).get_columns('outbox_checkpoint')}
+    for name in ('lease_owner', 'lease_until'):
+        if name not in columns:
+            column = OutboxCheckpoint.__table__.c[name]
+            conn.exec_driver_sql(f"ALTER TABLE outbox_checkpoint ADD COLUMN {name} "
+                                 f"{column.type.compile(dialect=conn.dialect)}")
+
+
+# (версия, описание, шаг) — только добавлять в конец, уже выпущенные шаги не менять
+MIGRATIONS = [
+    (1, 'rollup daily_sales', _create_daily_sales),
+    (2, 'индексы orders/audit/users под горячие запросы', _create_hot_query_indexes),
+    (3, 'outbox событий статуса заказа', _create_outbox),
+    (4, 'таблица web_sessions', _create_web_sessions),
+    (5, 'data_version и триггеры версий данных', _create_data_version),
+    (6, 'аренда пачек релея outbox', _add_outbox_lease),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def upgrade(bind=None):
+    """Новая БД создаётся по моделям сразу в последней версии; существующая — догоняется шагами."""
+    bind = bind or get_engine()
+    with bind.begin() as conn:
+        if not inspect(conn).has_table('users'):
+            Base.metadata.create_all(bind=conn)
+            # триггеры моделями не описываются — ставятся тем же шагом, что и в миграции
+            _create_data_version(conn)
+            conn.exec_driver_sql(f'PRAGMA user_version = {LATEST_VERSION}')
+            return []
+        applied = []
+        version = current_version(conn)
+        for number, description, step in MIGRATIONS:
+            if number > version:
+                step(conn)
+                conn.exec_driver_sql(f'PRAGMA user_version = {number}')
+                applied.append((number, description))
+        # таблицы, у которых нет своей миграции (например, audit в старых БД)
+        Base.metadata.create_all(bind=conn)
+        return applied
+
+
+# --- EXPLAIN QUERY PLAN для основных запросов маршрутов ---
+
+def _route_queries():
+    """(маршрут, SELECT[, таблицы, чей полный скан ожидаем]) в той форме, в какой их выполняют маршруты app.py.
+
+    Скан разрешается только маленьким таблицам, которые запрос читает целиком по смыслу:
+    rollup daily_sales (строка на день и статус) и data_version (строка на таблицу).
+    """
+    from export import orders_export_query
+    from reports import report_query
+    from sales import sales_series_query
+    from users import role_values
+    return [
+        ('/login', select(User).where(User.email == 'admin')),
+        ('/orders', select(OrderModel).where(OrderModel.user_id == 1)),
+        ('/update_status', select(OrderModel).where(OrderModel.id == 1)),
+        ('/api/sales_data?from&to', sales_series_query(date(2025, 1, 1), date(2025, 12, 31))),
+        ('/api/sales_data', sales_series_query(), ('daily_sales',)),
+        ('/api/sales_data?bucket=month', sales_series_query(bucket='month'), ('daily_sales',)),
+        ('/reports', report_query(date(2025, 1, 1), date(2025, 1, 31))),
+        ('/reports filter=status', report_query(date(2025, 1, 1), date(2025, 1, 31), [('status', 'Создан')])),
+        ('/reports filter=user_id', report_query(date(2025, 1, 1), date(2025, 1, 31), [('user_id', 1)])),
+        ('/reports filter=role', report_query(date(2025, 1, 1), date(2025, 1, 31), [('role', 'client')])),
+        ('/export_reports?from&to', orders_export_query(date(2025, 1, 1), date(2025, 1, 31))),
+        ('/export_reports?status', orders_export_query(status='Создан')),
+        ('/admin/api/users', select(User).order_by(User.id).limit(51)),
+        ('/admin/api/users?role', select(User).where(User.role.in_(role_values('client'))).order_by(User.id).limit(51)),
+        ('/admin/api/orders', select(OrderModel).order_by(OrderModel.id).limit(51)),
+        ('/admin/api/orders?status',
+         select(OrderModel).where(OrderModel.status == 'Создан').order_by(OrderModel.id).limit(51)),
+        ('/admin/api/orders?user_id',
+         select(OrderModel).where(OrderModel.user_id == 1).order_by(OrderModel.id).limit(51)),
+        ('/admin/api/audit',
+         select(Audit).order_by(Audit.timestamp.desc(), Audit.id.desc()).limit(51)),
+        ('/admin/api/audit?entity',
+         select(Audit).where(Audit.entity == 'Order')
+         .order_by(Audit.timestamp.desc(), Audit.id.desc()).limit(51)),
+        ('условный GET: версии данных',
+         select(DataVersion.version).where(DataVersion.name.in_(('orders', 'audit'))), ('data_version',)),
+        ('кэши отчётов и продаж: версии данных', data_versions_query(('orders', 'users')), ('data_version',)),
+        ('outbox relay',
+         select(OutboxEvent).where(OutboxEvent.id > 0).order_by(OutboxEvent.id).limit(500)),
+    ]
+
+
+def explain(conn, stmt):
+    """(шаги плана, SQL): EXPLAIN QUERY PLAN подставляется перед уже скомпилированным SQL."""
+    sql = []
+
+    def to_explain(conn, cursor, statement, parameters, context, executemany):
+        sql.append(statement)
+        return 'EXPLAIN QUERY PLAN ' + statement, parameters
+
+    event.listen(conn, 'before_cursor_execute', to_explain, retval=True)
+    try:
+        return [row[3] for row in conn.execute(stmt)], sql[0]
+    finally:
+        event.remove(conn, 'before_cursor_execute', to_explain)
+
+
+def full_scans(plan, limited, allowed=()):
+    """SCAN таблицы — нарушение, кроме упорядоченного прохода, который обрывается по LIMIT,
+    и скана таблиц из allowed."""
+    sorted_in_temp = any('USE TEMP B-TREE' in step for step in plan)
+    scans = [step for step in plan
+             if (m := re.match(r'SCAN (\w+)', step)) and m.group(1) not in allowed]
+    if limited and not sorted_in_temp:
+        return []
+    return scans
+
+
+def check_query_plans(bind=None):
+    """Возвращает [(маршрут, шаги-сканы, полный план)] для запросов с полным сканом."""
+    bind = bind or get_engine()
+    problems = []
+    with bind.connect() as conn:
+        for route, stmt, *allowed in _route_queries():
+            plan, sql = explain(conn, stmt)
+            scans = full_scans(plan, re.search(r'\bLIMIT\b', sql) is not None, *allowed)
+            if scans:
+                problems.append((route, scans, plan))
+    return problems
+
+
+if __name__ == '__main__':
+    cmd = sys.argv[1] if len(sys.argv) > 1 else 'upgrade'
+    if cmd == 'upgrade':
+        for number, description in upgrade():
+            print(f"✔ Миграция {number}: {description}")
+        with get_engine().connect() as conn:
+            print("Версия схемы:", current_version(conn))
+    elif cmd == 'explain':
+        problems = check_query_plans()
+        for route, scans, plan in problems:
+            print(f"✘ {route}: {'; '.join(scans)}\n    план: {plan}")
+        print("Запросов с полным сканом:", len(problems))
+        sys.exit(1 if problems else 0)
+    else:
+        print("Использование: python migrations.py [upgrade|explain]")
+        sys.exit(2)
@@ -1,11 +1,35 @@
 # notification.py: Наблюдатель – оповещение о статусе заказа
+# OrderSubject оповещает своих наблюдателей синхронно (attach/notify, как раньше),
+# а если ему передан dispatcher — ещё и публикует снимок статуса в NotificationDispatcher:
+# наблюдатели регистрируются там один раз при старте, доставка идёт в пуле потоков
+# с лимитом параллельности на наблюдателя, повторами с экспоненциальной паузой
+# и пачками по получателю. Проверка на FakeTransport: python -m benchmarks.notifications
+import atexit
+import logging
+import os
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import events
+
+logger = logging.getLogger(__name__)
+
+# Неизменяемый снимок статуса: субъект к моменту доставки мог уже поменяться.
+# У него те же поля, что у OrderSubject, так что update(subject) принимает и его.
+Notification = namedtuple('Notification', 'order_id status recipient')
+
 
 class OrderSubject:
     """Издатель: хранит статус заказа и список подписчиков."""
-    def __init__(self):
+    def __init__(self, order_id=None, recipient=None, dispatcher=None):
         self._observers = []
         self.status = "Создан"
+        self.order_id = order_id
+        self.recipient = recipient
+        self.dispatcher = dispatcher
 
     def attach(self, observer):
         self._observers.append(observer)
@@ -14,28 +38,316 @@ class OrderSubject:
     def notify(self):
         for observer in self._observers:
             observer.update(self)
+        if self.dispatcher is not None:
+            self.dispatcher.publish(self)
 
     def update_status(self, status):
         self.status = status
-        print(f"Заказ: статус изменён на «{self.status}»")
+        if events.enabled:
+            events.emit('order.status', f"Заказ: статус изменён на «{self.status}»", status=status)
         self.notify()
 
 class Observer(ABC):
     """Интерфейс наблюдателя."""
+    # сколько доставок этому наблюдателю диспетчер может вести одновременно
+    max_concurrency = 1
+
     @abstractmethod
     def update(self, subject: OrderSubject):
         pass
 
-class ClientObserver(Observer):
-    def update(self, subject: OrderSubject):
-        print(f"Клиент: уведомлён о статусе заказа «{subject.status}»")
+    def recipient(self, subject):
+        """Ключ, по которому диспетчер собирает уведомления в пачки."""
+        return None
+
+    def deliver(self, notifications):
+        """Пачка уведомлений одному получателю; исключение — повод для повтора."""
+        for notification in notifications:
+            self.update(notification)
+
+# --- транспорты доставки ---
+
+class ConsoleTransport:
+    """Вывод в консоль — как прежние print() в наблюдателях."""
+    def send(self, channel, recipient, messages):
+        for message in messages:
+            print(message)
+
+class FakeTransport:
+    """Локальный транспорт для проверок: запоминает отправки, умеет тормозить и отказывать.
+
+    latency    — пауза на каждую отправку (медленный email/SMS-шлюз);
+    fail_times — сколько первых отправок завершить ConnectionError.
+    """
+    def __init__(self, latency=0.0, fail_times=0):
+        self.latency = latency
+        self.fail_times = fail_times
+        self.sent = []
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def send(self, channel, recipient, messages):
+        with self._lock:
+            self.calls += 1
+            fail = self.fail_times > 0
+            if fail:
+                self.fail_times -= 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if fail:
+                raise ConnectionError("FakeTransport: отказ доставки")
+            with self._lock:
+                self.sent.append((channel, recipient, list(messages)))
+        finally:
+            with self._lock:
+                self.active -= 1
+
+class TransportObserver(Observer):
+    """Наблюдатель, который отправляет текст через транспорт (по умолчанию — в консоль)."""
+    channel = None
+
+    def __init__(self, transport=None):
+        self.transport = transport or ConsoleTransport()
+
+    @abstractmethod
+    def message(self, subject):
+        pass
 
-class ManagerObserver(Observer):
     def update(self, subject: OrderSubject):
-        print(f"Менеджер: уведомлён о статусе заказа «{subject.status}»")
+        self.deliver([subject])
+
+    def deliver(self, notifications):
+        self.transport.send(self.channel, self.recipient(notifications[0]),
+                            [self.message(n) for n in notifications])
+
+class ClientObserver(TransportObserver):
+    channel = 'client'
+    max_concurrency = 4
+
+    def recipient(self, subject):
+        return subject.recipient
+
+    def message(self, subject):
+        return f"Клиент: уведомлён о статусе заказа «{subject.status}»"
+
+class ManagerObserver(TransportObserver):
+    channel = 'manager'
+
+    def recipient(self, subject):
+        return 'managers'
+
+    def message(self, subject):
+        return f"Менеджер: уведомлён о статусе заказа «{subject.status}»"
+
+# --- фоновая доставка ---
+
+class NotificationDispatcher:
+    """Доставляет уведомления зарегистрированным наблюдателям вне HTTP-запроса.
+
+    mode='async' — publish() только кладёт снимок в очередь; фоновый поток раз в
+                   batch_window собирает накопленное по (наблюдатель, получатель)
+                   и отдаёт пачки в пул из workers потоков;
+    mode='sync'  — доставка сразу в publish() (для тестов и CLI).
+    """
+    def __init__(self, mode='async', workers=4, batch_window=0.05, retries=3, backoff=0.2):
+        self.mode = mode
+        self.workers = workers
+        self.batch_window = batch_window
+        self.retries = retries
+        self.backoff = backoff
+        self._observers = []
+        self._limits = {}
+        self._pending = {}      # наблюдатель -> {получатель: [Notification, ...]}
+        self._busy = {}         # наблюдатель -> получатели, которым доставка уже идёт
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._worker = None
+        self._pool = None
+        # счётчики
+        self.published = 0
+        self.delivered = 0
+        self.batches = 0
+        self.retried = 0
+        self.failed = 0
+
+    def register(self, observer, max_concurrency=None):
+        """Регистрирует наблюдателя один раз (при старте приложения)."""
+        with self._lock:
+            self._observers.append(observer)
+            self._limits[observer] = threading.BoundedSemaphore(max_concurrency or observer.max_concurrency)
+            self._pending[observer] = {}
+            self._busy[observer] = set()
+        return observer
+
+    def publish(self, subject):
+        notification = Notification(subject.order_id, subject.status, subject.recipient)
+        if self.mode == 'sync':
+            self.published += 1
+            for observer in list(self._observers):
+                self._deliver(observer, [notification])
+            return
+        with self._lock:
+            self.published += 1
+            for observer in self._observers:
+                self._pending[observer].setdefault(observer.recipient(notification), []).append(notification)
+        self._ensure_worker()
+        self._wake.set()
+
+    def publish_many(self, subjects):
+        """Публикует пачку снимков сразу: уведомления одному получателю уходят одной пачкой,
+        в том числе в режиме sync."""
+        notifications = [Notification(s.order_id, s.status, s.recipient) for s in subjects]
+        if not notifications:
+            return
+        if self.mode == 'sync':
+            self.published += len(notifications)
+            for observer in list(self._observers):
+                grouped = {}
+                for notification in notifications:
+                    grouped.setdefault(observer.recipient(notification), []).append(notification)
+                for batch in grouped.values():
+                    self._deliver(observer, batch)
+            return
+        with self._lock:
+            self.published += len(notifications)
+            for observer in self._observers:
+                pending = self._pending[observer]
+                for notification in notifications:
+                    pending.setdefault(observer.recipient(notification), []).append(notification)
+        self._ensure_worker()
+        self._wake.set()
+
+    def flush(self, timeout=10):
+        """Ждёт, пока накопленное не будет доставлено или не исчерпает повторы; False — по таймауту."""
+        deadline = time.monotonic() + timeout
+        while True:
+            self._dispatch()
+            with self._idle:
+                if not self._in_flight and not any(self._pending.values()):
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(min(remaining, 0.05))
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join(timeout=5)
+        self.flush()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': sum(len(batch) for pending in self._pending.values()
+                                   for batch in pending.values()),
+                'in_flight': self._in_flight,
+                'published': self.published,
+                'delivered': self.delivered,
+                'batches': self.batches,
+                'retried': self.retried,
+                'failed': self.failed,
+            }
+
+    # --- внутреннее ---
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+                self._worker.start()
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            with self._start_lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='notify')
+        return self._pool
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            # короткое окно, чтобы уведомления одному получателю ушли одной пачкой
+            if self.batch_window:
+                time.sleep(self.batch_window)
+            self._dispatch()
+
+    def _dispatch(self):
+        """Раздаёт пачки в пул, пока у наблюдателя есть свободные слоты; остальное ждёт.
+
+        Одному получателю одновременно идёт не больше одной пачки — порядок статусов сохраняется.
+        """
+        jobs = []
+        with self._lock:
+            for observer, pending in self._pending.items():
+                limit, busy = self._limits[observer], self._busy[observer]
+                for recipient in [r for r in pending if r not in busy]:
+                    if not limit.acquire(blocking=False):
+                        break
+                    busy.add(recipient)
+                    jobs.append((observer, recipient, pending.pop(recipient)))
+                    self._in_flight += 1
+        for observer, recipient, batch in jobs:
+            self._ensure_pool().submit(self._run_job, observer, recipient, batch)
+
+    def _run_job(self, observer, recipient, batch):
+        try:
+            self._deliver(observer, batch)
+        finally:
+            self._limits[observer].release()
+            with self._idle:
+                self._busy[observer].discard(recipient)
+                self._in_flight -= 1
+                self._idle.notify_all()
+            # освободился слот — отложенные пачки этого наблюдателя можно раздавать
+            self._wake.set()
+
+    def _deliver(self, observer, batch):
+        for attempt in range(self.retries + 1):
+            try:
+                observer.deliver(batch)
+            except Exception:
+                if attempt == self.retries:
+                    with self._lock:
+                        self.failed += len(batch)
+                    logger.exception("Не доставлено %d уведомлений (%s) после %d попыток",
+                                     len(batch), type(observer).__name__, attempt + 1)
+                    return
+                with self._lock:
+                    self.retried += 1
+                time.sleep(self.backoff * 2 ** attempt)
+            else:
+                with self._lock:
+                    self.delivered += len(batch)
+                    self.batches += 1
+                return
+
+
+# Глобальный диспетчер: CRM_NOTIFY_MODE=sync|async (в профиле test по умолчанию sync)
+dispatcher = NotificationDispatcher(
+    mode=os.environ.get('CRM_NOTIFY_MODE', 'sync' if os.environ.get('CRM_ENV') == 'test' else 'async')
+)
+atexit.register(dispatcher.close)
 
 # Пример использования паттерна Наблюдатель
 if __name__ == "__main__":
+    events.subscribe(events.print_event)
     order = OrderSubject()
     client_obs = ClientObserver()
     manager_obs = ManagerObserver()
@@ -1,21 +1,191 @@
-import copy
 from abc import ABC, abstractmethod
+from array import array
+from collections.abc import MutableMapping, MutableSequence
+from datetime import datetime
+from operator import mul
+
+import events
 
 # 1) Заказ сам по себе — тоже компонент, у него будет get_price()
 class OrderComponent(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def get_price(self):
         pass
 
+# Позиции заказа: колонки array (цена, количество, id SKU) вместо списка словарей.
+# Клон разделяет колонки с оригиналом до первой записи (copy-on-write),
+# сумма позиций кэшируется и сбрасывается при любом изменении.
+NO_SKU = -1
+
+class ItemView(MutableMapping):
+    """Словарь-представление одной позиции: item['price'] читает и пишет прямо в колонки."""
+    __slots__ = ('_items', '_index')
+    KEYS = ('price', 'quantity', 'sku')
+
+    def __init__(self, items, index):
+        self._items = items
+        self._index = index
+
+    def __getitem__(self, key):
+        items, i = self._items, self._index
+        if key == 'price':
+            return items._price[i]
+        if key == 'quantity':
+            return items._qty[i]
+        if key == 'sku':
+            sku = items._sku[i]
+            return None if sku == NO_SKU else sku
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        self._items._set_field(self._index, key, value)
+
+    def __delitem__(self, key):
+        raise TypeError("Поля позиции удалить нельзя")
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class OrderItems(MutableSequence):
+    __slots__ = ('_price', '_qty', '_sku', '_shared', '_subtotal')
+
+    def __init__(self, items=()):
+        self._price = array('d')
+        self._qty = array('l')
+        self._sku = array('q')
+        self._shared = False
+        self._subtotal = None
+        for item in items:
+            self._append_row(item)
+
+    def _append_row(self, item):
+        self._price.append(item['price'])
+        self._qty.append(item.get('quantity', 1))
+        sku = item.get('sku')
+        self._sku.append(NO_SKU if sku is None else sku)
+
+    def _writable(self):
+        if self._shared:
+            self._price = array('d', self._price)
+            self._qty = array('l', self._qty)
+            self._sku = array('q', self._sku)
+            self._shared = False
+        self._subtotal = None
+
+    def _set_field(self, index, key, value):
+        self._writable()
+        if key == 'price':
+            self._price[index] = value
+        elif key == 'quantity':
+            self._qty[index] = value
+        else:
+            self._sku[index] = NO_SKU if value is None else value
+
+    def share(self):
+        """Копия, разделяющая колонки с оригиналом до первой записи в любую из них."""
+        clone = OrderItems.__new__(OrderItems)
+        clone._price, clone._qty, clone._sku = self._price, self._qty, self._sku
+        clone._subtotal = self._subtotal
+        clone._shared = self._shared = True
+        return clone
+
+    def prices(self):
+        return self._price
+
+    def line_totals(self):
+        """Цена × количество по позициям (без копии, если все количества равны 1)."""
+        if self._qty.count(1) == len(self._qty):
+            return self._price
+        return array('d', map(mul, self._price, self._qty))
+
+    def subtotal(self):
+        if self._subtotal is None:
+            self._subtotal = sum(self.line_totals())
+        return self._subtotal
+
+    def __len__(self):
+        return len(self._price)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ItemView(self, i) for i in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('индекс позиции вне диапазона')
+        return ItemView(self, index)
+
+    def __setitem__(self, index, item):
+        if isinstance(index, slice):
+            rows = [dict(i) for i in self]
+            rows[index] = [dict(i) for i in item]
+            self._replace(rows)
+            return
+        self._set_field(index, 'price', item['price'])
+        self._set_field(index, 'quantity', item.get('quantity', 1))
+        self._set_field(index, 'sku', item.get('sku'))
+
+    def __delitem__(self, index):
+        self._writable()
+        del self._price[index]
+        del self._qty[index]
+        del self._sku[index]
+
+    def insert(self, index, item):
+        self._writable()
+        self._price.insert(index, item['price'])
+        self._qty.insert(index, item.get('quantity', 1))
+        sku = item.get('sku')
+        self._sku.insert(index, NO_SKU if sku is None else sku)
+
+    def append(self, item):
+        self._writable()
+        self._append_row(item)
+
+    def _replace(self, rows):
+        self._price, self._qty, self._sku = array('d'), array('l'), array('q')
+        self._shared = False
+        self._subtotal = None
+        for row in rows:
+            self._append_row(row)
+
+    def __eq__(self, other):
+        return list(map(dict, self)) == [dict(i) for i in other]
+
+    def __repr__(self):
+        return f"OrderItems({[dict(i) for i in self]!r})"
+
 # 2) Конкретный заказ хранит в себе логику total() и реализует get_price()
 class ConcreteOrder(OrderComponent):
+    __slots__ = ('_items', 'is_vip', 'discount_strategy')
+
     def __init__(self, items, is_vip=False):
-        self.items = list(items)
+        self.items = items
         self.is_vip = is_vip
         self.discount_strategy = None
 
+    @property
+    def items(self):
+        return self._items
+
+    @items.setter
+    def items(self, items):
+        # чужой OrderItems не берём по ссылке: колонки общие только до первой записи (copy-on-write)
+        self._items = items.share() if isinstance(items, OrderItems) else OrderItems(items)
+
     def total(self):
-        total = sum(item['price'] for item in self.items)
+        total = self._items.subtotal()
         if self.discount_strategy:
             total -= self.discount_strategy.calculate(total, self)
         return total
@@ -27,9 +197,47 @@ class ConcreteOrder(OrderComponent):
     def get_price(self):
         return self.total()
 
-    # для Prototype
+    # для Prototype: без deepcopy — колонки позиций разделяются до первой записи,
+    # стратегия скидки не хранит состояния и передаётся по ссылке
     def clone(self):
-        return copy.deepcopy(self)
+        clone = self.__class__.__new__(self.__class__)
+        clone.is_vip = self.is_vip
+        clone.discount_strategy = self.discount_strategy
+        clone._items = self._items.share()
+        if hasattr(self, '__dict__'):   # подклассы без __slots__
+            clone.__dict__.update(self.__dict__)
+        return clone
+
+    def clone_many(self, n):
+        return [self.clone() for _ in range(n)]
+
+# Prototype для сохранённого заказа (app.clone_order): позиции в таблице orders не хранятся,
+# так что копируются поля строки; у клона статус 'Cloned' и своё время создания.
+class OrderRecord:
+    __slots__ = ('user_id', 'total', 'status', 'created_at')
+    CLONE_STATUS = 'Cloned'
+
+    def __init__(self, user_id, total, status=None, created_at=None):
+        self.user_id = user_id
+        self.total = total
+        self.status = status
+        self.created_at = created_at
+
+    @classmethod
+    def from_model(cls, rec):
+        return cls(rec.user_id, rec.total, rec.status, rec.created_at)
+
+    def clone(self, created_at=None):
+        return OrderRecord(self.user_id, self.total, self.CLONE_STATUS, created_at or datetime.now())
+
+    def clone_many(self, n, created_at=None):
+        # одно время создания на пачку: все копии попадают в одну строку rollup
+        created_at = created_at or datetime.now()
+        return [self.clone(created_at) for _ in range(n)]
+
+    def as_row(self):
+        return {'user_id': self.user_id, 'total': self.total,
+                'status': self.status, 'created_at': self.created_at}
 
 # 3) Стратегии скидок остаются без изменений
 class DiscountStrategy(ABC):
@@ -38,15 +246,22 @@ class DiscountStrategy(ABC):
         pass
 
 class VolumeDiscount(DiscountStrategy):
+    rate = 0.1
+    threshold = 1000
+
     def calculate(self, amount, order):
-        return amount * 0.1 if amount > 1000 else 0
+        return amount * self.rate if amount > self.threshold else 0
 
 class VIPDiscount(DiscountStrategy):
+    rate = 0.05
+
     def calculate(self, amount, order):
-        return amount * 0.05 if order.is_vip else 0
+        return amount * self.rate if order.is_vip else 0
 
 # 4) Общий декоратор — тоже компонент, и он оборачивает любой другой компонент
 class OrderDecorator(OrderComponent):
+    __slots__ = ('wrapped',)
+
     def __init__(self, wrapped: OrderComponent):
         self.wrapped = wrapped
 
@@ -55,19 +270,66 @@ class OrderDecorator(OrderComponent):
 
 # 5) Конкретные декораторы услуг
 class InsuranceDecorator(OrderDecorator):
+    __slots__ = ()
+    fee = 50
+
     def get_price(self):
         price = self.wrapped.get_price()
-        print("Добавлена страховка: +50")
-        return price + 50
+        if events.enabled:
+            events.emit('order.addon', f"Добавлена страховка: +{self.fee}", addon='insurance', fee=self.fee)
+        return price + self.fee
 
 class PriorityShippingDecorator(OrderDecorator):
+    __slots__ = ()
+    fee = 100
+
     def get_price(self):
         price = self.wrapped.get_price()
-        print("Добавлена приоритетная доставка: +100")
-        return price + 100
+        if events.enabled:
+            events.emit('order.addon', f"Добавлена приоритетная доставка: +{self.fee}",
+                        addon='priority', fee=self.fee)
+        return price + self.fee
+
+# 6) Сборка заказа по параметрам формы/импорта: стратегия скидки + декораторы услуг
+DISCOUNT_STRATEGIES = {
+    'volume': VolumeDiscount,
+    'vip': VIPDiscount,
+}
+
+def build_order(items, is_vip=False, strategy=None, insurance=False, priority=False):
+    order = ConcreteOrder(items=items, is_vip=is_vip)
+    if strategy in DISCOUNT_STRATEGIES:
+        order.set_discount_strategy(DISCOUNT_STRATEGIES[strategy]())
+    elif strategy not in (None, '', 'none'):
+        raise ValueError(f"Неизвестная стратегия скидки: {strategy}")
+    if insurance:
+        order = InsuranceDecorator(order)
+    if priority:
+        order = PriorityShippingDecorator(order)
+    return order
+
+# 7) Жизненный цикл заказа: явная машина состояний статусов.
+# Ключ — текущий статус, значение — куда из него можно перейти; NULL в БД читается как «Создан»,
+# клон (app.clone_order) в работу ещё не взят — как новый заказ.
+ORDER_STATUSES = ('Создан', 'В обработке', 'Отправлен', 'Завершен')
+STATUS_TRANSITIONS = {
+    'Создан': ('В обработке',),
+    'Cloned': ('Создан', 'В обработке'),
+    'В обработке': ('Отправлен',),
+    'Отправлен': ('Завершен',),
+    'Завершен': (),
+}
+
+def can_transition(old_status, new_status):
+    return new_status in STATUS_TRANSITIONS.get(old_status or 'Создан', ())
+
+def transition_sources(new_status):
+    """Статусы, из которых допустим переход в new_status."""
+    return tuple(old for old, targets in STATUS_TRANSITIONS.items() if new_status in targets)
 
 # --- пример использования ---
 if __name__ == "__main__":
+    events.subscribe(events.print_event)
     # исходный заказ
     order = ConcreteOrder(items=[{'price': 600}, {'price': 700}], is_vip=True)
     order.set_discount_strategy(VolumeDiscount())
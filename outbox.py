@@ -0,0 +1,346 @@
+# outbox.py: transactional outbox для событий смены статуса заказа
+# Маршрут пишет OutboxEvent в той же транзакции, что и новый статус заказа (enqueue_status_change,
+# для массовой смены — enqueue_status_changes), а OutboxRelay вычитывает события пачками по возрастанию id,
+# публикует их в NotificationDispatcher (одна пачка на получателя) и только после доставки сдвигает high-watermark
+# в outbox_checkpoint. Падение процесса между коммитом и доставкой ничего не теряет:
+# после рестарта релей продолжит с checkpoint (доставка «хотя бы один раз»).
+# Пачку релей берёт в аренду в самой БД (lease_owner/lease_until в outbox_checkpoint), поэтому несколько
+# воркеров с одним checkpoint не доставляют одно событие N раз; аренда упавшего воркера истекает сама.
+#   python outbox.py drain            — доставить всё накопленное и выйти
+#   python outbox.py replay --from 0  — перевести checkpoint назад и доставить заново
+#   python outbox.py stats | prune
+import argparse
+import atexit
+import datetime
+import logging
+import os
+import socket
+import threading
+import time
+
+from sqlalchemy import select, insert, update, delete, func, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import events
+from db import OutboxEvent, OutboxCheckpoint
+
+logger = logging.getLogger(__name__)
+
+STATUS_CHANGE = 'status_change'
+
+
+def enqueue_status_change(db, order, old_status, performed_by=None):
+    """Добавляет событие в сессию заказа — оно закоммитится вместе со сменой статуса."""
+    db.add(OutboxEvent(
+        order_id=order.id,
+        event=STATUS_CHANGE,
+        status=order.status,
+        old_status=old_status,
+        recipient=order.user_id,
+        performed_by=performed_by,
+    ))
+
+
+def enqueue_status_changes(db, changes, performed_by=None):
+    """Пачка событий одним INSERT (executemany); changes — (order_id, получатель, старый, новый)."""
+    if not changes:
+        return
+    now = datetime.datetime.now()
+    db.execute(insert(OutboxEvent), [
+        {'order_id': order_id, 'event': STATUS_CHANGE, 'status': status, 'old_status': old_status,
+         'recipient': recipient, 'performed_by': performed_by, 'created_at': now}
+        for order_id, recipient, old_status, status in changes
+    ])
+
+
+class OutboxRelay:
+    """Доставляет события outbox наблюдателям пачками, ведёт checkpoint и метрики.
+
+    Порядок внутри заказа сохраняется: события читаются по возрастанию id, а диспетчер
+    не ведёт две пачки одному получателю одновременно.
+    mode='async' — фоновый поток, wake() будит его после коммита;
+    mode='sync'  — wake() доставляет сразу (для тестов и CLI).
+    """
+    def __init__(self, bind=None, dispatcher=None, name='notifications', mode='async',
+                 batch_size=500, poll_interval=1.0, delivery_timeout=30, lease_timeout=60):
+        self.bind = bind
+        self.dispatcher = dispatcher
+        self.name = name
+        self.mode = mode
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.delivery_timeout = delivery_timeout
+        self.lease_timeout = lease_timeout      # больше delivery_timeout: аренду не отберут посреди доставки
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._drain_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._worker = None
+        self._started = False
+        # счётчики
+        self.drained = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.lost_leases = 0
+        self.high_watermark = None
+        self.last_batch_ms = 0.0
+        self.total_drain_s = 0.0
+
+    def _bind(self):
+        if self.bind is None:
+            from db import engine
+            self.bind = engine
+        return self.bind
+
+    def _dispatcher(self):
+        if self.dispatcher is None:
+            from notification import dispatcher
+            self.dispatcher = dispatcher
+        return self.dispatcher
+
+    # --- checkpoint ---
+
+    def checkpoint(self, conn):
+        last_id = conn.scalar(select(OutboxCheckpoint.last_id).where(OutboxCheckpoint.name == self.name))
+        if last_id is None:
+            self._create_checkpoint(conn)
+            last_id = 0
+        return last_id
+
+    def _create_checkpoint(self, conn):
+        # строку могут одновременно создавать несколько воркеров
+        conn.execute(sqlite_insert(OutboxCheckpoint)
+                     .values(name=self.name, last_id=0, updated_at=datetime.datetime.now())
+                     .on_conflict_do_nothing())
+
+    def _advance(self, conn, last_id):
+        conn.execute(update(OutboxCheckpoint)
+                     .where(OutboxCheckpoint.name == self.name)
+                     .values(last_id=last_id, updated_at=datetime.datetime.now()))
+
+    def _owner(self):
+        # pid берётся при каждом вызове: глобальный релей создаётся до fork воркеров
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _claim(self, conn):
+        """Берёт аренду checkpoint на lease_timeout -> last_id; None, если пачку доставляет другой релей.
+
+        Сначала запись, потом чтение: в WAL транзакция, начатая чтением, не смогла бы стать пишущей
+        после чужого коммита; два релея, пришедшие одновременно, выстраиваются на блокировке записи.
+        """
+        now = time.time()
+        self._create_checkpoint(conn)
+        claimed = conn.execute(
+            update(OutboxCheckpoint)
+            .where(OutboxCheckpoint.name == self.name,
+                   or_(OutboxCheckpoint.lease_owner.is_(None),
+                       OutboxCheckpoint.lease_owner == self._owner(),
+                       OutboxCheckpoint.lease_until < now))
+            .values(lease_owner=self._owner(), lease_until=now + self.lease_timeout)
+        ).rowcount
+        if not claimed:
+            return None
+        return conn.scalar(select(OutboxCheckpoint.last_id).where(OutboxCheckpoint.name == self.name))
+
+    def _finish(self, conn, last_id, new_id=None):
+        """Снимает аренду; с new_id — ещё и сдвигает checkpoint last_id -> new_id (compare-and-set).
+
+        -> False, если аренда за это время истекла и checkpoint уже не наш.
+        """
+        values = {'lease_owner': None, 'lease_until': None}
+        if new_id is not None:
+            values.update(last_id=new_id, updated_at=datetime.datetime.now())
+        return conn.execute(
+            update(OutboxCheckpoint)
+            .where(OutboxCheckpoint.name == self.name, OutboxCheckpoint.last_id == last_id,
+                   OutboxCheckpoint.lease_owner == self._owner())
+            .values(**values)
+        ).rowcount == 1
+
+    def reset(self, last_id=0):
+        """Переводит checkpoint (например, назад — для повторной рассылки)."""
+        with self._drain_lock, self._bind().begin() as conn:
+            self.checkpoint(conn)
+            self._advance(conn, last_id)
+        self.high_watermark = last_id
+
+    # --- доставка ---
+
+    def drain_once(self):
+        """Одна пачка: взять аренду, прочитать после checkpoint, доставить, сдвинуть checkpoint.
+
+        -> число событий; 0 — нечего доставлять или пачку сейчас доставляет другой релей.
+        """
+        from notification import Notification
+        dispatcher = self._dispatcher()
+        with self._drain_lock:
+            started = time.perf_counter()
+            # без новых событий обходимся чтением — простаивающие воркеры не пишут в БД на каждом опросе
+            with self._bind().begin() as conn:
+                last_id = self.checkpoint(conn)
+                if conn.scalar(select(OutboxEvent.id).where(OutboxEvent.id > last_id).limit(1)) is None:
+                    self.high_watermark = last_id
+                    return 0
+            with self._bind().begin() as conn:
+                last_id = self._claim(conn)
+                if last_id is None:
+                    return 0
+                batch = conn.execute(
+                    select(OutboxEvent.id, OutboxEvent.order_id, OutboxEvent.status, OutboxEvent.recipient)
+                    .where(OutboxEvent.id > last_id)
+                    .order_by(OutboxEvent.id)
+                    .limit(self.batch_size)
+                ).all()
+                if not batch:
+                    self._finish(conn, last_id)
+                    self.high_watermark = last_id
+                    return 0
+            delivered = False
+            try:
+                # вся пачка публикуется разом: уведомления одному получателю (массовая смена статуса)
+                # уходят ему одной отправкой
+                if events.enabled:
+                    for _, order_id, status, _ in batch:
+                        events.emit('order.status', f"Заказ: статус изменён на «{status}»", status=status)
+                dispatcher.publish_many([Notification(order_id, status, recipient)
+                                         for _, order_id, status, recipient in batch])
+                delivered = dispatcher.flush(timeout=self.delivery_timeout)
+            finally:
+                # checkpoint двигаем только после доставки: если процесс упадёт раньше, аренда истечёт
+                # и пачку доставит заново этот или другой релей; при ошибке аренда просто снимается
+                with self._bind().begin() as conn:
+                    kept = self._finish(conn, last_id, batch[-1][0] if delivered else None)
+            # уведомления, исчерпавшие повторы диспетчера, видны в dispatcher.stats()['failed']
+            if not delivered:
+                self.failed_batches += 1
+                logger.warning("Outbox %s: пачка после id=%d не доставлена за %s с",
+                               self.name, last_id, self.delivery_timeout)
+                return 0
+            if not kept:
+                self.lost_leases += 1
+                logger.warning("Outbox %s: аренда пачки после id=%d истекла до конца доставки, "
+                               "её мог доставить повторно другой релей", self.name, last_id)
+            elapsed = time.perf_counter() - started
+            self.high_watermark = batch[-1][0]
+            self.drained += len(batch)
+            self.batches += 1
+            self.last_batch_ms = elapsed * 1000
+            self.total_drain_s += elapsed
+            return len(batch)
+
+    def drain(self):
+        """Доставляет всё, что накопилось к этому моменту. -> число событий."""
+        total = 0
+        while True:
+            count = self.drain_once()
+            total += count
+            if count < self.batch_size:
+                return total
+
+    def wake(self):
+        """Вызывается после коммита, в котором были события outbox.
+
+        До start() ничего не делает: без настроенных наблюдателей доставка «в пустоту»
+        сдвинула бы checkpoint, и события пропали бы. Они ждут в outbox до start() или drain.
+        """
+        if not self._started:
+            return
+        if self.mode == 'sync':
+            self.drain()
+            return
+        self._ensure_worker()
+        self._wake.set()
+
+    def start(self, dispatcher=None):
+        """Включает доставку через dispatcher (с зарегистрированными наблюдателями).
+
+        mode='async' — фоновый поток: доставка по wake() и опрос раз в poll_interval
+        (события других процессов); mode='sync' — wake() доставляет сразу.
+        """
+        if dispatcher is not None:
+            self.dispatcher = dispatcher
+        self._started = True
+        if self.mode != 'sync':
+            self._ensure_worker()
+            self._wake.set()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join(timeout=5)
+
+    def prune(self):
+        """Удаляет уже доставленные события (id <= checkpoint). -> число строк."""
+        with self._drain_lock, self._bind().begin() as conn:
+            last_id = self.checkpoint(conn)
+            return conn.execute(delete(OutboxEvent).where(OutboxEvent.id <= last_id)).rowcount
+
+    def stats(self):
+        with self._bind().connect() as conn:
+            last_id = conn.scalar(
+                select(OutboxCheckpoint.last_id).where(OutboxCheckpoint.name == self.name)) or 0
+            pending = conn.scalar(select(func.count()).select_from(OutboxEvent).where(OutboxEvent.id > last_id))
+        return {
+            'high_watermark': last_id,
+            'pending': pending,
+            'drained_events': self.drained,
+            'batches': self.batches,
+            'failed_batches': self.failed_batches,
+            'lost_leases': self.lost_leases,
+            'last_batch_ms': round(self.last_batch_ms, 3),
+            'events_per_sec': round(self.drained / self.total_drain_s, 1) if self.total_drain_s else 0.0,
+        }
+
+    # --- внутреннее ---
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='outbox-relay', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self.drain()
+            except Exception:
+                logger.exception("Outbox %s: ошибка доставки", self.name)
+
+
+# Глобальный релей: CRM_OUTBOX_MODE=sync|async (в профиле test по умолчанию sync)
+outbox_relay = OutboxRelay(
+    mode=os.environ.get('CRM_OUTBOX_MODE', 'sync' if os.environ.get('CRM_ENV') == 'test' else 'async')
+)
+atexit.register(outbox_relay.close)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Outbox событий статуса заказа')
+    parser.add_argument('command', choices=('drain', 'replay', 'stats', 'prune'))
+    parser.add_argument('--from', dest='from_id', type=int, default=0,
+                        help='replay: доставить заново события с id больше этого')
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    from notification import dispatcher, ClientObserver, ManagerObserver
+    dispatcher.register(ClientObserver())
+    dispatcher.register(ManagerObserver())
+    outbox_relay.batch_size = args.batch_size
+
+    if args.command == 'replay':
+        outbox_relay.reset(args.from_id)
+    if args.command in ('drain', 'replay'):
+        count = outbox_relay.drain()
+        stats = outbox_relay.stats()
+        print(f"Доставлено {count} событий, пачек: {stats['batches']}, "
+              f"{stats['events_per_sec']} событий/с, checkpoint: {stats['high_watermark']}")
+    elif args.command == 'prune':
+        print(f"Удалено доставленных событий: {outbox_relay.prune()}")
+    else:
+        for key, value in outbox_relay.stats().items():
+            print(f"{key}: {value}")
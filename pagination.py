@@ -0,0 +1,52 @@
+# pagination.py: keyset (cursor) пагинация — без OFFSET, по уникальному упорядоченному ключу
+import base64
+import json
+from datetime import date, datetime
+from sqlalchemy import and_, or_
+from sqlalchemy.types import Date, DateTime
+
+
+def encode_cursor(values):
+    """Курсор = base64(JSON) значений ключа последней строки страницы."""
+    raw = json.dumps([v.isoformat() if isinstance(v, (date, datetime)) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor, columns):
+    """Разбирает курсор, приводя значения к типам колонок. ValueError — если курсор битый."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception as exc:
+        raise ValueError('Некорректный курсор') from exc
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('Некорректный курсор')
+    result = []
+    for col, value in zip(columns, values):
+        if value is not None and isinstance(col.type, DateTime):
+            value = datetime.fromisoformat(value)
+        elif value is not None and isinstance(col.type, Date):
+            value = date.fromisoformat(value)
+        result.append(value)
+    return result
+
+
+def _after(columns, values, descending):
+    """(c1, c2, ...) > (v1, v2, ...) в виде OR/AND — значения биндятся с типами колонок."""
+    clauses = []
+    for i, (col, value) in enumerate(zip(columns, values)):
+        step = col < value if descending else col > value
+        clauses.append(and_(*[c == v for c, v in zip(columns[:i], values[:i])], step))
+    return or_(*clauses)
+
+
+def keyset_page(query, columns, cursor=None, limit=50, descending=False):
+    """Возвращает (rows, next_cursor); next_cursor=None на последней странице."""
+    if cursor:
+        query = query.filter(_after(columns, decode_cursor(cursor, columns), descending))
+    order = [c.desc() if descending else c.asc() for c in columns]
+    rows = query.order_by(*order).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], c.key) for c in columns])
+    return rows, next_cursor
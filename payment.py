@@ -1,40 +1,291 @@
 # payment.py: Адаптеры для интеграции со Stripe и PayPal
+# Адаптеры долгоживущие (get_processor): один экземпляр на провайдера на весь процесс.
+# Пакетная оплата — PaymentProcessor.pay_batch(): пул потоков с ограничением параллельности,
+# token bucket на провайдера, повторы временных ошибок и ключи идемпотентности,
+# чтобы повтор не списал деньги дважды. Хранилище ключей одно на процесс для всех провайдеров,
+# ограничено по размеру и времени (CRM_IDEMPOTENCY_TTL, секунды).
+# Замер на фейковом провайдере: python -m benchmarks.payments
+import asyncio
+import itertools
+import os
+import random
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import events
+from cache import TTLCache
+
+# Платёж в пачке: key — ключ идемпотентности (например, f"order-{id}")
+Charge = namedtuple('Charge', 'key amount')
+ChargeResult = namedtuple('ChargeResult', 'key ok transaction_id error attempts duplicate')
+
+
+class PaymentError(Exception):
+    """Платёж отклонён — повтор не поможет."""
+
+class TransientPaymentError(PaymentError):
+    """Временный сбой провайдера (таймаут, 5xx, 429) — можно повторить с тем же ключом."""
+
+
+class RateLimiter:
+    """Token bucket: не больше rate операций в секунду, всплеск до burst."""
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_MISSING = object()
+
+
+class IdempotencyStore:
+    """Результаты успешных платежей по ключу; параллельный вызов с тем же ключом ждёт первый.
+
+    Результаты живут в TTLCache: не больше maxsize ключей и не дольше ttl секунд,
+    иначе в долгоживущем веб-процессе словарь рос бы без предела.
+    """
+    def __init__(self, maxsize=100000, ttl=24 * 3600):
+        self._results = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, fn):
+        """-> (результат, duplicate): duplicate=True — платёж с этим ключом уже был проведён."""
+        while True:
+            with self._lock:
+                result = self._results.get(key, _MISSING)
+                if result is not _MISSING:
+                    return result, True
+                waiter = self._in_flight.get(key)
+                if waiter is None:
+                    done = self._in_flight[key] = threading.Event()
+                    break
+            # тот же ключ уже проводится в другом потоке — дождаться и взять его результат
+            waiter.wait()
+        try:
+            result = fn()
+            with self._lock:
+                self._results.set(key, result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            done.set()
+
+
+# Ключи идемпотентности процесса — общие для всех адаптеров
+idempotency_store = IdempotencyStore(ttl=float(os.environ.get('CRM_IDEMPOTENCY_TTL', 24 * 3600)))
+
 
 class PaymentProcessor(ABC):
     """Общий интерфейс для платежей."""
+    # ограничения провайдера по умолчанию; переопределяются в адаптере или в __init__
+    rate_limit = 50          # платежей в секунду
+    max_concurrency = 8      # одновременных запросов к провайдеру
+    retries = 2
+    backoff = 0.1
+
+    def __init__(self, rate_limit=None, max_concurrency=None, idempotency=None):
+        self.rate_limit = rate_limit or self.rate_limit
+        self.max_concurrency = max_concurrency or self.max_concurrency
+        self._limiter = RateLimiter(self.rate_limit)
+        # по умолчанию — общее хранилище: ключ f"order-{id}" один для всех провайдеров,
+        # и оплата того же заказа через другого провайдера не спишет деньги второй раз
+        self._idempotency = idempotency or idempotency_store
+        self._executor = None
+
     @abstractmethod
-    def pay(self, amount):
+    def pay(self, amount, idempotency_key=None):
+        """Один вызов провайдера; -> id транзакции."""
         pass
 
+    def charge(self, charge):
+        """Платёж с ключом идемпотентности, лимитом частоты и повторами временных сбоев."""
+        attempts = 0
+
+        def call():
+            nonlocal attempts
+            for attempt in range(self.retries + 1):
+                attempts += 1
+                self._limiter.acquire()
+                try:
+                    # тот же ключ уходит провайдеру и при повторе — он сам отбросит дубль
+                    return self.pay(charge.amount, idempotency_key=charge.key)
+                except TransientPaymentError:
+                    if attempt == self.retries:
+                        raise
+                    time.sleep(self.backoff * 2 ** attempt)
+
+        try:
+            transaction_id, duplicate = self._idempotency.run(charge.key, call)
+        except PaymentError as exc:
+            return ChargeResult(charge.key, False, None, str(exc), attempts, False)
+        return ChargeResult(charge.key, True, transaction_id, None, attempts, duplicate)
+
+    async def charge_async(self, charge):
+        """charge() для корутин (ASGI): блокирующий SDK уходит в пул на max_concurrency потоков."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_concurrency, thread_name_prefix='payment-async')
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.charge, charge)
+
+    def pay_batch(self, charges, max_concurrency=None):
+        """Проводит пачку Charge параллельно; результаты — в порядке charges."""
+        workers = min(max_concurrency or self.max_concurrency, self.max_concurrency)
+        with ThreadPoolExecutor(workers, thread_name_prefix='payment') as pool:
+            return list(pool.map(self.charge, charges))
+
+
 class StripeAPI:
     """Внешняя библиотека Stripe с собственным методом оплаты."""
-    def stripe_pay(self, amount):
-        print(f"Stripe: проведён платёж на сумму {amount}")
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def stripe_pay(self, amount, idempotency_key=None):
+        with self._lock:
+            if idempotency_key in self._by_key:
+                return self._by_key[idempotency_key]
+            charge_id = f"ch_{next(self._ids)}"
+            if idempotency_key is not None:
+                self._by_key[idempotency_key] = charge_id
+        if events.enabled:
+            events.emit('payment.charged', f"Stripe: проведён платёж на сумму {amount}",
+                        provider='stripe', amount=amount)
+        return charge_id
 
 class PayPalAPI:
     """Внешняя библиотека PayPal с собственным методом оплаты."""
-    def send_payment(self, amount):
-        print(f"PayPal: проведена транзакция на сумму {amount}")
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._by_request = {}
+        self._lock = threading.Lock()
+
+    def send_payment(self, amount, request_id=None):
+        with self._lock:
+            if request_id in self._by_request:
+                return self._by_request[request_id]
+            transaction_id = f"PAY-{next(self._ids)}"
+            if request_id is not None:
+                self._by_request[request_id] = transaction_id
+        if events.enabled:
+            events.emit('payment.charged', f"PayPal: проведена транзакция на сумму {amount}",
+                        provider='paypal', amount=amount)
+        return transaction_id
 
 class StripeAdapter(PaymentProcessor):
     """Адаптер для StripeAPI."""
-    def __init__(self, stripe_api: StripeAPI):
+    rate_limit = 100
+
+    def __init__(self, stripe_api: StripeAPI, **limits):
+        super().__init__(**limits)
         self.stripe_api = stripe_api
-    def pay(self, amount):
-        self.stripe_api.stripe_pay(amount)
+    def pay(self, amount, idempotency_key=None):
+        return self.stripe_api.stripe_pay(amount, idempotency_key=idempotency_key)
 
 class PayPalAdapter(PaymentProcessor):
     """Адаптер для PayPalAPI."""
-    def __init__(self, paypal_api: PayPalAPI):
+    rate_limit = 30
+
+    def __init__(self, paypal_api: PayPalAPI, **limits):
+        super().__init__(**limits)
         self.paypal_api = paypal_api
-    def pay(self, amount):
-        self.paypal_api.send_payment(amount)
+    def pay(self, amount, idempotency_key=None):
+        # у PayPal ключ идемпотентности называется PayPal-Request-Id
+        return self.paypal_api.send_payment(amount, request_id=idempotency_key)
+
+# --- фейковый провайдер для замеров и проверок ---
+
+class FakePaymentAPI:
+    """Провайдер-заглушка: задержка на запрос, доля временных отказов, учёт реальных списаний."""
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.charged = {}        # ключ -> сумма: сколько раз реально списали
+        self.active = 0
+        self.max_active = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def charge(self, amount, idempotency_key):
+        with self._lock:
+            self.calls += 1
+            fail = self._random.random() < self.failure_rate
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if fail:
+                raise TransientPaymentError("FakePaymentAPI: 503")
+            with self._lock:
+                if idempotency_key not in self.charged:
+                    self.charged[idempotency_key] = amount
+            return f"fake_{idempotency_key}"
+        finally:
+            with self._lock:
+                self.active -= 1
+
+class FakeAdapter(PaymentProcessor):
+    """Адаптер для FakePaymentAPI."""
+    backoff = 0.01
+
+    def __init__(self, fake_api: FakePaymentAPI, **limits):
+        super().__init__(**limits)
+        self.fake_api = fake_api
+    def pay(self, amount, idempotency_key=None):
+        return self.fake_api.charge(amount, idempotency_key)
+
+# --- долгоживущие адаптеры ---
+
+PROVIDERS = {
+    'stripe': lambda: StripeAdapter(StripeAPI()),
+    'paypal': lambda: PayPalAdapter(PayPalAPI()),
+}
+# CRM_FAKE_PAYMENT_LATENCY=0.05 — провайдер 'fake' (/pay/<id>/fake) для нагрузочных тестов
+if os.environ.get('CRM_FAKE_PAYMENT_LATENCY'):
+    PROVIDERS['fake'] = lambda: FakeAdapter(
+        FakePaymentAPI(float(os.environ['CRM_FAKE_PAYMENT_LATENCY'])), rate_limit=10 ** 6, max_concurrency=256)
+_processors = {}
+_processors_lock = threading.Lock()
+
+def get_processor(provider):
+    """Один адаптер (и клиент провайдера) на процесс — а не новый на каждый запрос."""
+    processor = _processors.get(provider)
+    if processor is None:
+        with _processors_lock:
+            processor = _processors.get(provider)
+            if processor is None:
+                processor = _processors[provider] = PROVIDERS[provider]()
+    return processor
 
 # Пример использования адаптеров
 if __name__ == "__main__":
+    events.subscribe(events.print_event)
     stripe = StripeAPI()
     paypal = PayPalAPI()
     processors = [StripeAdapter(stripe), PayPalAdapter(paypal)]
     for processor in processors:
         processor.pay(100)  # единый интерфейс pay()
+    # пачка: повтор ключа order-1 не приводит ко второму списанию
+    results = get_processor('stripe').pay_batch([Charge('order-1', 100), Charge('order-2', 250), Charge('order-1', 100)])
+    for result in results:
+        print(result)
@@ -1,102 +1,258 @@
-# reports.py
+# reports.py: Builder + Abstract Factory для отчётов по заказам
+# Builder превращает период и фильтры в условия SQL; все агрегаты отчёта считаются
+# одним GROUP BY (месяц, статус, роль) за один проход и кэшируются по (период, фильтры).
 from abc import ABC, abstractmethod
+from datetime import date, timedelta
+
+from sqlalchemy import func, select
+
+from cache import TTLCache
+from db import DbSessionManager, User, Order as OrderModel, data_versions
+from users import normalize_role, role_values
+
+# --- агрегаты ---
+
+class ReportData:
+    """Итоги по заказам за период: всего, по статусам, по ролям клиентов и по месяцам.
+
+    Каждый разрез — dict ключ -> [число заказов, сумма].
+    """
+    __slots__ = ('count', 'revenue', 'by_status', 'by_role', 'by_month', 'by_month_status')
+
+    def __init__(self):
+        self.count = 0
+        self.revenue = 0
+        self.by_status = {}
+        self.by_role = {}
+        self.by_month = {}
+        self.by_month_status = {}
+
+    @staticmethod
+    def _add(breakdown, key, count, amount):
+        bucket = breakdown.setdefault(key, [0, 0])
+        bucket[0] += count
+        bucket[1] += amount
+
+    def add(self, month, status, role, count, amount):
+        self.count += count
+        self.revenue += amount
+        self._add(self.by_status, status, count, amount)
+        self._add(self.by_role, normalize_role(role), count, amount)
+        self._add(self.by_month, month, count, amount)
+        self._add(self.by_month_status, (month, status), count, amount)
+
+    @property
+    def avg_check(self):
+        return self.revenue / self.count if self.count else 0
+
+    def status_count(self, *statuses):
+        return sum(self.by_status.get(s, (0, 0))[0] for s in statuses)
+
+
+# Фильтры Builder: имя -> (разбор значения из строки, условие SQL)
+FILTERS = {
+    'status': (str, lambda v: func.coalesce(OrderModel.status, 'Создан') == v),
+    'role': (str, lambda v: User.role.in_(role_values(v))),
+    'user_id': (int, lambda v: OrderModel.user_id == v),
+    'min_total': (int, lambda v: OrderModel.total >= v),
+    'max_total': (int, lambda v: OrderModel.total <= v),
+}
+
+
+def report_query(date_from=None, date_to=None, filters=()):
+    """SELECT месяц, статус, роль, count, sum — date_to включительно."""
+    month = func.strftime('%Y-%m', OrderModel.created_at)
+    status = func.coalesce(OrderModel.status, 'Создан')
+    role = func.coalesce(User.role, '')
+    q = (
+        select(month, status, role, func.count(OrderModel.id), func.coalesce(func.sum(OrderModel.total), 0))
+        .outerjoin(User, User.id == OrderModel.user_id)
+    )
+    if date_from:
+        q = q.where(OrderModel.created_at >= date_from)
+    if date_to:
+        q = q.where(OrderModel.created_at < date_to + timedelta(days=1))
+    for name, value in filters:
+        q = q.where(FILTERS[name][1](value))
+    return q.group_by(month, status, role)
+
+
+def compute_report_data(db, date_from=None, date_to=None, filters=()):
+    data = ReportData()
+    for month, status, role, count, amount in db.execute(report_query(date_from, date_to, filters)):
+        data.add(month, status, role, count, amount)
+    return data
+
+
+# Агрегаты не зависят от типа отчёта: финансовый, аналитический и логистический
+# за один период с одними фильтрами читают одну запись кэша
+report_cache = TTLCache(maxsize=256, ttl=300)
+
+
+def invalidate_report_cache(day):
+    """Сбрасывает закэшированные отчёты, период которых содержит day (новый заказ, смена статуса)."""
+    report_cache.invalidate_where(
+        lambda key: (key[0] is None or key[0] <= day) and (key[1] is None or day <= key[1])
+    )
+
+
+def _money(value):
+    return f"{value:,.0f}".replace(',', ' ')
+
 
 # Базовые классы отчетов
 class SummaryReport:
-    def __init__(self):
+    def __init__(self, data=None):
+        self.data = data
         self.content = ""
 
 class DetailedReport:
-    def __init__(self):
+    def __init__(self, data=None):
+        self.data = data
         self.content = ""
 
 # Абстрактная фабрика
 class ReportFactory(ABC):
     @abstractmethod
-    def create_summary(self) -> SummaryReport: ...
+    def create_summary(self, data: ReportData) -> SummaryReport: ...
     @abstractmethod
-    def create_detailed(self) -> DetailedReport: ...
+    def create_detailed(self, data: ReportData) -> DetailedReport: ...
 
 # Финансовые отчеты
 class FinancialReportFactory(ReportFactory):
-    def create_summary(self):
-        r = SummaryReport()
+    def create_summary(self, data):
+        r = SummaryReport(data)
+        completed = data.by_status.get('Завершен', (0, 0))[1]
         r.content = (
             "=== Финансовый Сводный Отчет ===\n"
-            "- Доходы: 100 000\n"
-            "- Расходы: 60 000\n"
-            "- Прибыль: 40 000\n"
+            f"- Выручка (все заказы): {_money(data.revenue)}\n"
+            f"- Из них завершённые: {_money(completed)}\n"
+            f"- Заказов: {data.count}\n"
+            f"- Средний чек: {_money(data.avg_check)}\n"
         )
         return r
-    def create_detailed(self):
-        r = DetailedReport()
-        r.content = (
-            "=== Финансовый Детальный Отчет ===\n"
-            "• Январь: прибыль 5 000\n"
-            "• Февраль: прибыль 6 000\n"
-            "• …\n"
+    def create_detailed(self, data):
+        r = DetailedReport(data)
+        r.content = "=== Финансовый Детальный Отчет ===\n" + "".join(
+            f"• {month}: выручка {_money(amount)}, заказов {count}\n"
+            for month, (count, amount) in sorted(data.by_month.items())
         )
         return r
 
 # Аналитические отчеты
 class AnalyticalReportFactory(ReportFactory):
-    def create_summary(self):
-        r = SummaryReport()
+    def create_summary(self, data):
+        r = SummaryReport(data)
         r.content = (
             "=== Аналитический Сводный Отчет ===\n"
-            "- Тренд продаж: ↑ 12%\n"
-            "- Средний чек: 250\n"
+            f"- Тренд продаж: {self._trend(data)}\n"
+            f"- Средний чек: {_money(data.avg_check)}\n"
         )
         return r
-    def create_detailed(self):
-        r = DetailedReport()
-        r.content = (
-            "=== Аналитический Детальный Отчет ===\n"
-            "• Топ‑3 товара по продажам\n"
-            "• Поведение клиентов по сегментам\n"
+    def create_detailed(self, data):
+        r = DetailedReport(data)
+        r.content = "=== Аналитический Детальный Отчет ===\n" + "".join(
+            f"• {role or 'без роли'}: заказов {count}, выручка {_money(amount)}, "
+            f"средний чек {_money(amount / count if count else 0)}\n"
+            for role, (count, amount) in sorted(data.by_role.items(), key=lambda kv: -kv[1][1])
         )
         return r
+    @staticmethod
+    def _trend(data):
+        """Выручка последнего месяца периода против предыдущего."""
+        months = sorted(data.by_month)
+        if len(months) < 2 or not data.by_month[months[-2]][1]:
+            return "недостаточно данных"
+        prev, last = data.by_month[months[-2]][1], data.by_month[months[-1]][1]
+        change = (last - prev) / prev * 100
+        return f"{'↑' if change >= 0 else '↓'} {abs(change):.0f}% ({months[-1]} к {months[-2]})"
 
 # Логистические отчеты
 class LogisticsReportFactory(ReportFactory):
-    def create_summary(self):
-        r = SummaryReport()
+    def create_summary(self, data):
+        r = SummaryReport(data)
         r.content = (
             "=== Логистический Сводный Отчет ===\n"
-            "- Всего доставок: 320\n"
-            "- Среднее время доставки: 2.5 ч\n"
+            f"- Всего заказов: {data.count}\n"
+            f"- В работе: {data.status_count('Создан', 'В обработке')}\n"
+            f"- Отправлено: {data.status_count('Отправлен')}\n"
+            f"- Завершено: {data.status_count('Завершен')}\n"
         )
         return r
-    def create_detailed(self):
-        r = DetailedReport()
-        r.content = (
-            "=== Логистический Детальный Отчет ===\n"
-            "• Маршрут A–B: 120 доставок\n"
-            "• Маршрут B–C: 80 доставок\n"
-        )
+    def create_detailed(self, data):
+        r = DetailedReport(data)
+        lines = []
+        for month in sorted(data.by_month):
+            counts = ", ".join(f"{status} {count}" for (m, status), (count, _) in
+                               sorted(data.by_month_status.items()) if m == month)
+            lines.append(f"• {month}: {counts}\n")
+        r.content = "=== Логистический Детальный Отчет ===\n" + "".join(lines)
         return r
 
-# Builder для фильтров и периода (ваш существующий код)
+
+def _as_date(value):
+    if isinstance(value, date) or value is None:
+        return value
+    return date.fromisoformat(value) if value else None
+
+
+# Builder для фильтров и периода
 class ReportBuilder:
-    def __init__(self, factory: ReportFactory):
+    """Период и фильтры -> условия SQL; агрегаты считаются один раз и общие для summary/detailed.
+
+    Фильтр — строка "имя=значение" (как в форме отчётов) или add_filter(имя, значение);
+    имена — ключи FILTERS. Неизвестный фильтр или неверное значение -> ValueError.
+    """
+    def __init__(self, factory: ReportFactory, cache=report_cache):
         self.factory = factory
-        self.date_range = None
+        self.cache = cache
+        self.date_range = (None, None)
         self.filters = []
     def set_date_range(self, start, end):
-        self.date_range = (start, end)
+        self.date_range = (_as_date(start), _as_date(end))
         return self
-    def add_filter(self, f):
-        self.filters.append(f)
+    def add_filter(self, f, value=None):
+        if value is None:
+            f, sep, value = f.partition('=')
+            if not sep:
+                raise ValueError(f"Фильтр ожидается в виде имя=значение: {f!r}")
+        name = f.strip()
+        if name not in FILTERS:
+            raise ValueError(f"Неизвестный фильтр {name!r}; доступны: {', '.join(FILTERS)}")
+        self.filters.append((name, FILTERS[name][0](value.strip() if isinstance(value, str) else value)))
         return self
-    def build_summary(self):
-        r = self.factory.create_summary()
-        r.content += f"Период: {self.date_range}\n"
+    def data(self):
+        with DbSessionManager() as db:
+            # версии orders и users в ключе: отчёт другого воркера или до сброса кэша не выдаётся за свежий
+            key = (*self.date_range, tuple(sorted(self.filters)), data_versions(db, ('orders', 'users')))
+            data = self.cache.get(key)
+            if data is None:
+                generation = self.cache.generation
+                data = compute_report_data(db, *self.date_range, self.filters)
+                self.cache.set(key, data, generation=generation)
+        return data
+    def _footer(self):
+        start, end = self.date_range
+        text = f"Период: {start or '…'} — {end or '…'}\n"
         if self.filters:
-            r.content += f"Фильтры: {self.filters}\n"
+            text += "Фильтры: " + ", ".join(f"{name}={value}" for name, value in self.filters) + "\n"
+        return text
+    def build_summary(self):
+        r = self.factory.create_summary(self.data())
+        r.content += self._footer()
         return r
     def build_detailed(self):
-        r = self.factory.create_detailed()
-        r.content += f"Период: {self.date_range}\n"
-        if self.filters:
-            r.content += f"Фильтры: {self.filters}\n"
+        r = self.factory.create_detailed(self.data())
+        r.content += self._footer()
         return r
+
+
+if __name__ == '__main__':
+    import sys
+    factories = {'financial': FinancialReportFactory, 'analytical': AnalyticalReportFactory,
+                 'logistics': LogisticsReportFactory}
+    builder = ReportBuilder(factories[sys.argv[1] if len(sys.argv) > 1 else 'financial']())
+    for f in sys.argv[2:]:
+        builder.add_filter(f)
+    print(builder.build_summary().content)
+    print(builder.build_detailed().content)
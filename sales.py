@@ -0,0 +1,228 @@
+# sales.py: rollup-таблица daily_sales — инкрементальное обновление, пересборка и сверка
+import sys
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+
+from cache import TTLCache
+from db import DbSessionManager, DailySales, Order as OrderModel, data_versions, data_versions_query
+
+
+def _bump(db, day, status, count, amount):
+    """Атомарно прибавляет count/amount к строке (day, status), создавая её при необходимости."""
+    _bump_many(db, [(day, status, count, amount)])
+
+
+def _bump_many(db, deltas):
+    """То же для пачки (day, status, count, amount) — один executemany-upsert."""
+    if not deltas:
+        return
+    stmt = sqlite_insert(DailySales)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DailySales.day, DailySales.status],
+        set_={
+            'orders_count': DailySales.orders_count + stmt.excluded.orders_count,
+            'total_sum': DailySales.total_sum + stmt.excluded.total_sum,
+        }
+    )
+    db.execute(stmt, [{'day': day, 'status': status, 'orders_count': count, 'total_sum': amount}
+                      for day, status, count, amount in deltas])
+
+
+# --- инкрементальные обновления: вызываются в той же транзакции, что и запись Order ---
+
+def record_order_created(db, order):
+    """Учитывает новый заказ. Заказ должен быть уже flush-нут (status/created_at заполнены)."""
+    day = order.created_at.date()
+    _bump(db, day, order.status, 1, order.total)
+    return day
+
+
+def record_status_change(db, order, old_status):
+    """Переносит заказ из строки старого статуса в строку нового."""
+    day = order.created_at.date()
+    if old_status != order.status:
+        _bump(db, day, old_status, -1, -order.total)
+        _bump(db, day, order.status, 1, order.total)
+    return day
+
+
+def record_orders_bulk(db, orders):
+    """Учитывает пачку заказов (dict с created_at/status/total) — одна запись на (день, статус)."""
+    groups = {}
+    for order in orders:
+        key = (order['created_at'].date(), order['status'])
+        count, amount = groups.get(key, (0, 0))
+        groups[key] = (count + 1, amount + order['total'])
+    _bump_many(db, [(day, status, count, amount) for (day, status), (count, amount) in groups.items()])
+    return {day for day, _ in groups}
+
+
+def record_status_changes(db, changes):
+    """Переносит пачку заказов между статусами: changes — (created_at, total, старый, новый).
+
+    Одна запись rollup на (день, статус), сколько бы заказов ни сменило статус.
+    """
+    groups = {}
+    for created_at, total, old_status, new_status in changes:
+        day = created_at.date()
+        for status, sign in ((old_status, -1), (new_status, 1)):
+            count, amount = groups.get((day, status), (0, 0))
+            groups[(day, status)] = (count + sign, amount + sign * total)
+    _bump_many(db, [(day, status, count, amount) for (day, status), (count, amount) in groups.items()
+                    if count or amount])
+    return {day for day, _ in groups}
+
+
+# --- чтение: ряды для графика с кэшем по (from, to, bucket, версия orders) ---
+
+# Метка периода, вычисляемая в SQL по колонке day
+BUCKETS = {
+    'day': lambda col: func.date(col),
+    'week': lambda col: func.date(col, 'weekday 0', '-6 days'),   # понедельник недели
+    'month': lambda col: func.strftime('%Y-%m', col),
+}
+
+sales_cache = TTLCache(maxsize=256, ttl=300)
+
+
+def sales_series_query(date_from=None, date_to=None, bucket='day'):
+    """SELECT сумм по периодам bucket за [date_from, date_to] — только по rollup."""
+    label = BUCKETS[bucket](DailySales.day)
+    q = select(label.label('label'), func.sum(DailySales.total_sum).label('sum'))
+    if date_from:
+        q = q.where(DailySales.day >= date_from)
+    if date_to:
+        q = q.where(DailySales.day <= date_to)
+    return q.group_by(label).having(func.sum(DailySales.orders_count) > 0).order_by(label)
+
+
+def _series(rows):
+    # Result читается один раз: без all() второй список получился бы пустым
+    rows = rows.all()
+    return {
+        'labels': [row.label for row in rows],
+        'totals': [float(row.sum) for row in rows]
+    }
+
+
+def sales_series(db, date_from=None, date_to=None, bucket='day'):
+    """Суммы продаж по периодам bucket за [date_from, date_to] — читает только rollup."""
+    # daily_sales пишется в одной транзакции с orders — версии orders достаточно (см. db.data_versions)
+    key = (date_from, date_to, bucket, data_versions(db, ('orders',)))
+    data = sales_cache.get(key)
+    if data is not None:
+        return data
+    generation = sales_cache.generation
+    data = _series(db.execute(sales_series_query(date_from, date_to, bucket)))
+    sales_cache.set(key, data, generation=generation)
+    return data
+
+
+async def sales_series_async(db, date_from=None, date_to=None, bucket='day'):
+    """То же для AsyncSession (ASGI-режим); кэш общий с синхронным путём."""
+    try:
+        versions = tuple(map(tuple, await db.execute(data_versions_query(('orders',)))))
+    except OperationalError:
+        versions = ()
+    key = (date_from, date_to, bucket, versions)
+    data = sales_cache.get(key)
+    if data is not None:
+        return data
+    generation = sales_cache.generation
+    data = _series(await db.execute(sales_series_query(date_from, date_to, bucket)))
+    sales_cache.set(key, data, generation=generation)
+    return data
+
+
+def invalidate_sales_cache(day):
+    """Сбрасывает только закэшированные ряды, диапазон которых содержит day."""
+    sales_cache.invalidate_where(
+        lambda key: (key[0] is None or key[0] <= day) and (key[1] is None or day <= key[1])
+    )
+
+
+# --- пересборка и сверка с живым агрегатом ---
+
+def _live_aggregate():
+    day = func.date(OrderModel.created_at)
+    status = func.coalesce(OrderModel.status, 'Создан')
+    return (
+        select(day, status, func.count(OrderModel.id), func.sum(OrderModel.total))
+        .group_by(day, status)
+    )
+
+
+def rebuild_daily_sales(db):
+    """Полностью пересобирает rollup по таблице orders (коммит — на вызывающем)."""
+    db.query(DailySales).delete()
+    db.execute(
+        insert(DailySales).from_select(
+            ['day', 'status', 'orders_count', 'total_sum'], _live_aggregate()
+        )
+    )
+
+
+def check_daily_sales(db, tolerance=0.005):
+    """Сравнивает rollup с живым агрегатом.
+
+    Возвращает список расхождений (day, status, (count, sum) live, (count, sum) rollup).
+    """
+    live = {
+        (day, status): (count, float(total or 0))
+        for day, status, count, total in db.execute(_live_aggregate())
+    }
+    rolled = {
+        (r.day.isoformat(), r.status): (r.orders_count, r.total_sum)
+        for r in db.query(DailySales)
+        if r.orders_count or abs(r.total_sum) > tolerance
+    }
+    diffs = []
+    for key in sorted(live.keys() | rolled.keys()):
+        l_count, l_sum = live.get(key, (0, 0.0))
+        r_count, r_sum = rolled.get(key, (0, 0.0))
+        if l_count != r_count or abs(l_sum - r_sum) > tolerance:
+            diffs.append((key[0], key[1], (l_count, l_sum), (r_count, r_sum)))
+    return diffs
+
+
+def check_sales_series(db, tolerance=0.005):
+    """Ряд графика (bucket=day, мимо кэша) против живых сумм по дням.
+
+    Возвращает список расхождений (метка, сумма live, сумма в ряду); разная длина
+    labels и totals — тоже расхождение.
+    """
+    series = _series(db.execute(sales_series_query()))
+    if len(series['labels']) != len(series['totals']):
+        return [('labels/totals', len(series['labels']), len(series['totals']))]
+    live = {}
+    for day, _, count, total in db.execute(_live_aggregate()):
+        if count:
+            live[day] = live.get(day, 0.0) + float(total or 0)
+    plotted = dict(zip(series['labels'], series['totals']))
+    return [(day, live.get(day, 0.0), plotted.get(day, 0.0))
+            for day in sorted(live.keys() | plotted.keys())
+            if abs(live.get(day, 0.0) - plotted.get(day, 0.0)) > tolerance]
+
+
+# CLI: python sales.py rebuild | check
+if __name__ == '__main__':
+    cmd = sys.argv[1] if len(sys.argv) > 1 else 'check'
+    with DbSessionManager() as db:
+        if cmd == 'rebuild':
+            rebuild_daily_sales(db)
+            db.commit()
+            print("Rollup daily_sales пересобран")
+        elif cmd == 'check':
+            diffs = check_daily_sales(db)
+            for day, status, live, rolled in diffs:
+                print(f"{day} «{status}»: orders={live}, daily_sales={rolled}")
+            print("Расхождений:", len(diffs))
+            series_diffs = check_sales_series(db)
+            for label, live, plotted in series_diffs:
+                print(f"ряд графика {label}: orders={live}, /api/sales_data={plotted}")
+            print("Расхождений в ряду графика:", len(series_diffs))
+            sys.exit(1 if diffs or series_diffs else 0)
+        else:
+            print("Использование: python sales.py rebuild|check")
+            sys.exit(2)
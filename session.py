@@ -1,25 +1,308 @@
 # session.py: Singleton – глобальный менеджер сессий пользователей
+# Сессии живут в подключаемом хранилище (SessionBackend):
+#   MemoryBackend — в памяти процесса: LRU + TTL, блокировки разбиты на полосы (lock striping);
+#   SqlBackend    — таблица web_sessions в общей БД: сессии видны всем воркерам и переживают рестарт.
+# Выбор: CRM_SESSION_BACKEND=sql|memory (по умолчанию sql: приложение сверяет с ним cookie на каждом
+# запросе), время жизни — CRM_SESSION_TTL (секунды, скользящее).
+import os
+import secrets
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from sqlalchemy import select, insert, update, delete, func
+
+import events
+from db import WebSession
+
+
+class SessionRecord:
+    __slots__ = ('sid', 'user_key', 'name', 'email', 'role', 'created_at', 'ttl', 'expires_at')
+
+    def __init__(self, sid, user_key, name, email, role, created_at, ttl, expires_at):
+        self.sid = sid
+        self.user_key = user_key
+        self.name = name
+        self.email = email
+        self.role = role
+        self.created_at = created_at
+        self.ttl = ttl
+        self.expires_at = expires_at
+
+    def __repr__(self):
+        return f"SessionRecord({self.sid!r}, user={self.user_key!r}, expires_at={self.expires_at:.0f})"
+
+
+def user_key(user):
+    """Ключ пользователя: id из БД, а у объектов из users.py (без id) — email."""
+    user_id = getattr(user, 'id', None)
+    return str(user_id) if user_id is not None else user.email
+
+
+class SessionBackend(ABC):
+    """Хранилище сессий: O(1) по id сессии и по ключу пользователя.
+
+    shared — хранилище общее для всех процессов: отсутствие в нём сессии значит, что она закрыта,
+    а не открыта другим воркером или до рестарта.
+    """
+    shared = False
+
+    @abstractmethod
+    def get(self, sid, now):
+        """-> SessionRecord или None; просроченная запись удаляется."""
+
+    @abstractmethod
+    def put(self, record):
+        pass
+
+    @abstractmethod
+    def touch(self, record, expires_at):
+        """Продлевает сессию (скользящий TTL)."""
+
+    @abstractmethod
+    def delete(self, sid):
+        """-> True, если сессия была."""
+
+    @abstractmethod
+    def sids_for_user(self, key):
+        pass
+
+    @abstractmethod
+    def purge_expired(self, now):
+        """Удаляет просроченные сессии; -> их число."""
+
+    @abstractmethod
+    def __len__(self):
+        pass
+
+
+class MemoryBackend(SessionBackend):
+    """Сессии в памяти процесса, разбитые на stripes полос со своими блокировками.
+
+    Каждая полоса — OrderedDict в порядке последнего обращения: при переполнении
+    (maxsize / stripes записей) вытесняется самая давно не использованная сессия.
+    Индекс по пользователю тоже разбит на полосы; порядок блокировок всегда
+    «полоса сессии -> полоса пользователя», поэтому взаимных блокировок нет.
+    """
+    def __init__(self, maxsize=100000, stripes=16):
+        self.per_stripe = max(1, maxsize // stripes)
+        self._sessions = [(threading.Lock(), OrderedDict()) for _ in range(stripes)]
+        self._users = [(threading.Lock(), {}) for _ in range(stripes)]
+        self.evicted = 0
+
+    def _session_stripe(self, sid):
+        return self._sessions[hash(sid) % len(self._sessions)]
+
+    def _user_stripe(self, key):
+        return self._users[hash(key) % len(self._users)]
+
+    def _index(self, record):
+        lock, index = self._user_stripe(record.user_key)
+        with lock:
+            index.setdefault(record.user_key, set()).add(record.sid)
+
+    def _unindex(self, record):
+        lock, index = self._user_stripe(record.user_key)
+        with lock:
+            sids = index.get(record.user_key)
+            if sids is not None:
+                sids.discard(record.sid)
+                if not sids:
+                    del index[record.user_key]
+
+    def get(self, sid, now):
+        lock, data = self._session_stripe(sid)
+        with lock:
+            record = data.get(sid)
+            if record is None:
+                return None
+            if record.expires_at <= now:
+                del data[sid]
+                self._unindex(record)
+                return None
+            data.move_to_end(sid)
+            return record
+
+    def put(self, record):
+        lock, data = self._session_stripe(record.sid)
+        with lock:
+            data[record.sid] = record
+            data.move_to_end(record.sid)
+            self._index(record)
+            while len(data) > self.per_stripe:
+                _, oldest = data.popitem(last=False)
+                self._unindex(oldest)
+                self.evicted += 1
+
+    def touch(self, record, expires_at):
+        record.expires_at = expires_at
+
+    def delete(self, sid):
+        lock, data = self._session_stripe(sid)
+        with lock:
+            record = data.pop(sid, None)
+            if record is not None:
+                self._unindex(record)
+        return record is not None
+
+    def sids_for_user(self, key):
+        lock, index = self._user_stripe(key)
+        with lock:
+            return list(index.get(key, ()))
+
+    def purge_expired(self, now):
+        purged = 0
+        for lock, data in self._sessions:
+            with lock:
+                for sid in [sid for sid, record in data.items() if record.expires_at <= now]:
+                    self._unindex(data.pop(sid))
+                    purged += 1
+        return purged
+
+    def __len__(self):
+        return sum(len(data) for _, data in self._sessions)
+
+
+class SqlBackend(SessionBackend):
+    """Сессии в таблице web_sessions (общая БД) — для нескольких процессов-воркеров.
+
+    Раз в trim_every новых сессий лишние сверх maxsize удаляются — те, что истекают раньше
+    всех (при скользящем TTL это и есть давно не использованные).
+    """
+    shared = True
+
+    def __init__(self, bind=None, maxsize=100000, trim_every=500):
+        self.bind = bind
+        self.maxsize = maxsize
+        self.trim_every = trim_every
+        self._puts = 0
+
+    def _bind(self):
+        if self.bind is None:
+            from db import engine
+            self.bind = engine
+        return self.bind
+
+    @staticmethod
+    def _record(row):
+        return SessionRecord(row.sid, row.user_key, row.name, row.email, row.role,
+                             row.created_at, row.ttl, row.expires_at)
+
+    def get(self, sid, now):
+        with self._bind().begin() as conn:
+            row = conn.execute(select(WebSession.__table__).where(WebSession.sid == sid)).first()
+            if row is None:
+                return None
+            if row.expires_at <= now:
+                conn.execute(delete(WebSession).where(WebSession.sid == sid))
+                return None
+            return self._record(row)
+
+    def put(self, record):
+        with self._bind().begin() as conn:
+            conn.execute(insert(WebSession).values(
+                sid=record.sid, user_key=record.user_key, name=record.name, email=record.email,
+                role=record.role, created_at=record.created_at, ttl=record.ttl, expires_at=record.expires_at))
+            self._puts += 1
+            if self._puts % self.trim_every == 0:
+                self._trim(conn)
+
+    def _trim(self, conn):
+        excess = conn.scalar(select(func.count()).select_from(WebSession)) - self.maxsize
+        if excess > 0:
+            oldest = select(WebSession.sid).order_by(WebSession.expires_at).limit(excess)
+            conn.execute(delete(WebSession).where(WebSession.sid.in_(oldest)))
+
+    def touch(self, record, expires_at):
+        record.expires_at = expires_at
+        with self._bind().begin() as conn:
+            conn.execute(update(WebSession).where(WebSession.sid == record.sid).values(expires_at=expires_at))
+
+    def delete(self, sid):
+        with self._bind().begin() as conn:
+            return conn.execute(delete(WebSession).where(WebSession.sid == sid)).rowcount > 0
+
+    def sids_for_user(self, key):
+        with self._bind().connect() as conn:
+            return list(conn.scalars(select(WebSession.sid).where(WebSession.user_key == key)))
+
+    def purge_expired(self, now):
+        with self._bind().begin() as conn:
+            return conn.execute(delete(WebSession).where(WebSession.expires_at <= now)).rowcount
+
+    def __len__(self):
+        with self._bind().connect() as conn:
+            return conn.scalar(select(func.count()).select_from(WebSession))
+
+
+BACKENDS = {'memory': MemoryBackend, 'sql': SqlBackend}
+
+
 class SessionManager:
     _instance = None
+    _instance_lock = threading.Lock()
 
     def __new__(cls):
         if cls._instance is None:
-            print("Создание нового менеджера сессий.")
-            cls._instance = super(SessionManager, cls).__new__(cls)
-            cls._instance.active_sessions = {}
+            with cls._instance_lock:
+                if cls._instance is None:
+                    if events.enabled:
+                        events.emit('session.manager_created', "Создание нового менеджера сессий.")
+                    instance = super(SessionManager, cls).__new__(cls)
+                    instance.backend = BACKENDS[os.environ.get('CRM_SESSION_BACKEND', 'sql')]()
+                    instance.ttl = float(os.environ.get('CRM_SESSION_TTL', 8 * 3600))
+                    cls._instance = instance
         return cls._instance
 
-    def login(self, user):
-        self.active_sessions[user.email] = user
-        print(f"Пользователь {user.name} вошел в систему.")
+    def use_backend(self, backend):
+        """Подменяет хранилище (например, на SqlBackend или заглушку в проверках)."""
+        self.backend = backend
+
+    def login(self, user, ttl=None):
+        """Открывает новую сессию пользователя; -> её id."""
+        now = time.time()
+        ttl = ttl or self.ttl
+        sid = secrets.token_urlsafe(24)
+        role = user.role() if callable(user.role) else user.role
+        self.backend.put(SessionRecord(sid, user_key(user), user.name, user.email, role, now, ttl, now + ttl))
+        if events.enabled:
+            events.emit('session.login', f"Пользователь {user.name} вошел в систему.", email=user.email)
+        return sid
+
+    def get(self, sid):
+        """Сессия по id или None; продлевает её, если прошла половина срока."""
+        if not sid:
+            return None
+        now = time.time()
+        record = self.backend.get(sid, now)
+        if record is not None and record.expires_at - now < record.ttl / 2:
+            self.backend.touch(record, now + record.ttl)
+        return record
+
+    def end(self, sid):
+        return bool(sid) and self.backend.delete(sid)
+
+    def sessions_for(self, user):
+        now = time.time()
+        records = (self.backend.get(sid, now) for sid in self.backend.sids_for_user(user_key(user)))
+        return [record for record in records if record is not None]
 
     def logout(self, user):
-        if user.email in self.active_sessions:
-            del self.active_sessions[user.email]
-            print(f"Пользователь {user.name} вышел из системы.")
+        """Закрывает все сессии пользователя."""
+        closed = [sid for sid in self.backend.sids_for_user(user_key(user)) if self.backend.delete(sid)]
+        if closed and events.enabled:
+            events.emit('session.logout', f"Пользователь {user.name} вышел из системы.", email=user.email)
+
+    def purge_expired(self):
+        return self.backend.purge_expired(time.time())
+
+    def __len__(self):
+        return len(self.backend)
 
 # Пример использования Одиночки
 if __name__ == "__main__":
+    events.subscribe(events.print_event)
     manager = SessionManager()
     manager2 = SessionManager()
     print("Singleton одинаковый экземпляр:", manager is manager2)
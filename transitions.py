@@ -0,0 +1,136 @@
+# transitions.py: смена статуса заказов — одного или сотен сразу — по машине состояний order.STATUS_TRANSITIONS
+# Вся пачка — одна транзакция: UPDATE ... WHERE id IN (...) AND status = ? RETURNING на каждый допустимый
+# исходный статус, rollup daily_sales по (день, статус), события outbox и аудит — пакетными INSERT.
+# Уведомления доставит релей outbox, сгруппировав их по получателю.
+# Ручная правка одного заказа (/update_status) идёт тем же путём, но без машины состояний (enforce=False).
+#   python transitions.py Отправлен 12 15 18 --from "В обработке"
+import argparse
+import datetime
+from collections import namedtuple
+
+from sqlalchemy import func, insert, select, update
+
+from db import DbSessionManager, Audit, Order as OrderModel
+from order import ORDER_STATUSES, transition_sources
+from outbox import enqueue_status_changes, outbox_relay
+from sales import record_status_changes
+
+# одна пачка укладывается в лимит параметров SQLite и в разумное время блокировки записи
+MAX_BULK_ORDERS = 1000
+
+Rejected = namedtuple('Rejected', 'id status reason')
+TransitionResult = namedtuple('TransitionResult', 'status moved rejected days')
+
+
+def parse_ids(values):
+    """Список id из значений формы/JSON: числа или строки вида "12, 15 18"."""
+    ids = []
+    for value in values:
+        if isinstance(value, int) and not isinstance(value, bool):
+            ids.append(value)
+            continue
+        for part in str(value).replace(',', ' ').split():
+            try:
+                ids.append(int(part))
+            except ValueError:
+                raise ValueError(f"Некорректный id заказа: {part!r}") from None
+    return ids
+
+
+def _reject_reason(status, new_status, from_status):
+    if status is None:
+        return 'заказ не найден'
+    if status == new_status:
+        return 'уже в этом статусе'
+    if from_status is not None and status != from_status:
+        return f"статус «{status}», ожидался «{from_status}»"
+    return f"переход «{status}» → «{new_status}» недопустим"
+
+
+def transition_orders(db, order_ids, new_status, from_status=None, performed_by=None, enforce=True):
+    """Переводит заказы в new_status; -> TransitionResult. Коммит — на вызывающем.
+
+    from_status — двигать только заказы в этом статусе; без него — из любого статуса,
+    откуда переход разрешён. enforce=False — без машины состояний: из любого статуса,
+    в том числе назад из «Завершен». Заказы, которые не сдвинулись, попадают в rejected с причиной.
+    Неизвестный статус или пачка больше MAX_BULK_ORDERS -> ValueError.
+    """
+    if new_status not in ORDER_STATUSES:
+        raise ValueError(f"Неизвестный статус: {new_status!r}")
+    ids = list(dict.fromkeys(order_ids))
+    if len(ids) > MAX_BULK_ORDERS:
+        raise ValueError(f"Не больше {MAX_BULK_ORDERS} заказов за раз, передано {len(ids)}")
+    current = func.coalesce(OrderModel.status, 'Создан')
+    if enforce:
+        sources = transition_sources(new_status)
+    else:
+        # исходные статусы — те, в которых заказы сейчас: по UPDATE на каждый, как и с машиной состояний
+        sources = tuple(db.scalars(select(current).where(OrderModel.id.in_(ids)).distinct()))
+    if from_status is not None:
+        sources = (from_status,) if from_status in sources else ()
+
+    moved = []
+    for old_status in sources:
+        # исходный статус известен из WHERE, остальное для rollup и outbox отдаёт RETURNING
+        rows = db.execute(
+            update(OrderModel)
+            .where(OrderModel.id.in_(ids), current == old_status)
+            .values(status=new_status)
+            .returning(OrderModel.id, OrderModel.user_id, OrderModel.total, OrderModel.created_at),
+            execution_options={'synchronize_session': False},
+        ).all()
+        moved.extend((row, old_status) for row in rows)
+
+    moved_ids = {row.id for row, _ in moved}
+    rest = [order_id for order_id in ids if order_id not in moved_ids]
+    found = dict(db.execute(select(OrderModel.id, current).where(OrderModel.id.in_(rest))).all()) if rest else {}
+    rejected = [Rejected(order_id, found.get(order_id), _reject_reason(found.get(order_id), new_status, from_status))
+                for order_id in rest]
+    if not moved:
+        return TransitionResult(new_status, [], rejected, set())
+
+    days = record_status_changes(db, [(row.created_at, row.total, old, new_status) for row, old in moved])
+    enqueue_status_changes(db, [(row.id, row.user_id, old, new_status) for row, old in moved],
+                           performed_by=performed_by)
+    now = datetime.datetime.now()
+    db.execute(insert(Audit), [
+        {'entity': 'Order', 'entity_id': row.id, 'action': 'status_change', 'detail': new_status,
+         'performed_by': performed_by, 'timestamp': now}
+        for row, _ in moved
+    ])
+    position = {order_id: i for i, order_id in enumerate(ids)}
+    return TransitionResult(new_status, sorted(moved_ids, key=position.get), rejected, days)
+
+
+def change_status(order_ids, new_status, from_status=None, performed_by=None, enforce=True):
+    """transition_orders в своей транзакции, затем сброс кэша отчётов и доставка уведомлений."""
+    with DbSessionManager() as db:
+        result = transition_orders(db, order_ids, new_status, from_status, performed_by, enforce)
+        db.commit()
+    if result.moved:
+        # суммы по дням не меняются — кэш графика остаётся, разбивка отчётов по статусам — нет
+        from reports import invalidate_report_cache
+        for day in result.days:
+            invalidate_report_cache(day)
+        outbox_relay.wake()
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Смена статуса заказов по машине состояний')
+    parser.add_argument('status', choices=ORDER_STATUSES)
+    parser.add_argument('ids', nargs='+')
+    parser.add_argument('--from', dest='from_status', help='двигать только заказы в этом статусе')
+    args = parser.parse_args()
+
+    # из CLI уведомления доставляются сразу, до выхода процесса
+    from notification import dispatcher, ClientObserver, ManagerObserver
+    dispatcher.register(ClientObserver())
+    dispatcher.register(ManagerObserver())
+    outbox_relay.mode = 'sync'
+    outbox_relay.start(dispatcher)
+
+    result = change_status(parse_ids(args.ids), args.status, args.from_status)
+    print(f"Переведено в «{result.status}»: {len(result.moved)} {result.moved}")
+    for rejected in result.rejected:
+        print(f"✘ {rejected.id}: {rejected.reason}")
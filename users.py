@@ -1,8 +1,35 @@
 # users.py: Factory Method для создания различных типов пользователей
 from abc import ABC, abstractmethod
 
+# Роли: в users.role пишется код, название — только для показа.
+# Пользователи, созданные из админки раньше, записаны с названием роли;
+# все проверки прав и фильтры сводят значение к коду через normalize_role/role_values.
+ROLE_CLIENT = 'client'
+ROLE_MANAGER = 'manager'
+ROLE_ADMIN = 'admin'
+ROLE_NAMES = {
+    ROLE_CLIENT: "Клиент",
+    ROLE_MANAGER: "Менеджер",
+    ROLE_ADMIN: "Администратор",
+}
+_ROLE_CODES = {name: code for code, name in ROLE_NAMES.items()}
+
+# кто может массово менять статусы заказов (склад и менеджеры, администраторы)
+BULK_UPDATE_ROLES = frozenset({ROLE_MANAGER, ROLE_ADMIN})
+
+def normalize_role(role):
+    """Код роли по значению из users.role (код или название); неизвестное — как есть."""
+    return _ROLE_CODES.get(role, role)
+
+def role_values(role):
+    """Все варианты записи роли в users.role — для фильтров SQL (User.role.in_(...))."""
+    code = normalize_role(role)
+    return (code, ROLE_NAMES[code]) if code in ROLE_NAMES else (role,)
+
 class User(ABC):
     """Базовый класс пользователя."""
+    code = None
+
     def __init__(self, name, email):
         self.name = name
         self.email = email
@@ -12,16 +39,22 @@ class User(ABC):
         pass
 
 class Manager(User):
+    code = ROLE_MANAGER
+
     def role(self):
-        return "Менеджер"
+        return ROLE_NAMES[self.code]
 
 class Client(User):
+    code = ROLE_CLIENT
+
     def role(self):
-        return "Клиент"
+        return ROLE_NAMES[self.code]
 
 class Admin(User):
+    code = ROLE_ADMIN
+
     def role(self):
-        return "Администратор"
+        return ROLE_NAMES[self.code]
 
 class UserFactory(ABC):
     """Интерфейс Фабрики пользователей."""
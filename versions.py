@@ -0,0 +1,147 @@
+# versions.py: счётчики версий данных (таблица data_version) и условные GET — ETag / Last-Modified -> 304
+# Триггеры SQLite увеличивают version таблицы на каждый INSERT/UPDATE/DELETE, откуда бы ни пришла
+# запись: ORM, импорт, AuditSink, другой воркер. Маршрут чтения сначала сверяет валидатор клиента
+# с версиями (один SELECT по таблице из нескольких строк) и только при расхождении идёт в основные таблицы.
+# Асинхронные маршруты asgi.py проверяют то же самое через etag()/not_modified()/validator_headers().
+#   python versions.py   — текущие версии
+import hashlib
+import time
+from email.utils import formatdate
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from sqlalchemy import select
+from werkzeug.http import quote_etag
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+
+import identity
+from db import DbSessionManager, DataVersion, VERSIONED_TABLES
+
+# время записи в секундах unix — тем же числом, что time.time() в Python
+_NOW_SQL = "(julianday('now') - 2440587.5) * 86400.0"
+
+
+def install(conn):
+    """Таблица data_version, строки для VERSIONED_TABLES и триггеры; повторный вызов ничего не меняет."""
+    DataVersion.__table__.create(conn, checkfirst=True)
+    now = time.time()
+    for table in VERSIONED_TABLES:
+        conn.execute(sqlite_insert(DataVersion).values(name=table, version=0, changed_at=now)
+                     .on_conflict_do_nothing())
+        # FOR EACH ROW: у SQLite нет триггеров на инструкцию; обновление одной строки
+        # маленькой таблицы в той же транзакции — микросекунды даже при пакетной вставке
+        for op in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER IF NOT EXISTS trg_{table}_{op.lower()}_version AFTER {op} ON {table} "
+                f"BEGIN UPDATE data_version SET version = version + 1, changed_at = {_NOW_SQL} "
+                f"WHERE name = '{table}'; END"
+            )
+
+
+def current_versions(tables):
+    """{таблица: (version, changed_at)}; None, если БД ещё не обновлена миграцией 5."""
+    if not tables:
+        return {}
+    try:
+        with DbSessionManager() as db:
+            rows = db.execute(select(DataVersion.name, DataVersion.version, DataVersion.changed_at)
+                              .where(DataVersion.name.in_(tables))).all()
+    except OperationalError:
+        return None
+    return {name: (version, changed_at) for name, version, changed_at in rows}
+
+
+async def current_versions_async(tables):
+    """current_versions для корутин (asgi.py)."""
+    if not tables:
+        return {}
+    from db_async import AsyncDbSessionManager
+    try:
+        async with AsyncDbSessionManager() as db:
+            rows = (await db.execute(select(DataVersion.name, DataVersion.version, DataVersion.changed_at)
+                                     .where(DataVersion.name.in_(tables)))).all()
+    except OperationalError:
+        return None
+    return {name: (version, changed_at) for name, version, changed_at in rows}
+
+
+def etag(versions, user, path, args, salt=''):
+    """Сильный ETag: одинаковые маршрут, параметры, пользователь, выпуск и версии -> те же байты ответа."""
+    key = (salt, path, sorted(args), (user.id, user.name, user.role), sorted(versions.items()))
+    return hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+
+
+def make_etag(versions, user):
+    """etag() текущего запроса Flask."""
+    return etag(versions, user, request.path, request.args.items(multi=True),
+                current_app.config.get('ETAG_SALT', ''))
+
+
+def last_modified(versions):
+    return max((changed_at for _, changed_at in versions.values()), default=None)
+
+
+def validator_headers(etag, last_modified):
+    """[(заголовок, значение)] для ответов 200 и 304."""
+    headers = [('ETag', quote_etag(etag))]
+    # время последней записи — только если эта секунда уже прошла: запись в ту же секунду
+    # не изменила бы Last-Modified (правило Apache); ETag точен всегда
+    if last_modified is not None and int(last_modified) < int(time.time()):
+        headers.append(('Last-Modified', formatdate(int(last_modified), usegmt=True)))
+    # браузер хранит ответ, но каждый раз перепроверяет его запросом с If-None-Match
+    headers.append(('Cache-Control', 'private, no-cache'))
+    return headers
+
+
+def not_modified(etag, last_modified, if_none_match, if_modified_since):
+    """Валидатор клиента совпал -> 304; if_none_match — werkzeug ETags, if_modified_since — datetime."""
+    if if_none_match:
+        return if_none_match.contains(etag)
+    if if_modified_since and last_modified is not None:
+        return int(last_modified) <= if_modified_since.timestamp()
+    return False
+
+
+def _validators(response, etag, last_modified):
+    for name, value in validator_headers(etag, last_modified):
+        response.headers[name] = value
+    return response
+
+
+def conditional(*tables):
+    """Декоратор маршрута GET: ETag и Last-Modified по версиям tables, 304 — без вызова view.
+
+    tables — имена таблиц (из VERSIONED_TABLES) или одна функция (**view_args) -> имена.
+    Версии читаются до view: запись, попавшая между ними, даст лишний 200, но не устаревший 304.
+    В ключ входит пользователь (id, имя, роль), поэтому 304 возможен только для ETag, выданного
+    этому же пользователю с теми же правами; анонимные запросы и ответы с flash-сообщениями
+    идут в view как обычно.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return view(*args, **kwargs)
+            user = identity.by_id(session.get('user_id'))
+            if user is None or user.is_active is False:
+                return view(*args, **kwargs)    # вход и права проверит сам view
+            names = tables[0](**kwargs) if len(tables) == 1 and callable(tables[0]) else tables
+            versions = current_versions(names)
+            if versions is None:
+                return view(*args, **kwargs)
+            tag, modified = make_etag(versions, user), last_modified(versions)
+            if not_modified(tag, modified, request.if_none_match, request.if_modified_since):
+                return _validators(make_response('', 304), tag, modified)
+            response = make_response(view(*args, **kwargs))
+            # потоковому ответу (CSV-выгрузка) валидаторы тоже ставятся: ключ посчитан до view
+            if response.status_code == 200:
+                _validators(response, tag, modified)
+            return response
+        return wrapper
+    return decorator
+
+
+if __name__ == '__main__':
+    for name, (version, changed_at) in sorted((current_versions(VERSIONED_TABLES) or {}).items()):
+        print(f"{name:<8} версия {version:>8}  изменена {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(changed_at))}")